@@ -0,0 +1,181 @@
+"""Implements the command running the jobs of a file outside of the services, typically to backfill many stores"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from common.exception import ExceptionUtilities
+from common.json_loader import JsonLoader
+from common.main import Main
+from common.models import Job
+from common.rest import RestSessionPool
+from extractor.manager import ExtractorServiceManager
+from loader.batcher import TableBatcher
+from loader.services.file import FileDestination
+from loader.services.snowflake import SnowflakeDestination, SnowflakeRegistry
+
+FAILED_STATUS = "failed"
+SUCCEEDED_STATUS = "succeeded"
+
+_DESTINATION_TYPE_2_CLS = {
+    "file": FileDestination,
+    "snowflake": SnowflakeDestination
+}
+
+
+class _PageRecord:
+    """Represents an extracted page buffered by the batcher, keeping the first error of the rows it flushed"""
+
+    __slots__ = ("_job_summary", "size")
+
+    def __init__(self, job_summary, size):
+        self._job_summary = job_summary
+        self.size = size
+
+    def acknowledge(self):
+        """Reports that the rows of the page have been loaded"""
+
+    def fail(self, exception):
+        """Reports that the rows of the page could not be loaded"""
+        if self._job_summary["error"] is None:
+            self._job_summary["error"] = ExceptionUtilities.message(exception)
+
+
+def _parse_arguments():
+    """Parses the command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Runs the extraction and the loading of the jobs of a file across a pool of processes, without "
+                    "going through the REST or the Kafka services, and writes a summary line per job")
+    parser.add_argument("--jobs", required=True, help="the file holding one job definition per line (JSONL)")
+    parser.add_argument("--summary", help="the file the summary lines are written to, rather than the standard output")
+    parser.add_argument(
+        "--processes", type=int, default=os.cpu_count(),
+        help="the number of jobs run concurrently, one per process; defaults to the number of CPUs")
+    parser.add_argument(
+        "--output-directory",
+        help="the directory the rows are written to as JSON lines, rather than the destination of each job")
+    return parser.parse_args()
+
+
+def _initialize_worker_process():
+    """Opens the REST sessions and the destination engines of the worker process"""
+    RestSessionPool.initialize()
+    SnowflakeRegistry.initialize()
+
+
+def _read_jobs(jobs_path, output_directory=None):
+    """Reads the plain job definitions of the file, skipping the blank lines and redirecting their destination to the
+    output directory if given; returns them with the summaries of the definitions which could not be parsed"""
+    job_entries = []
+    job_summaries = []
+    with open(jobs_path, "rb") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                job = Job.loads(line)
+            except ValueError as ex:
+                Main.logger().error(
+                    "failed to parse the job at line %d of '%s', details: %s", line_number, jobs_path,
+                    ExceptionUtilities.message(ex))
+                job_summaries.append(_summarize(None, 0.0, error=f"line {line_number}: {ex}"))
+                continue
+            job_entry = job.to_dict()
+            if output_directory:
+                destination_entry = job_entry["destination"]
+                destination_entry.pop(destination_entry["type"].lower(), None)
+                destination_entry["file"] = {"directory": output_directory}
+                destination_entry["type"] = "file"
+            job_entries.append(job_entry)
+    return job_entries, job_summaries
+
+
+def _summarize(job_id, wall_time_in_seconds, error=None, pages=0, rows=0, size=0):
+    """Returns the summary line of a job"""
+    return {
+        "bytes": size,
+        "error": error,
+        "jobId": job_id,
+        "pages": pages,
+        "rows": rows,
+        "status": SUCCEEDED_STATUS if error is None else FAILED_STATUS,
+        "wallTimeInSeconds": round(wall_time_in_seconds, 3)
+    }
+
+
+def run_job(job_entry):
+    """Extracts the pages of the job and loads their rows into its destination, then returns its summary; the rows are
+    batched per job, and the job fails if any page fails to be extracted or loaded"""
+    start_time = time.monotonic()
+    job = Job.from_dict(job_entry)
+    job_summary = _summarize(job.jobId, 0.0)
+    table_batcher = TableBatcher()
+    try:
+        destination = _DESTINATION_TYPE_2_CLS[job.destination.type.lower()](job.jobId, job.destination)
+        for data in ExtractorServiceManager.iter_pages(job):
+            if not data:
+                continue
+            size = data.estimated_size()
+            columns, rows = destination.project(data)
+            job_summary["bytes"] += size
+            job_summary["pages"] += 1
+            job_summary["rows"] += len(rows)
+            table_batcher.add(destination, columns, rows, _PageRecord(job_summary, size))
+    except BaseException as ex:
+        Main.logger().error("failed to run the %s job, details: %s", job.jobId, ExceptionUtilities.message(ex))
+        job_summary["error"] = ExceptionUtilities.message(ex)
+    finally:
+        # the rows extracted before a failure are still loaded, as a job is only ever run again as a whole
+        table_batcher.flush_all()
+    return _summarize(
+        job.jobId, time.monotonic() - start_time, error=job_summary["error"], pages=job_summary["pages"],
+        rows=job_summary["rows"], size=job_summary["bytes"])
+
+
+def backfill(jobs_path, summary_file, processes, output_directory=None):
+    """Runs the jobs of the file across the pool of processes, writing the summary line of each job as soon as it is
+    over, and returns the number of jobs which failed"""
+    job_entries, job_summaries = _read_jobs(jobs_path, output_directory=output_directory)
+    Main.logger().info("running %d jobs of '%s' across %d processes", len(job_entries), jobs_path, processes)
+    failed_count = 0
+    for job_summary in job_summaries:
+        summary_file.write(JsonLoader.dumps(job_summary) + b"\n")
+        failed_count += 1
+    with ProcessPoolExecutor(max_workers=processes, initializer=_initialize_worker_process) as executor:
+        futures = [executor.submit(run_job, job_entry) for job_entry in job_entries]
+        for completed_count, future in enumerate(as_completed(futures), start=1):
+            job_summary = future.result()
+            summary_file.write(JsonLoader.dumps(job_summary) + b"\n")
+            summary_file.flush()
+            if job_summary["status"] == FAILED_STATUS:
+                failed_count += 1
+            Main.logger().info(
+                "the %s job has %s (%d rows in %.3f seconds), %d of %d jobs are over", job_summary["jobId"],
+                job_summary["status"], job_summary["rows"], job_summary["wallTimeInSeconds"], completed_count,
+                len(job_entries))
+    return failed_count
+
+
+def main():
+    """Runs the backfill command"""
+    arguments = _parse_arguments()
+    if arguments.processes < 1:
+        raise ValueError(f"the number of processes must be positive, yet {arguments.processes} was given")
+    if arguments.summary:
+        with open(arguments.summary, "wb") as summary_file:
+            failed_count = backfill(
+                arguments.jobs, summary_file, arguments.processes, output_directory=arguments.output_directory)
+    else:
+        failed_count = backfill(
+            arguments.jobs, sys.stdout.buffer, arguments.processes, output_directory=arguments.output_directory)
+    if failed_count:
+        Main.logger().error("%d jobs of '%s' have failed", failed_count, arguments.jobs)
+        return Main.FAILURE
+    return Main.SUCCESS
+
+
+if __name__ == "__main__":
+    Main.initialize("backfill")
+    Main.run_and_exit(main)
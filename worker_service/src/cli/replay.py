@@ -0,0 +1,102 @@
+"""Implements the command replaying the dead-lettered messages into their original topics"""
+
+import argparse
+import time
+
+from confluent_kafka import KafkaException
+
+from common.kafka import DeliveryReport, FailureRouter, KafkaTransport
+from common.main import Main
+
+_BUFFER_FULL_POLL_TIMEOUT_IN_SECONDS = 0.1
+_CONSUME_TIMEOUT_IN_SECONDS = 1.0
+
+
+def _parse_arguments():
+    """Parses the command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Replays the dead-lettered messages into their original topics, once their failure is fixed")
+    parser.add_argument("--bootstrap-server", required=True, help="the bootstrap server of the Kafka cluster")
+    parser.add_argument("--dead-letter-topic", required=True, help="the dead-letter topic to be replayed")
+    parser.add_argument(
+        "--group", default="pricer-replay",
+        help="the consumer group, whose committed offsets tell where a previous replay stopped")
+    parser.add_argument(
+        "--topic", help="the topic the messages are replayed into, rather than the one they originally failed in")
+    parser.add_argument(
+        "--batch-size", type=int, default=1000, help="the number of messages replayed between two commits")
+    parser.add_argument(
+        "--idle-timeout-in-seconds", type=float, default=10.0,
+        help="the time without any new dead-lettered message after which the replay stops")
+    return parser.parse_args()
+
+
+def replay(
+        bootstrap_server, dead_letter_topic, group, topic=None, batch_size=1000, idle_timeout_in_seconds=10.0):
+    """Produces the dead-lettered messages again, without their failure metadata, committing the dead-letter offsets
+    once each batch has been delivered, and returns the number of replayed messages"""
+    consumer = KafkaTransport.consumer({
+        "auto.offset.reset": "earliest",
+        "bootstrap.servers": bootstrap_server,
+        "enable.auto.commit": False,
+        "group.id": group
+    })
+    # the producer favors throughput, as the whole backlog is replayed at once
+    producer = KafkaTransport.producer({
+        "bootstrap.servers": bootstrap_server,
+        "compression.type": "lz4",
+        "linger.ms": 50
+    })
+    consumer.subscribe([dead_letter_topic])
+    replayed_count = 0
+    last_message_time = time.monotonic()
+    try:
+        while time.monotonic() - last_message_time < idle_timeout_in_seconds:
+            messages = consumer.consume(batch_size, _CONSUME_TIMEOUT_IN_SECONDS)
+            if not messages:
+                continue
+            last_message_time = time.monotonic()
+            delivery_report = DeliveryReport()
+            for message in messages:
+                if message.error() is not None:
+                    raise KafkaException(message.error())
+                target_topic = topic or FailureRouter.header(
+                    message.headers(), FailureRouter.ORIGINAL_TOPIC_HEADER)
+                if target_topic is None:
+                    raise ValueError(
+                        f"the message at offset {message.offset()} of the '{dead_letter_topic}' topic has no original "
+                        "topic")
+                while True:
+                    try:
+                        producer.produce(
+                            target_topic, message.value(), key=message.key(),
+                            headers=FailureRouter.strip_metadata(message.headers()),
+                            on_delivery=lambda error, _: delivery_report.on_delivery(error))
+                        break
+                    except BufferError:
+                        producer.poll(_BUFFER_FULL_POLL_TIMEOUT_IN_SECONDS)
+            producer.flush()
+            # the offsets are only committed once the whole batch has been delivered, so a failed replay is resumed
+            delivery_report.raise_for_failure()
+            consumer.commit(asynchronous=False)
+            replayed_count += len(messages)
+            Main.logger().info("replayed %d messages of the '%s' topic", replayed_count, dead_letter_topic)
+    finally:
+        consumer.close()
+    return replayed_count
+
+
+def main():
+    """Runs the replay command"""
+    arguments = _parse_arguments()
+    replayed_count = replay(
+        arguments.bootstrap_server, arguments.dead_letter_topic, arguments.group, topic=arguments.topic,
+        batch_size=arguments.batch_size, idle_timeout_in_seconds=arguments.idle_timeout_in_seconds)
+    Main.logger().info(
+        "replayed %d messages of the '%s' topic in total", replayed_count, arguments.dead_letter_topic)
+    return Main.SUCCESS
+
+
+if __name__ == "__main__":
+    Main.initialize("replay")
+    Main.run_and_exit(main)
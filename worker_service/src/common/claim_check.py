@@ -0,0 +1,71 @@
+"""Implements the claim check store of the oversized messages"""
+
+import hashlib
+import mmap
+import os
+import uuid
+from contextlib import contextmanager
+
+from common.file_system import resilient_makedirs, resilient_remove
+
+
+class ClaimCheckStore:
+    """Stores the bodies of the oversized messages as blobs in a directory shared by the producers and the consumers,
+    so that the messages only carry a reference to their blob"""
+
+    HEADER = "pricer-claim-check"
+    VERSION = b"v1"
+
+    def __init__(self, directory):
+        self._directory = directory
+        resilient_makedirs(directory)
+
+    @staticmethod
+    def is_claim_check(headers):
+        """Returns True if the message headers mark the message as a claim check"""
+        return any(key == ClaimCheckStore.HEADER for key, _ in headers or ())
+
+    @contextmanager
+    def open(self, reference):
+        """Yields the blob of the reference as a read-only buffer, memory-mapping it, once its checksum has been
+        verified; the buffer is only valid within the context"""
+        with open(self._path(reference), "rb") as file:
+            if reference.size == 0:
+                body = memoryview(b"")
+                mapped_file = None
+            else:
+                mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                body = memoryview(mapped_file)
+            try:
+                if len(body) != reference.size or hashlib.sha256(body).hexdigest() != reference.sha256:
+                    raise ValueError(f"the '{reference.blob}' blob does not match the checksum of its reference")
+                yield body
+            finally:
+                body.release()
+                if mapped_file is not None:
+                    mapped_file.close()
+
+    def _path(self, reference):
+        """Returns the path of the blob of the reference"""
+        if os.path.basename(reference.blob) != reference.blob:
+            raise ValueError(f"the '{reference.blob}' blob name is invalid")
+        return os.path.join(self._directory, reference.blob)
+
+    def put(self, body):
+        """Stores the body into a new blob, returning the plain representation of its reference"""
+        blob = f"{uuid.uuid4().hex}.blob"
+        path = os.path.join(self._directory, blob)
+        temporary_path = f"{path}.tmp"
+        try:
+            with open(temporary_path, "wb") as file:
+                file.write(body)
+            # the blob only becomes visible once it has been fully written
+            os.replace(temporary_path, path)
+        except BaseException:
+            resilient_remove(temporary_path)
+            raise
+        return {"blob": blob, "sha256": hashlib.sha256(body).hexdigest(), "size": len(body)}
+
+    def remove(self, reference):
+        """Removes the blob of the reference"""
+        resilient_remove(self._path(reference))
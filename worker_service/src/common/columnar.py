@@ -0,0 +1,42 @@
+"""Implements the columnar batch of rows"""
+
+
+class ColumnarBatch:
+    """Implements a batch of rows stored column by column, one value list per descriptor"""
+
+    __slots__ = ("_columns", "_descriptors")
+
+    def __init__(self, descriptors, columns=None):
+        # the descriptors are hashable, as they key the compiled schema projectors
+        self._descriptors = tuple(descriptors)
+        self._columns = columns if columns is not None else [[] for _ in descriptors]
+        if len(self._columns) != len(self._descriptors):
+            raise ValueError(
+                f"the batch has {len(self._columns)} columns, yet {len(self._descriptors)} descriptors were given")
+
+    def __len__(self):
+        return len(self._columns[0]) if self._columns else 0
+
+    def columns(self):
+        """Returns the columns, in the order of the descriptors"""
+        return self._columns
+
+    def estimated_size(self):
+        """Returns the approximate size of the values in bytes, counting the length of the strings and a machine word
+        for the other values"""
+        return sum(len(value) if isinstance(value, str) else 8 for column in self._columns for value in column)
+
+    def descriptors(self):
+        """Returns the column descriptors"""
+        return self._descriptors
+
+    def rows(self):
+        """Returns an iterator over the rows as tuples"""
+        return zip(*self._columns)
+
+    def to_dict(self):
+        """Returns the row-oriented representation of the batch"""
+        return {
+            "descriptors": self._descriptors,
+            "values": [list(row) for row in self.rows()]
+        }
@@ -0,0 +1,204 @@
+"""Implements the pool of workers handling the consumed messages"""
+
+import math
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+_worker_process_handler = None
+
+
+def _initialize_worker_process(worker_initializer, worker_configuration):
+    """Creates the handler of the worker process"""
+    global _worker_process_handler  # pylint: disable=global-statement
+    _worker_process_handler = worker_initializer(worker_configuration)
+
+
+def _start_worker_process():
+    """Does nothing, being submitted to a lane only for its worker process to be started"""
+
+
+class _WorkerProcessRecord:
+    """Represents a record handled in a worker process, whose acknowledgement is reported back to the consumer"""
+
+    __slots__ = ("acknowledged", "error", "value")
+
+    def __init__(self, value):
+        self.acknowledged = False
+        self.error = None
+        self.value = value
+
+    def acknowledge(self):
+        """Acknowledges the record"""
+        self.acknowledged = True
+
+    def fail(self, exception):
+        """Reports that the record could not be handled"""
+        self.error = f"{type(exception).__name__}: {exception}"
+
+
+def handle_in_worker_process(values):
+    """Hands the record values over to the handler created by the worker initializer of the worker process, returning
+    the indexes of the records it acknowledged and the errors of those it failed by index"""
+    records = [_WorkerProcessRecord(value) for value in values]
+    _worker_process_handler(records)
+    return (
+        [index for index, record in enumerate(records) if record.acknowledged],
+        {index: record.error for index, record in enumerate(records) if record.error is not None})
+
+
+class _ThreadLane:
+    """Runs the submitted tasks one at a time on a daemon thread, which, unlike the threads of a ThreadPoolExecutor,
+    does not keep the process alive once its task is abandoned"""
+
+    def __init__(self, name):
+        self._lock = threading.Lock()
+        self._shut_down = False
+        self._tasks = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            future, function, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = function(*args)
+            except BaseException as ex:  # pylint: disable=broad-except
+                future.set_exception(ex)
+            else:
+                future.set_result(result)
+
+    def join(self, timeout_in_seconds=None):
+        """Waits for the thread to be over, until the timeout at the latest, returning True if it is"""
+        self._thread.join(timeout_in_seconds)
+        return not self._thread.is_alive()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """Stops the thread once the queued tasks are over, cancelling them first if requested"""
+        with self._lock:
+            self._shut_down = True
+            if cancel_futures:
+                while True:
+                    try:
+                        task = self._tasks.get_nowait()
+                    except queue.Empty:
+                        break
+                    if task is not None:
+                        task[0].cancel()
+            self._tasks.put(None)
+        if wait:
+            self.join()
+
+    def submit(self, function, *args):
+        """Queues the task, returning its future"""
+        future = Future()
+        with self._lock:
+            if self._shut_down:
+                raise RuntimeError("cannot schedule new tasks after shutdown")
+            self._tasks.put((future, function, args))
+        return future
+
+
+class ConsumerPool:
+    """Runs the message handling on a pool of single-worker lanes, off the poll loop; the messages sharing a routing
+    key are always routed to the same lane, so they are handled in order, while the messages of other keys are handled
+    concurrently"""
+
+    KEY_ROUTING = "key"
+    PARTITION_ROUTING = "partition"
+    PROCESS_KIND = "process"
+    THREAD_KIND = "thread"
+
+    _MAXIMUM_IN_FLIGHT_TASKS_PER_LANE = 2
+
+    def __init__(
+            self, size, kind=THREAD_KIND, worker_initializer=None, worker_configuration=None,
+            maximum_queued_tasks=None):
+        if kind not in (ConsumerPool.PROCESS_KIND, ConsumerPool.THREAD_KIND):
+            raise ValueError(f"the '{kind}' consumer pool kind is not supported")
+        if kind == ConsumerPool.PROCESS_KIND and worker_initializer is None:
+            raise ValueError("the 'process' consumer pool kind requires a worker initializer")
+        self._in_flight_task_count = 0
+        self._kind = kind
+        self._lock = threading.Lock()
+        self._maximum_in_flight_tasks = (
+            maximum_queued_tasks if maximum_queued_tasks else size * ConsumerPool._MAXIMUM_IN_FLIGHT_TASKS_PER_LANE)
+        if kind == ConsumerPool.PROCESS_KIND:
+            # the workers are spawned rather than forked, as the threads of the Kafka clients do not survive a fork; the
+            # initializer is thus given as a module-level function, and its configuration as plain values
+            context = multiprocessing.get_context("spawn")
+            self._lanes = [
+                ProcessPoolExecutor(
+                    max_workers=1, mp_context=context, initializer=_initialize_worker_process,
+                    initargs=(worker_initializer, worker_configuration))
+                for _ in range(size)]
+            # the worker processes are started upfront, so that a failing initializer fails the startup
+            for lane in self._lanes:
+                lane.submit(_start_worker_process).result()
+        else:
+            self._lanes = [_ThreadLane(f"consumer-worker-{index}") for index in range(size)]
+
+    def _on_task_done(self, _):
+        """Frees up the capacity taken by the task"""
+        with self._lock:
+            self._in_flight_task_count -= 1
+
+    def is_full(self):
+        """Returns True if the queued and running tasks have reached the capacity of the pool"""
+        with self._lock:
+            return self._in_flight_task_count >= self._maximum_in_flight_tasks
+
+    def is_process_pool(self):
+        """Returns True if the lanes run in worker processes"""
+        return self._kind == ConsumerPool.PROCESS_KIND
+
+    def lane(self, routing_key):
+        """Returns the lane the messages of the routing key are handled by"""
+        return hash(routing_key) % len(self._lanes)
+
+    def is_idle(self):
+        """Returns True if no task is queued or running"""
+        with self._lock:
+            return self._in_flight_task_count == 0
+
+    def shutdown(self, wait=True, cancel_queued_tasks=False, timeout_in_seconds=None):
+        """Shuts the lanes down, cancelling the tasks which have not started yet if requested, and waits for the
+        running tasks until the timeout at the latest if requested; the tasks still running past the timeout are
+        abandoned, their worker processes, if any, being terminated, and False is returned"""
+        # the worker processes are no longer known to their lane once it is shut down
+        lane_processes = [
+            list(lane._processes.values()) if self.is_process_pool() else ()  # pylint: disable=protected-access
+            for lane in self._lanes]
+        for lane in self._lanes:
+            lane.shutdown(wait=False, cancel_futures=cancel_queued_tasks)
+        if not wait:
+            return True
+        deadline = time.monotonic() + timeout_in_seconds if timeout_in_seconds is not None else math.inf
+        is_over = True
+        for lane, processes in zip(self._lanes, lane_processes):
+            remaining_time = max(0.0, deadline - time.monotonic()) if deadline != math.inf else None
+            if not self.is_process_pool():
+                is_over = lane.join(remaining_time) and is_over
+                continue
+            for process in processes:
+                process.join(remaining_time)
+                if process.is_alive():
+                    process.terminate()
+                    is_over = False
+        return is_over
+
+    def submit(self, lane, function, *args):
+        """Submits the task to the lane without blocking, and returns its future; the caller stops submitting while the
+        pool is full; in a process pool, the function and its arguments must be picklable"""
+        future = self._lanes[lane].submit(function, *args)
+        with self._lock:
+            self._in_flight_task_count += 1
+        future.add_done_callback(self._on_task_done)
+        return future
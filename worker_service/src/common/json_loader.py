@@ -1,6 +1,12 @@
 """Implements utilities related to JSON"""
 
 import json
+from collections.abc import Sequence
+
+try:
+    import orjson
+except ImportError:  # the standard library backend is used when the faster one is not installed
+    orjson = None
 
 
 class RecursiveNamespace:
@@ -13,6 +19,13 @@ class RecursiveNamespace:
       return RecursiveNamespace(**entry)
     return entry
 
+  @staticmethod
+  def map_converted_entry(entry):
+    """Maps the entry, whose nested values have already been mapped by the JSON decoder, into recursive namespace"""
+    namespace = RecursiveNamespace.__new__(RecursiveNamespace)
+    namespace.__dict__.update(entry)
+    return namespace
+
   def __init__(self, **kwargs):
     for key, val in kwargs.items():
       if isinstance(val, dict):
@@ -33,16 +46,104 @@ class RecursiveNamespace:
   
   def to_dict(self):
     updated_dict = {}
-    print(vars(self))
     for key, val in vars(self).items():
       updated_dict[key] = RecursiveNamespace._to_dict(val)
     return updated_dict
 
 
+class LazyNamespace:
+    """Implements a read-only attribute view over a decoded JSON object, wrapping the nested values only when they are
+    accessed"""
+
+    __slots__ = ("_entry",)
+
+    def __init__(self, entry):
+        self._entry = entry
+
+    def __getattr__(self, name):
+        try:
+            value = self._entry[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        return LazyNamespace.wrap(value)
+
+    def __reduce__(self):
+        # the attributes are looked up in the entry, which does not exist yet while unpickling
+        return (LazyNamespace, (self._entry,))
+
+    def __repr__(self):
+        return f"LazyNamespace({self._entry!r})"
+
+    @staticmethod
+    def wrap(value):
+        """Wraps the decoded JSON value into a view if it is an object or an array"""
+        if isinstance(value, dict):
+            return LazyNamespace(value)
+        if isinstance(value, list):
+            return LazyList(value)
+        return value
+
+    def to_dict(self):
+        """Returns the underlying dict"""
+        return self._entry
+
+
+class LazyList(Sequence):
+    """Implements a read-only view over a decoded JSON array, wrapping the items only when they are accessed"""
+
+    __slots__ = ("_items",)
+
+    def __init__(self, items):
+        self._items = items
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyList(self._items[index])
+        return LazyNamespace.wrap(self._items[index])
+
+    def __iter__(self):
+        wrap = LazyNamespace.wrap
+        for item in self._items:
+            yield wrap(item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return f"LazyList({self._items!r})"
+
+    def to_list(self):
+        """Returns the underlying list"""
+        return self._items
+
+
 class JsonLoader:
     """Implements the loader to return the custom pytho object"""
 
+    @staticmethod
+    def dumps(value):
+        """Serializes the plain value into UTF-8 encoded JSON"""
+        if orjson is not None:
+            return orjson.dumps(value)
+        return json.dumps(value).encode("utf-8")
+
     @staticmethod
     def loads(json_string):
         """Loads the JSON string"""
-        return json.loads(json_string, object_hook=RecursiveNamespace.map_entry)
+        return json.loads(json_string, object_hook=RecursiveNamespace.map_converted_entry)
+
+    @staticmethod
+    def loads_lazy(json_string):
+        """Loads the JSON string (or UTF-8 encoded bytes) into a lazy attribute view"""
+        return LazyNamespace.wrap(JsonLoader.loads_raw(json_string))
+
+    @staticmethod
+    def loads_raw(json_string):
+        """Loads the JSON string (or UTF-8 encoded bytes, in any buffer such as a memory-mapped claim check blob) into
+        plain dicts and lists"""
+        if orjson is not None:
+            return orjson.loads(json_string)
+        # the standard library only decodes strings, bytes and byte arrays
+        if not isinstance(json_string, (bytearray, bytes, str)):
+            json_string = bytes(json_string)
+        return json.loads(json_string)
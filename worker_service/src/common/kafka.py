@@ -1,90 +1,804 @@
-from threading import Thread
+import functools
+import time
+from urllib.parse import parse_qs, urlsplit
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
 
-from confluent_kafka import Consumer, KafkaError, KafkaException, Producer
+from confluent_kafka import Consumer, KafkaError, KafkaException, Producer, TopicPartition
+from confluent_kafka.admin import AdminClient, NewTopic
 
+from common.consumer_pool import ConsumerPool, handle_in_worker_process
 from common.exception import ExceptionUtilities
 from common.json_loader import JsonLoader
 from common.main import Main
+from common.memory_broker import FaultInjection, MemoryAdminClient, MemoryBroker, MemoryConsumer, MemoryProducer
 from common.service_management import Service
 
 
+class KafkaTransport:
+    """Creates the Kafka clients from their configuration; a memory://<name> bootstrap server selects the in-process
+    broker of that name rather than a Kafka cluster, with the latencyInSeconds, errorRate and seed query parameters
+    injecting faults into it, e.g. memory://pipeline?latencyInSeconds=0.01&errorRate=0.05"""
+
+    MEMORY_SCHEME = "memory"
+
+    @staticmethod
+    def _memory_broker(configuration):
+        """Returns the in-memory broker of the configuration, or None if it targets a Kafka cluster"""
+        url = urlsplit(configuration["bootstrap.servers"])
+        if url.scheme != KafkaTransport.MEMORY_SCHEME:
+            return None
+        broker = MemoryBroker.named(url.netloc)
+        parameters = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if parameters:
+            broker.fault_injection = FaultInjection(
+                latency_in_seconds=float(parameters.get("latencyInSeconds", 0.0)),
+                error_rate=float(parameters.get("errorRate", 0.0)),
+                seed=int(parameters["seed"]) if "seed" in parameters else None)
+        return broker
+
+    @staticmethod
+    def admin_client(configuration):
+        """Returns an admin client"""
+        broker = KafkaTransport._memory_broker(configuration)
+        return MemoryAdminClient(broker) if broker is not None else AdminClient(configuration)
+
+    @staticmethod
+    def consumer(configuration):
+        """Returns a consumer"""
+        broker = KafkaTransport._memory_broker(configuration)
+        return MemoryConsumer(broker, configuration) if broker is not None else Consumer(configuration)
+
+    @staticmethod
+    def producer(configuration):
+        """Returns a producer"""
+        broker = KafkaTransport._memory_broker(configuration)
+        return MemoryProducer(broker, configuration) if broker is not None else Producer(configuration)
+
+
+class KafkaRecord:
+    """Represents a consumed message which has to be acknowledged once it has been fully processed, or failed if it
+    could not be"""
+
+    __slots__ = (
+        "_acknowledge", "_fail", "message", "offset", "partition", "release_handler", "size", "topic", "value")
+
+    def __init__(self, acknowledge, fail, message, value):
+        self._acknowledge = acknowledge
+        self._fail = fail
+        self.message = message
+        self.offset = message.offset()
+        self.partition = message.partition()
+        # releases the resources of the record, such as its claim check blob, once it is over for good
+        self.release_handler = None
+        self.size = len(message.value() or b"")
+        self.topic = message.topic()
+        self.value = value
+
+    def acknowledge(self):
+        """Acknowledges the message, allowing its offset to be committed"""
+        self._acknowledge(self)
+
+    def fail(self, exception):
+        """Reports that the message could not be handled, so that it is retried later on if retries are configured"""
+        self._fail(self, exception)
+
+    def release(self):
+        """Runs the release handler, if any, once the failed record is over for good, being either skipped or
+        dead-lettered rather than retried"""
+        if self.release_handler is not None:
+            self.release_handler()
+
+
+class _OffsetTracker:
+    """Tracks the consumed offsets of each partition, so that only the offsets up to the highest contiguous
+    acknowledged one are committed, whatever the order the records are acknowledged in"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._topic_partition_2_acknowledged_offsets = {}
+        self._topic_partition_2_committable_offset = {}
+        self._topic_partition_2_pending_offsets = {}
+
+    def acknowledge(self, topic, partition, offset):
+        """Marks the offset as acknowledged, advancing the committable offset of the partition if it is contiguous"""
+        topic_partition = (topic, partition)
+        with self._lock:
+            pending_offsets = self._topic_partition_2_pending_offsets.get(topic_partition)
+            if not pending_offsets:  # the partition has been revoked in the meantime
+                return
+            if offset < pending_offsets[0]:  # the record has already been acknowledged
+                return
+            acknowledged_offsets = self._topic_partition_2_acknowledged_offsets[topic_partition]
+            acknowledged_offsets.add(offset)
+            committable_offset = None
+            while pending_offsets and pending_offsets[0] in acknowledged_offsets:
+                committable_offset = pending_offsets.popleft()
+                acknowledged_offsets.discard(committable_offset)
+            if committable_offset is not None:
+                self._topic_partition_2_committable_offset[topic_partition] = committable_offset + 1
+
+    def pop_committable_offsets(self):
+        """Returns the offsets to be committed since the last call, as topic partitions"""
+        with self._lock:
+            topic_partition_2_committable_offset = self._topic_partition_2_committable_offset
+            self._topic_partition_2_committable_offset = {}
+        return [
+            TopicPartition(topic, partition, offset)
+            for (topic, partition), offset in topic_partition_2_committable_offset.items()]
+
+    def track(self, topic, partition, offset):
+        """Registers the consumed offset, which is pending until it is acknowledged"""
+        topic_partition = (topic, partition)
+        with self._lock:
+            if topic_partition not in self._topic_partition_2_pending_offsets:
+                self._topic_partition_2_acknowledged_offsets[topic_partition] = set()
+                self._topic_partition_2_pending_offsets[topic_partition] = deque()
+            self._topic_partition_2_pending_offsets[topic_partition].append(offset)
+
+    def forget(self, topic_partitions):
+        """Stops tracking the partitions, which have been revoked, so that the late acknowledgements of their records
+        are ignored"""
+        with self._lock:
+            for topic_partition in topic_partitions:
+                key = (topic_partition.topic, topic_partition.partition)
+                self._topic_partition_2_acknowledged_offsets.pop(key, None)
+                self._topic_partition_2_committable_offset.pop(key, None)
+                self._topic_partition_2_pending_offsets.pop(key, None)
+
+
+class FailureRouter:
+    """Routes the messages whose handling failed to the retry topics, each one delaying them longer than the previous
+    one, and eventually to the dead-letter topic, with the failure metadata in their headers; the failed records are
+    acknowledged once their messages have been delivered, so that the retries do not block their partitions"""
+
+    ATTEMPT_HEADER = "pricer-attempt"
+    DUE_TIME_HEADER = "pricer-due-time"
+    ERROR_HEADER = "pricer-error"
+    FAILURE_TIME_HEADER = "pricer-failure-time"
+    ORIGINAL_OFFSET_HEADER = "pricer-original-offset"
+    ORIGINAL_PARTITION_HEADER = "pricer-original-partition"
+    ORIGINAL_TOPIC_HEADER = "pricer-original-topic"
+
+    METADATA_HEADERS = (
+        ATTEMPT_HEADER, DUE_TIME_HEADER, ERROR_HEADER, FAILURE_TIME_HEADER, ORIGINAL_OFFSET_HEADER,
+        ORIGINAL_PARTITION_HEADER, ORIGINAL_TOPIC_HEADER)
+
+    _BUFFER_FULL_POLL_TIMEOUT_IN_SECONDS = 0.1
+    _MAXIMUM_ERROR_LENGTH = 1024
+
+    def __init__(self, configuration):
+        self._dead_letter_topic = configuration.deadLetterTopic
+        self._retry_delays_in_seconds = configuration.retryDelaysInSeconds
+        self._retry_topics = FailureRouter.retry_topics(configuration)
+        for topic in self._retry_topics + (self._dead_letter_topic,):
+            KafkaTopics.ensure(configuration, topic=topic)
+        self._producer = KafkaTransport.producer({"bootstrap.servers": ",".join(configuration.bootstrapServers)})
+
+    @staticmethod
+    def header(headers, key):
+        """Returns the decoded value of the header, or None if the message does not have it"""
+        for header_key, header_value in headers or ():
+            if header_key == key:
+                return header_value.decode("utf-8")
+        return None
+
+    @staticmethod
+    def retry_topics(configuration):
+        """Returns the retry topics of the source topic, in the order the messages go through them"""
+        return tuple(
+            f"{configuration.topic}-RETRY-{index}" for index in range(1, len(configuration.retryDelaysInSeconds) + 1))
+
+    @staticmethod
+    def strip_metadata(headers):
+        """Returns the headers of the message without the failure metadata"""
+        return [(key, value) for key, value in headers or () if key not in FailureRouter.METADATA_HEADERS]
+
+    def due_time(self, message):
+        """Returns the time a message of a retry topic is due to be handled at, or None for the other messages"""
+        if message.topic() not in self._retry_topics:
+            return None
+        due_time = FailureRouter.header(message.headers(), FailureRouter.DUE_TIME_HEADER)
+        return float(due_time) if due_time is not None else None
+
+    def flush(self):
+        """Waits for the routed messages to be delivered"""
+        self._producer.flush()
+
+    def poll(self):
+        """Serves the delivery callbacks of the routed messages"""
+        self._producer.poll(0)
+
+    def route(self, record, exception):
+        """Produces the message of the record to its next retry topic, or to the dead-letter topic once its retries
+        are exhausted"""
+        message = record.message
+        headers = message.headers()
+        attempt = int(FailureRouter.header(headers, FailureRouter.ATTEMPT_HEADER) or 0)
+        failure_time = time.time()
+        metadata = {
+            FailureRouter.ATTEMPT_HEADER: str(attempt + 1),
+            FailureRouter.ERROR_HEADER: ExceptionUtilities.message(exception)[:FailureRouter._MAXIMUM_ERROR_LENGTH],
+            FailureRouter.FAILURE_TIME_HEADER: str(failure_time),
+            # the original location is the one of the first failure
+            FailureRouter.ORIGINAL_OFFSET_HEADER: FailureRouter.header(
+                headers, FailureRouter.ORIGINAL_OFFSET_HEADER) or str(message.offset()),
+            FailureRouter.ORIGINAL_PARTITION_HEADER: FailureRouter.header(
+                headers, FailureRouter.ORIGINAL_PARTITION_HEADER) or str(message.partition()),
+            FailureRouter.ORIGINAL_TOPIC_HEADER: FailureRouter.header(
+                headers, FailureRouter.ORIGINAL_TOPIC_HEADER) or message.topic()
+        }
+        if attempt < len(self._retry_topics):
+            topic = self._retry_topics[attempt]
+            metadata[FailureRouter.DUE_TIME_HEADER] = str(failure_time + self._retry_delays_in_seconds[attempt])
+        else:
+            topic = self._dead_letter_topic
+        Main.logger().warning(
+            "routing the message of the '%s' topic at offset %d to the '%s' topic after %d attempts, details: %s",
+            message.topic(), message.offset(), topic, attempt + 1, ExceptionUtilities.message(exception))
+
+        def _on_delivery(error, _):
+            if error is not None:
+                # the record is not acknowledged, so it is consumed again once the consumer restarts
+                Main.logger().error(
+                    "failed to route the message of the '%s' topic at offset %d to the '%s' topic, details: %s",
+                    message.topic(), message.offset(), topic, ExceptionUtilities.message(error))
+                return
+            record.acknowledge()
+            if topic == self._dead_letter_topic:
+                record.release()
+
+        routed_headers = FailureRouter.strip_metadata(headers) + [
+            (key, value.encode("utf-8")) for key, value in metadata.items()]
+        while True:
+            try:
+                self._producer.produce(
+                    topic, message.value(), key=message.key(), headers=routed_headers, on_delivery=_on_delivery)
+                return
+            except BufferError:
+                self._producer.poll(FailureRouter._BUFFER_FULL_POLL_TIMEOUT_IN_SECONDS)
+
+
 class ConsumerThread(Thread):
     """KafkaConsumer Thread"""
 
-    def __init__(self, consumer, message_handler):
+    DEFAULT_BATCH_SIZE = 1
+    DEFAULT_BATCH_TIMEOUT_IN_SECONDS = 1.0
+    DEFAULT_COMMIT_INTERVAL_IN_SECONDS = 5.0
+    DEFAULT_DRAIN_TIMEOUT_IN_SECONDS = 20.0
+
+    _DRAIN_POLL_INTERVAL_IN_SECONDS = 0.1
+    _PAUSED_POLL_TIMEOUT_IN_SECONDS = 0.01
+
+    def __init__(
+            self, consumer, message_handler, deserializer=JsonLoader.loads, poll_handler=None, batch_handler=None,
+            batch_size=DEFAULT_BATCH_SIZE, batch_timeout_in_seconds=DEFAULT_BATCH_TIMEOUT_IN_SECONDS,
+            consumer_pool=None, routing=ConsumerPool.PARTITION_ROUTING,
+            commit_interval_in_seconds=DEFAULT_COMMIT_INTERVAL_IN_SECONDS, deserialize_headers=False,
+            failure_router=None, flush_handler=None, drain_timeout_in_seconds=DEFAULT_DRAIN_TIMEOUT_IN_SECONDS):
         super().__init__()
+        self._batch_handler = batch_handler
+        self._batch_size = batch_size
+        self._batch_timeout_in_seconds = batch_timeout_in_seconds
+        self._commit_interval_in_seconds = commit_interval_in_seconds
         self._consumer = consumer
+        self._consumer_pool = consumer_pool if consumer_pool is not None else ConsumerPool(1)
+        self._deserialize_headers = deserialize_headers
+        self._deserializer = deserializer
+        self._drain_timeout_in_seconds = drain_timeout_in_seconds
+        self._failure_router = failure_router
+        self._flush_handler = flush_handler
+        self._last_commit_time = time.monotonic()
         self._message_handler = message_handler
+        self._offset_tracker = _OffsetTracker()
+        self._paused = False
+        self._poll_handler = poll_handler
+        # the poll handler runs off the poll loop as well, one run at a time
+        self._poll_handler_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="poll-handler") if poll_handler else None
+        self._poll_handler_future = None
+        self._routing = routing
+        self._stopped = Event()
+        self._topic_partition_2_due_time = {}
+
+    def _acknowledge(self, record):
+        """Marks the offset of the record as acknowledged, from whichever thread handled it"""
+        self._offset_tracker.acknowledge(record.topic, record.partition, record.offset)
+
+    def _apply_backpressure(self):
+        """Pauses the assigned partitions while the consumer pool is full, and resumes them once it has capacity again;
+        the consumer keeps on polling meanwhile, so it stays in its group however long the handling takes"""
+        is_full = self._consumer_pool.is_full()
+        if is_full == self._paused:
+            return
+        # the delayed retry partitions stay paused until their messages are due
+        topic_partitions = [
+            topic_partition for topic_partition in self._consumer.assignment()
+            if (topic_partition.topic, topic_partition.partition) not in self._topic_partition_2_due_time]
+        if is_full:
+            Main.logger().debug("pausing %d partitions, as the consumer pool is full", len(topic_partitions))
+            self._consumer.pause(topic_partitions)
+        else:
+            Main.logger().debug("resuming %d partitions, as the consumer pool has capacity", len(topic_partitions))
+            self._consumer.resume(topic_partitions)
+        self._paused = is_full
+
+    def _commit_acknowledged_records(self, force=False, asynchronous=True):
+        """Commits the offsets up to the highest contiguous acknowledged record of each partition, at most once per
+        commit interval unless forced"""
+        if not force and time.monotonic() - self._last_commit_time < self._commit_interval_in_seconds:
+            return
+        self._last_commit_time = time.monotonic()
+        offsets = self._offset_tracker.pop_committable_offsets()
+        if not offsets:
+            return
+        try:
+            self._consumer.commit(offsets=offsets, asynchronous=asynchronous)
+        except KafkaException as ex:
+            # the offsets are committed again by the next commit, as the committed offsets only move forward
+            Main.logger().error("failed to commit the offsets, details: %s", ExceptionUtilities.message(ex))
+
+    def _delay(self, message, due_time):
+        """Pauses the retry partition of the message until the message is due, rewinding it to the message"""
+        topic_partition = TopicPartition(message.topic(), message.partition(), message.offset())
+        self._consumer.pause([topic_partition])
+        self._consumer.seek(topic_partition)
+        self._topic_partition_2_due_time[(message.topic(), message.partition())] = due_time
+
+    def _drain(self, deadline):
+        """Waits, until the deadline at the latest, for the handling of the dispatched records to be over, then flushes
+        the records the handlers buffered and the failed records being routed, and commits the acknowledged offsets
+        synchronously; the records which are still being handled afterwards are consumed again by the next owner of
+        their partitions"""
+        while not self._consumer_pool.is_idle():
+            if time.monotonic() >= deadline:
+                Main.logger().warning("the consumer pool was not drained within the drain timeout")
+                break
+            time.sleep(ConsumerThread._DRAIN_POLL_INTERVAL_IN_SECONDS)
+        if self._poll_handler_future is not None:
+            self._poll_handler_future.result()
+        if self._flush_handler:
+            try:
+                self._flush_handler()
+            except BaseException as ex:
+                Main.logger().error("failed to run the flush handler, details: %s", ExceptionUtilities.message(ex))
+        if self._failure_router:
+            self._failure_router.flush()
+        self._commit_acknowledged_records(force=True, asynchronous=False)
+
+    def _fail(self, record, exception):
+        """Routes the record whose handling failed to the retry or dead-letter topics, if any; otherwise the failure is
+        logged and the record acknowledged, as leaving it pending would hold back the commit of all of the following
+        offsets of its partition"""
+        if self._failure_router is None:
+            Main.logger().error(
+                "failed to handle the message of the '%s' topic at offset %d, skipping it, details: %s", record.topic,
+                record.offset, ExceptionUtilities.message(exception))
+            record.acknowledge()
+            record.release()
+            return
+        self._failure_router.route(record, exception)
+
+    def _on_assign(self, consumer, topic_partitions):
+        """Pauses the newly assigned partitions while the consumer pool is full; with the cooperative assignment, only
+        the partitions added to the assignment are given"""
+        if self._paused and topic_partitions:
+            consumer.pause(topic_partitions)
+
+    def _on_lost(self, _, topic_partitions):
+        """Forgets the lost partitions, whose offsets can no longer be committed"""
+        Main.logger().warning("lost %d partitions", len(topic_partitions))
+        self._forget(topic_partitions)
+
+    def _on_revoke(self, _, topic_partitions):
+        """Drains the handling of the records before the partitions are handed over, committing their final offsets,
+        so that the next owner of the partitions does not consume them again; with the cooperative assignment, only the
+        partitions moved to another consumer are revoked, while the others keep on being consumed"""
+        if not topic_partitions:
+            return
+        if self._stopped.is_set():
+            # the partitions are revoked on closing the consumer, once the handling has already been drained
+            self._forget(topic_partitions)
+            return
+        Main.logger().info("draining %d revoked partitions", len(topic_partitions))
+        self._drain(time.monotonic() + self._drain_timeout_in_seconds)
+        self._forget(topic_partitions)
+
+    def _forget(self, topic_partitions):
+        """Stops tracking the offsets and the due times of the partitions"""
+        self._offset_tracker.forget(topic_partitions)
+        for topic_partition in topic_partitions:
+            self._topic_partition_2_due_time.pop((topic_partition.topic, topic_partition.partition), None)
+
+    def _resume_due_partitions(self):
+        """Resumes the retry partitions whose first message is due"""
+        now = time.time()
+        due_topic_partitions = [
+            topic_partition for topic_partition, due_time in self._topic_partition_2_due_time.items()
+            if due_time <= now]
+        if not due_topic_partitions:
+            return
+        for topic_partition in due_topic_partitions:
+            del self._topic_partition_2_due_time[topic_partition]
+        if self._paused:
+            # they are resumed along with the other partitions once the consumer pool has capacity
+            return
+        self._consumer.resume([TopicPartition(topic, partition) for topic, partition in due_topic_partitions])
+
+    def _run_poll_handler(self):
+        """Runs the handler which is invoked after every poll, whether a message was received or not, unless its
+        previous run is still ongoing"""
+        if not self._poll_handler:
+            return
+        if self._poll_handler_future is not None and not self._poll_handler_future.done():
+            return
+        self._poll_handler_future = self._poll_handler_executor.submit(self._run_poll_handler_safely)
+
+    def _run_poll_handler_safely(self):
+        """Runs the poll handler, logging its errors"""
+        try:
+            self._poll_handler()
+        except BaseException as ex:
+            Main.logger().error("failed to run the poll handler, details: %s", ExceptionUtilities.message(ex))
     
-    def run(self):
-        while True:
-            message = self._consumer.poll(1.0)
-            if message is None:
+    def _deserialize(self, message):
+        """Deserializes the message, returning None if it cannot be deserialized"""
+        error = message.error()
+        if error is not None:
+            if not isinstance(error, KafkaError) or error.fatal():
+                raise KafkaException(error)
+            Main.logger().warning("failed to consume a message of the '%s' topic, details: %s", message.topic(), error)
+            return None
+        self._offset_tracker.track(message.topic(), message.partition(), message.offset())
+        if message.value() is None:
+            # a tombstone, or a message without payload, has nothing to be handled
+            Main.logger().warning(
+                "skipping the message without value of the '%s' topic at offset %d", message.topic(), message.offset())
+            self._to_record(message, None).acknowledge()
+            return None
+        try:
+            if self._deserialize_headers:
+                transformed_message = self._deserializer(message.value(), message.headers())
+            else:
+                transformed_message = self._deserializer(message.value())
+        except BaseException as ex:
+            Main.logger().error(
+                "failed to deserialize the message of the '%s' topic, details: %s", message.topic(),
+                ExceptionUtilities.message(ex))
+            record = self._to_record(message, None)
+            if self._failure_router is None:
+                # there is no point in consuming the message again
+                record.acknowledge()
+            else:
+                # the failure may be transient, e.g. a claim check blob which cannot be read yet
+                self._failure_router.route(record, ex)
+            return None
+        # the handler acknowledges the record once it has been fully processed
+        return self._to_record(message, transformed_message)
+
+    def _dispatch(self, topic, routed_records):
+        """Hands the (routing key, record) pairs over to the lanes of the consumer pool"""
+        lane_2_records = {}
+        for routing_key, record in routed_records:
+            lane_2_records.setdefault(self._consumer_pool.lane(routing_key), []).append(record)
+        for lane, records in lane_2_records.items():
+            if self._consumer_pool.is_process_pool():
+                self._submit_to_worker_process(lane, topic, records)
                 continue
-            if message.error() is not None:
-                if isinstance(message.error(), KafkaError):
-                    raise message.error()
-                raise KafkaException(message.error())
+            self._consumer_pool.submit(lane, self._handle, topic, records)
+
+    def _handle(self, topic, records):
+        """Hands the records over to the batch handler, or to the message handler one at a time; the batch handler
+        fails the records it could not handle itself"""
+        if self._batch_handler:
             try:
-                transformed_message = JsonLoader.loads(message.value().decode('utf-8'))                
+                self._batch_handler(records)
             except BaseException as ex:
                 Main.logger().error(
-                    "failed to deserialize the message from the '%s', details: %s", message.topic(),
+                    "failed to handle the batch of %d messages from the '%s', details: %s", len(records), topic,
                     ExceptionUtilities.message(ex))
-                continue
+                # which records the handler got through is unknown, so they are all failed
+                for record in records:
+                    record.fail(ex)
+            return
+        for record in records:
             try:
-                self._message_handler(transformed_message)
+                self._message_handler(record)
             except BaseException as ex:
-                Main.logger().error(
-                    "failed to handle the message from the '%s', details: %s", message.topic(),
-                    ExceptionUtilities.message(ex))
+                record.fail(ex)
+
+    def _consume(self):
+        """Consumes and dispatches the messages until the thread is stopped"""
+        while not self._stopped.is_set():
+            # while paused, the consumer polls briefly, so that it resumes as soon as the consumer pool has capacity
+            messages = self._consumer.consume(
+                self._batch_size,
+                ConsumerThread._PAUSED_POLL_TIMEOUT_IN_SECONDS if self._paused else self._batch_timeout_in_seconds)
+            self._run_poll_handler()
+            if self._failure_router:
+                self._failure_router.poll()
+                self._resume_due_partitions()
+            self._commit_acknowledged_records()
+            self._apply_backpressure()
+            if not messages:
                 continue
+            routed_records = []
+            delayed_topic_partitions = set()
+            for message in messages:
+                topic_partition = (message.topic(), message.partition())
+                if topic_partition in delayed_topic_partitions:
+                    # the message is consumed again, after the delayed one, once the partition is resumed
+                    continue
+                due_time = self._failure_router.due_time(message) if self._failure_router else None
+                if due_time is not None and due_time > time.time():
+                    delayed_topic_partitions.add(topic_partition)
+                    self._delay(message, due_time)
+                    continue
+                record = self._deserialize(message)
+                if record is not None:
+                    routed_records.append((self._routing_key(message), record))
+            if routed_records:
+                self._dispatch(messages[0].topic(), routed_records)
+
+    def run(self):
+        # the consumer is drained and closed however the consumption ends
+        try:
+            self._consume()
+        except BaseException as ex:
+            Main.logger().error("the consumer failed, details: %s", ExceptionUtilities.message(ex))
+            raise
+        finally:
+            self._shut_down()
+
+    def _shut_down(self):
+        """Stops the intake, drains the handling of the records within the drain timeout, commits the final offsets
+        and closes the consumer"""
+        deadline = time.monotonic() + self._drain_timeout_in_seconds
+        assignment = self._consumer.assignment()
+        if assignment:
+            self._consumer.pause(assignment)
+        self._drain(deadline)
+        if self._poll_handler_executor:
+            self._poll_handler_executor.shutdown()
+        # the records which are still queued, or still being handled past the deadline, are consumed again by the next
+        # owner of their partitions
+        if not self._consumer_pool.shutdown(
+                cancel_queued_tasks=True, timeout_in_seconds=max(0.0, deadline - time.monotonic())):
+            Main.logger().warning("abandoned the records still being handled past the drain timeout")
+        self._consumer.close()
+
+    def _routing_key(self, message):
+        """Returns the key routing the message to a lane of the consumer pool"""
+        if self._routing == ConsumerPool.KEY_ROUTING and message.key() is not None:
+            return message.key()
+        return (message.topic(), message.partition())
+
+    def stop(self):
+        """Signals the thread to stop consuming once its current poll is over"""
+        self._stopped.set()
+
+    def subscribe(self, topics):
+        """Subscribes the consumer to the topics, draining the revoked partitions on rebalance"""
+        self._consumer.subscribe(topics, on_assign=self._on_assign, on_revoke=self._on_revoke, on_lost=self._on_lost)
+
+    def _submit_to_worker_process(self, lane, topic, records):
+        """Submits the values of the records to the worker process of the lane; as the acknowledgements cannot cross
+        the process boundary, the worker process reports back the records its handler acknowledged or failed"""
+
+        def _on_handled(future):
+            if future.cancelled():  # on shutdown, the records are consumed again by the next owner of their partitions
+                return
+            exception = future.exception()
+            if exception is not None:
+                Main.logger().error(
+                    "failed to handle the batch of %d messages from the '%s' in a worker process, details: %s",
+                    len(records), topic, ExceptionUtilities.message(exception))
+                for record in records:
+                    record.fail(exception)
+                return
+            acknowledged_indexes, index_2_error = future.result()
+            for index in acknowledged_indexes:
+                records[index].acknowledge()
+            for index, error in index_2_error.items():
+                records[index].fail(RuntimeError(error))
+
+        self._consumer_pool.submit(
+            lane, handle_in_worker_process, [record.value for record in records]).add_done_callback(_on_handled)
+
+    def _to_record(self, message, value):
+        """Wraps the message and its deserialized value into a record"""
+        return KafkaRecord(self._acknowledge, self._fail, message, value)
+
+class KafkaTopics:
+    """Checks the topics the workers use at startup, creating them with the configured partition count if needed"""
+
+    # a superseded record, such as a job manifest followed by its tombstone, is kept for at least a day, so that the
+    # consumers lagging behind still find it
+    COMPACTED_TOPIC_CONFIGURATION = {"cleanup.policy": "compact", "min.compaction.lag.ms": str(24 * 60 * 60 * 1000)}
+
+    _TIMEOUT_IN_SECONDS = 30.0
+
+    @staticmethod
+    def ensure(configuration, topic_configuration=None, topic=None):
+        """Creates the topic, that of the configuration unless another one is given, if it does not exist and its
+        partition count is configured, warning if it exists with fewer partitions than configured, as the extra
+        replicas would then be idle"""
+        if configuration.partitions is None:
+            return
+        topic = topic or configuration.topic
+        admin_client = KafkaTransport.admin_client({"bootstrap.servers": ",".join(configuration.bootstrapServers)})
+        # the metadata of all of the topics is listed, as requesting a single one may create it with the defaults
+        topic_metadata = admin_client.list_topics(timeout=KafkaTopics._TIMEOUT_IN_SECONDS).topics.get(topic)
+        if topic_metadata is not None and topic_metadata.error is None:
+            if len(topic_metadata.partitions) < configuration.partitions:
+                Main.logger().warning(
+                    "the %s topic has %d partitions, fewer than the %d configured ones", topic,
+                    len(topic_metadata.partitions), configuration.partitions)
+            return
+        Main.logger().info("creating the %s topic with %d partitions", topic, configuration.partitions)
+        new_topic = NewTopic(
+            topic, num_partitions=configuration.partitions, replication_factor=configuration.replicationFactor,
+            config=topic_configuration or {})
+        for future in admin_client.create_topics([new_topic]).values():
+            try:
+                future.result()
+            except KafkaException as ex:
+                # another replica has created the topic in the meantime
+                if ex.args[0].code() != KafkaError.TOPIC_ALREADY_EXISTS:
+                    raise
+
 
 class KafkaSource(Service):
     """Implements the Kafka Source"""
 
-    def __init__(self, configuration, message_handler):
-        consumer = Consumer({
+    def __init__(self, configuration, message_handler=None, deserializer=JsonLoader.loads, poll_handler=None,
+                 batch_handler=None, worker_initializer=None, worker_configuration=None, deserialize_headers=False,
+                 flush_handler=None):
+        # the messages are handled off the poll loop, the bounded queue of the pool applying backpressure; its worker
+        # processes, if any, are started before any Kafka client
+        self._consumer_pool = ConsumerPool(
+            configuration.poolSize, kind=configuration.poolKind, worker_initializer=worker_initializer,
+            worker_configuration=worker_configuration, maximum_queued_tasks=configuration.queueSize)
+        KafkaTopics.ensure(configuration)
+        # the offsets are only committed once the handlers have acknowledged the records, so that a message whose
+        # handling failed, or was interrupted by a crash, is consumed again
+        consumer_configuration = {
             "auto.offset.reset": "earliest",
             "bootstrap.servers": ",".join(configuration.bootstrapServers),
-            "enable.auto.commit": True,
-            "group.id": configuration.group
-        })
-        consumer.subscribe([configuration.topic])
+            "enable.auto.commit": False,
+            "group.id": configuration.group,
+            "on_commit": KafkaSource._on_commit,
+            # only the partitions moved to another consumer are revoked on rebalance, the others keep on being consumed
+            "partition.assignment.strategy": "cooperative-sticky"
+        }
+        if configuration.instanceId:
+            # a static member rejoins its group with its previous assignment when it is restarted within the session
+            # timeout, so that the rolling deploys do not rebalance the group at all
+            consumer_configuration["group.instance.id"] = configuration.instanceId
+        consumer = KafkaTransport.consumer(consumer_configuration)
+        self._failure_router = None
+        topics = [configuration.topic]
+        if configuration.deadLetterTopic:
+            self._failure_router = FailureRouter(configuration)
+            # the retry topics are consumed along with the source topic, their partitions being paused until their
+            # messages are due
+            topics.extend(FailureRouter.retry_topics(configuration))
         self._consumer_thread = ConsumerThread(
-            consumer=consumer, message_handler=message_handler)
-    
+            consumer=consumer, message_handler=message_handler, deserializer=deserializer,
+            poll_handler=poll_handler, batch_handler=batch_handler, batch_size=configuration.batchSize,
+            batch_timeout_in_seconds=configuration.batchTimeoutInSeconds, consumer_pool=self._consumer_pool,
+            routing=configuration.routing, commit_interval_in_seconds=configuration.commitIntervalInSeconds,
+            deserialize_headers=deserialize_headers, failure_router=self._failure_router, flush_handler=flush_handler,
+            drain_timeout_in_seconds=configuration.drainTimeoutInSeconds)
+        self._consumer_thread.subscribe(topics)
+
+    @staticmethod
+    def _on_commit(error, topic_partitions):
+        """Reports the outcome of an asynchronous commit"""
+        if error is not None:
+            Main.logger().error("failed to commit the offsets, details: %s", ExceptionUtilities.message(error))
+            return
+        Main.logger().debug(
+            "committed the offsets %s", ", ".join(
+                f"{topic_partition.topic}[{topic_partition.partition}]@{topic_partition.offset}"
+                for topic_partition in topic_partitions))
+
     def start(self):
         """Starts the service"""
         self._consumer_thread.start()
 
     def stop(self):
+        """Stops the intake, drains the handling of the consumed records and commits their offsets before closing the
+        consumer"""
         if self._consumer_thread:
+            self._consumer_thread.stop()
             self._consumer_thread.join()
+        if self._failure_router:
+            self._failure_router.flush()
+
+class DeliveryReport:
+    """Collects the delivery outcomes of the messages produced on behalf of a job, as they are reported
+    asynchronously by the producer"""
+
+    __slots__ = ("_error", "_failed_count", "_lock")
+
+    def __init__(self):
+        self._error = None
+        self._failed_count = 0
+        self._lock = Lock()
+
+    def on_delivery(self, error):
+        """Records the delivery outcome of a message"""
+        if error is None:
+            return
+        with self._lock:
+            self._failed_count += 1
+            if self._error is None:
+                self._error = error
+
+    def raise_for_failure(self):
+        """Raises an error if any of the messages could not be delivered"""
+        with self._lock:
+            if self._error is not None:
+                raise RuntimeError(
+                    f"failed to deliver {self._failed_count} messages, details: "
+                    f"{ExceptionUtilities.message(self._error)}")
+
 
 class KafkaSink(Service):
-    """Implements the Kafka Sink"""
+    """Implements the Kafka Sink, which produces asynchronously; the messages are only waited for when the sink is
+    flushed"""
 
-    def __init__(self, configuration):
+    _BUFFER_FULL_POLL_TIMEOUT_IN_SECONDS = 0.1
+
+    def __init__(self, configuration, topic_configuration=None):
+        KafkaTopics.ensure(configuration, topic_configuration)
         self._topic = configuration.topic
-        self._producer = Producer({
-            "bootstrap.servers": ",".join(configuration.bootstrapServers)
+        self._producer = KafkaTransport.producer({
+            "batch.size": configuration.batchSizeInBytes,
+            "bootstrap.servers": ",".join(configuration.bootstrapServers),
+            "compression.type": configuration.compression,
+            "linger.ms": configuration.lingerInMilliseconds,
+            # bounds the in-flight buffer, producing blocks while it is full
+            "queue.buffering.max.messages": configuration.maximumBufferedMessages
         })
 
     @staticmethod
-    def _message_ack(error, message):
-        """Waits for the message send operations to be acknowledged"""
+    def _message_ack(error, message, delivery_report=None):
+        """Reports the delivery outcome of the message"""
+        if delivery_report is not None:
+            delivery_report.on_delivery(error)
         if error is not None:
             Main.logger().error(
-                "failed to product the %s message, details: %s", message, ExceptionUtilities.message(error))
+                "failed to produce a message of %d bytes to the %s topic, details: %s", len(message.value() or b""),
+                message.topic(), ExceptionUtilities.message(error))
             return
         Main.logger().debug(
-            "delivered the %s message to the %s topic", message.value(), message.topic())
-        
-    def send_message(self, message_batch):
-        """Sends messages to the kafka producer"""
+            "delivered a message of %d bytes to the %s topic", len(message.value() or b""), message.topic())
+
+    def flush(self):
+        """Waits for all of the produced messages to be delivered, or to fail"""
+        self._producer.flush()
+
+    def send_message(self, message_batch, delivery_report=None, headers=None, key=None):
+        """Sends messages, with the given headers and key if any, to the kafka producer without waiting for them to be
+        delivered, a None message being a tombstone; their outcome is recorded into the delivery report, if any, once
+        the sink is polled or flushed"""
+        callback = KafkaSink._message_ack
+        if delivery_report is not None:
+            callback = functools.partial(KafkaSink._message_ack, delivery_report=delivery_report)
         for message in message_batch:
+            Main.logger().debug("producing a message of %d bytes to the %s topic", len(message or b""), self._topic)
+            while True:
+                try:
+                    self._producer.produce(self._topic, message, key=key, headers=headers, callback=callback)
+                    break
+                except BufferError:
+                    # waits for the in-flight messages to be delivered, which frees up the buffer
+                    self._producer.poll(KafkaSink._BUFFER_FULL_POLL_TIMEOUT_IN_SECONDS)
             self._producer.poll(0)
-            Main.logger().debug("producing the %s message to the %s topic", message, self._topic)
-            self._producer.produce(self._topic, message, callback=self._message_ack)
-        self._producer.flush()
+
+    def stop(self):
+        """Delivers the buffered messages"""
+        self.flush()
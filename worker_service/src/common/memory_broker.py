@@ -0,0 +1,687 @@
+"""Implements an in-process broker standing in for a Kafka cluster"""
+
+import math
+import random
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
+
+from confluent_kafka import OFFSET_BEGINNING, OFFSET_END, KafkaError, KafkaException, TopicPartition
+
+
+class FaultInjection:
+    """Describes the faults injected by the in-memory broker: every delivery and synchronous commit is delayed by the
+    latency, and fails with the error rate probability"""
+
+    def __init__(self, latency_in_seconds=0.0, error_rate=0.0, seed=None):
+        if latency_in_seconds < 0:
+            raise ValueError(f"the {latency_in_seconds} latency must not be negative")
+        if not 0 <= error_rate <= 1:
+            raise ValueError(f"the {error_rate} error rate must be between 0 and 1")
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self.error_rate = error_rate
+        self.latency_in_seconds = latency_in_seconds
+
+    def error(self, operation):
+        """Returns the injected error of the operation, or None if it succeeds"""
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+        if not failed:
+            return None
+        return KafkaError(KafkaError._TRANSPORT, f"injected {operation} failure")
+
+
+class MemoryMessage:
+    """Represents a message of the in-memory broker, with the accessors of a Kafka message"""
+
+    __slots__ = ("_error", "_headers", "_key", "_offset", "_partition", "_timestamp", "_topic", "_value")
+
+    def __init__(self, topic, partition, offset, key, value, headers, error=None):
+        self._error = error
+        self._headers = headers
+        self._key = key
+        self._offset = offset
+        self._partition = partition
+        self._timestamp = int(time.time() * 1000)
+        self._topic = topic
+        self._value = value
+
+    def __len__(self):
+        return len(self._value) if self._value is not None else 0
+
+    def error(self):
+        """Returns the error of the message, if any"""
+        return self._error
+
+    def headers(self):
+        """Returns the (key, value) header pairs, or None if the message has none"""
+        return list(self._headers) if self._headers else None
+
+    def key(self):
+        """Returns the key"""
+        return self._key
+
+    def offset(self):
+        """Returns the offset"""
+        return self._offset
+
+    def partition(self):
+        """Returns the partition"""
+        return self._partition
+
+    def timestamp(self):
+        """Returns the (type, milliseconds) creation timestamp"""
+        return 1, self._timestamp
+
+    def topic(self):
+        """Returns the topic"""
+        return self._topic
+
+    def value(self):
+        """Returns the value"""
+        return self._value
+
+
+class _Group:
+    """Holds the members, the partition owners and the committed offsets of a consumer group"""
+
+    def __init__(self):
+        self.committed_offsets = {}
+        self.instance_id_2_departure = {}
+        self.members = []
+        self.owners = {}
+        self.targets = {}
+
+
+class _Member:
+    """Holds the state of a consumer within its group; the partitions are keyed by (topic, partition) pairs"""
+
+    def __init__(self, group_id, instance_id, topics):
+        self.assigned_partitions = set()
+        self.fetch_counter = 0
+        self.group_id = group_id
+        self.instance_id = instance_id
+        self.paused_partitions = set()
+        self.pending_assignment = set()
+        self.pending_revocation = set()
+        self.positions = {}
+        self.topics = topics
+
+    def has_pending_rebalance(self):
+        """Returns True if partitions are waiting to be assigned to or revoked from the member"""
+        return bool(self.pending_assignment or self.pending_revocation)
+
+
+class MemoryBroker:
+    """Keeps the topics, the partitions and the consumer group offsets in memory, so that the workers can be run and
+    tested without a Kafka cluster; the clients are created by KafkaTransport for the memory:// bootstrap servers,
+    whose host names the broker"""
+
+    DEFAULT_PARTITIONS = 1
+
+    _MAXIMUM_WAIT_IN_SECONDS = 1.0
+
+    _lock = threading.Lock()
+    _name_2_broker = {}
+
+    def __init__(self, default_partitions=DEFAULT_PARTITIONS, fault_injection=None):
+        self._condition = threading.Condition()
+        self._default_partitions = default_partitions
+        self._group_id_2_group = {}
+        self._round_robin_counter = 0
+        self._topic_2_partitions = {}
+        self.fault_injection = fault_injection
+
+    @staticmethod
+    def named(name):
+        """Returns the broker of the name, creating it on first use"""
+        with MemoryBroker._lock:
+            broker = MemoryBroker._name_2_broker.get(name)
+            if broker is None:
+                broker = MemoryBroker._name_2_broker[name] = MemoryBroker()
+            return broker
+
+    @staticmethod
+    def remove(name):
+        """Forgets the broker of the name, so that its next use starts from an empty broker"""
+        with MemoryBroker._lock:
+            MemoryBroker._name_2_broker.pop(name, None)
+
+    def _expire_departed_members(self, group):
+        """Releases the partitions of the static members which did not rejoin within their session timeout"""
+        now = time.monotonic()
+        expired_members = [
+            member for member, expiration_time in group.instance_id_2_departure.values() if expiration_time <= now]
+        if not expired_members:
+            return
+        for member in expired_members:
+            del group.instance_id_2_departure[member.instance_id]
+        for topic_partition, owner in list(group.owners.items()):
+            if owner in expired_members:
+                del group.owners[topic_partition]
+        self._rebalance(group)
+
+    def _fetch(self, member, maximum_count):
+        """Returns the next messages of the assigned and unpaused partitions of the member, advancing its positions"""
+        messages = []
+        topic_partitions = sorted(member.assigned_partitions - member.paused_partitions)
+        # the partitions are fetched from in turn, so that none of them starves the others
+        if topic_partitions:
+            start = member.fetch_counter % len(topic_partitions)
+            member.fetch_counter += 1
+            topic_partitions = topic_partitions[start:] + topic_partitions[:start]
+        for topic, partition in topic_partitions:
+            position = member.positions[(topic, partition)]
+            fetched = self._topic_2_partitions[topic][partition][position:position + maximum_count - len(messages)]
+            member.positions[(topic, partition)] = position + len(fetched)
+            messages.extend(fetched)
+            if len(messages) >= maximum_count:
+                break
+        return messages
+
+    def _group(self, group_id):
+        """Returns the consumer group, creating it on first use"""
+        group = self._group_id_2_group.get(group_id)
+        if group is None:
+            group = self._group_id_2_group[group_id] = _Group()
+        return group
+
+    def _rebalance(self, group):
+        """Spreads the partitions of the subscribed topics over the members, keeping as many partitions as possible
+        with their current owner; as with the cooperative assignment, a moved partition is revoked from its owner
+        before being assigned to its new one"""
+        departed_members = [member for member, _ in group.instance_id_2_departure.values()]
+        topic_partitions = [
+            (topic, partition) for topic in sorted({topic for member in group.members for topic in member.topics})
+            if topic in self._topic_2_partitions for partition in range(len(self._topic_2_partitions[topic]))
+            if group.owners.get((topic, partition)) not in departed_members]
+        targets = {member: set() for member in group.members}
+        quota = math.ceil(len(topic_partitions) / len(group.members)) if group.members else 0
+        moved_topic_partitions = []
+        for topic_partition in topic_partitions:
+            owner = group.owners.get(topic_partition)
+            if owner in targets and topic_partition[0] in owner.topics and len(targets[owner]) < quota:
+                targets[owner].add(topic_partition)
+            else:
+                moved_topic_partitions.append(topic_partition)
+        for topic_partition in moved_topic_partitions:
+            candidates = [member for member in group.members if topic_partition[0] in member.topics]
+            if candidates:
+                targets[min(candidates, key=lambda member: len(targets[member]))].add(topic_partition)
+        group.targets = targets
+        for member, member_targets in targets.items():
+            member.pending_revocation |= member.assigned_partitions - member_targets
+            for topic_partition in member_targets - member.assigned_partitions:
+                if group.owners.get(topic_partition) is None:
+                    group.owners[topic_partition] = member
+                    member.pending_assignment.add(topic_partition)
+        self._condition.notify_all()
+
+    def _topic_partitions(self, topic, partition_count=None):
+        """Returns the partitions of the topic, creating it with the default partition count on first use"""
+        partitions = self._topic_2_partitions.get(topic)
+        if partitions is None:
+            partitions = self._topic_2_partitions[topic] = [
+                [] for _ in range(partition_count or self._default_partitions)]
+            for group in self._group_id_2_group.values():
+                if any(topic in member.topics for member in group.members):
+                    self._rebalance(group)
+        return partitions
+
+    def append(self, topic, partition, key, value, headers):
+        """Appends the message to the partition, chosen by key if it is not given, and returns it"""
+        with self._condition:
+            partitions = self._topic_partitions(topic)
+            if partition is None or partition < 0:
+                if key is not None:
+                    partition = zlib.crc32(key) % len(partitions)
+                else:
+                    partition = self._round_robin_counter % len(partitions)
+                    self._round_robin_counter += 1
+            elif partition >= len(partitions):
+                raise KafkaException(KafkaError(KafkaError._UNKNOWN_PARTITION, f"{topic}[{partition}]"))
+            message = MemoryMessage(topic, partition, len(partitions[partition]), key, value, headers)
+            partitions[partition].append(message)
+            self._condition.notify_all()
+            return message
+
+    def assign(self, member, offsets, reset_to_earliest):
+        """Adds the partitions, given as topic partitions, to the assignment of the member outside of any rebalance,
+        starting from their given offsets, or from their committed offsets, or their earliest or latest offsets, if none
+        is given"""
+        with self._condition:
+            committed_offsets = self._group(member.group_id).committed_offsets
+            for topic_partition in offsets:
+                key = (topic_partition.topic, topic_partition.partition)
+                partition = self._topic_partitions(topic_partition.topic)[topic_partition.partition]
+                offset = topic_partition.offset
+                if offset == OFFSET_BEGINNING:
+                    offset = 0
+                elif offset == OFFSET_END:
+                    offset = len(partition)
+                elif offset < 0:
+                    offset = committed_offsets.get(key)
+                    if offset is None:
+                        offset = 0 if reset_to_earliest else len(partition)
+                member.assigned_partitions.add(key)
+                member.positions[key] = offset
+            self._condition.notify_all()
+
+    def assignment(self, member):
+        """Returns the partitions assigned to the member"""
+        with self._condition:
+            return sorted(member.assigned_partitions)
+
+    def commit(self, group_id, offsets):
+        """Commits the offsets, given as topic partitions, of the group"""
+        with self._condition:
+            committed_offsets = self._group(group_id).committed_offsets
+            for topic_partition in offsets:
+                committed_offsets[(topic_partition.topic, topic_partition.partition)] = topic_partition.offset
+
+    def create_topic(self, topic, partition_count):
+        """Creates the topic, raising an error if it already exists"""
+        with self._condition:
+            if topic in self._topic_2_partitions:
+                raise KafkaException(KafkaError(KafkaError.TOPIC_ALREADY_EXISTS, f"the {topic} topic already exists"))
+            self._topic_partitions(topic, partition_count)
+
+    def fetch(self, member, maximum_count, timeout_in_seconds):
+        """Returns up to the maximum count of messages for the member, waiting for them until the timeout at the
+        latest; no message is returned while a rebalance of the member is pending"""
+        deadline = time.monotonic() + timeout_in_seconds
+        with self._condition:
+            while True:
+                self._expire_departed_members(self._group(member.group_id))
+                if member.has_pending_rebalance():
+                    return []
+                messages = self._fetch(member, maximum_count)
+                remaining_time = deadline - time.monotonic()
+                if messages or remaining_time <= 0:
+                    return messages
+                self._condition.wait(min(remaining_time, MemoryBroker._MAXIMUM_WAIT_IN_SECONDS))
+
+    def join(self, member):
+        """Adds the member to its group, taking over the assignment of its departed static member, if any, rather than
+        rebalancing the group"""
+        with self._condition:
+            group = self._group(member.group_id)
+            departure = group.instance_id_2_departure.pop(member.instance_id, None) if member.instance_id else None
+            group.members.append(member)
+            if departure is None:
+                self._rebalance(group)
+                return
+            departed_member = departure[0]
+            group.targets[member] = group.targets.pop(departed_member, set())
+            for topic_partition, owner in group.owners.items():
+                if owner is departed_member:
+                    group.owners[topic_partition] = member
+                    member.pending_assignment.add(topic_partition)
+
+    def leave(self, member, session_timeout_in_seconds):
+        """Removes the member from its group; the partitions of a static member stay assigned to it until its session
+        times out"""
+        with self._condition:
+            group = self._group(member.group_id)
+            group.members.remove(member)
+            member.assigned_partitions = set()
+            if member.instance_id:
+                group.instance_id_2_departure[member.instance_id] = (
+                    member, time.monotonic() + session_timeout_in_seconds)
+                return
+            group.targets.pop(member, None)
+            for topic_partition, owner in list(group.owners.items()):
+                if owner is member:
+                    del group.owners[topic_partition]
+            self._rebalance(group)
+
+    def messages(self, topic):
+        """Returns all of the messages of the topic, partition after partition"""
+        with self._condition:
+            return [message for partition in self._topic_2_partitions.get(topic, ()) for message in partition]
+
+    def pause(self, member, topic_partitions):
+        """Stops fetching the partitions for the member"""
+        with self._condition:
+            member.paused_partitions.update(topic_partitions)
+
+    def positions(self, member):
+        """Returns the next offset to be fetched of each partition assigned to the member"""
+        with self._condition:
+            return dict(member.positions)
+
+    def release(self, member, topic_partitions):
+        """Releases the partitions revoked from the member, handing them over to their new owners"""
+        with self._condition:
+            group = self._group(member.group_id)
+            for topic_partition in topic_partitions:
+                member.assigned_partitions.discard(topic_partition)
+                member.paused_partitions.discard(topic_partition)
+                member.positions.pop(topic_partition, None)
+                if group.owners.get(topic_partition) is not member:
+                    continue
+                del group.owners[topic_partition]
+                for new_owner, targets in group.targets.items():
+                    if topic_partition in targets and new_owner in group.members:
+                        group.owners[topic_partition] = new_owner
+                        new_owner.pending_assignment.add(topic_partition)
+                        break
+            self._condition.notify_all()
+
+    def resume(self, member, topic_partitions):
+        """Fetches the partitions for the member again"""
+        with self._condition:
+            member.paused_partitions.difference_update(topic_partitions)
+            self._condition.notify_all()
+
+    def seek(self, member, topic_partition, offset):
+        """Moves the position of the partition of the member to the offset"""
+        with self._condition:
+            member.positions[topic_partition] = offset
+
+    def take_assignment(self, member, reset_to_earliest):
+        """Assigns the pending partitions to the member, starting from their committed offsets, or from their earliest
+        or latest offset if none was committed, and returns them"""
+        with self._condition:
+            topic_partitions = member.pending_assignment
+            member.pending_assignment = set()
+            committed_offsets = self._group(member.group_id).committed_offsets
+            for topic, partition in topic_partitions:
+                offset = committed_offsets.get((topic, partition))
+                if offset is None:
+                    offset = 0 if reset_to_earliest else len(self._topic_2_partitions[topic][partition])
+                member.positions[(topic, partition)] = offset
+            member.assigned_partitions |= topic_partitions
+            return topic_partitions
+
+    def take_revocation(self, member):
+        """Returns the partitions pending revocation from the member, which are to be released once revoked"""
+        with self._condition:
+            topic_partitions = member.pending_revocation & member.assigned_partitions
+            member.pending_revocation = set()
+            return topic_partitions
+
+    def topic_partition_counts(self):
+        """Returns the partition count of each topic"""
+        with self._condition:
+            return {topic: len(partitions) for topic, partitions in self._topic_2_partitions.items()}
+
+
+class _TopicMetadata:
+    """Describes a topic of the in-memory broker, as listed by the admin client"""
+
+    __slots__ = ("error", "partitions", "topic")
+
+    def __init__(self, topic, partition_count):
+        self.error = None
+        self.partitions = {partition: None for partition in range(partition_count)}
+        self.topic = topic
+
+
+class _ClusterMetadata:
+    """Describes the topics of the in-memory broker, as listed by the admin client"""
+
+    __slots__ = ("topics",)
+
+    def __init__(self, topics):
+        self.topics = topics
+
+
+class MemoryAdminClient:
+    """Implements the subset of the Kafka admin client used by the workers"""
+
+    def __init__(self, broker):
+        self._broker = broker
+
+    def create_topics(self, new_topics, **_):
+        """Creates the topics, returning the future of each one by topic"""
+        topic_2_future = {}
+        for new_topic in new_topics:
+            future = topic_2_future[new_topic.topic] = Future()
+            try:
+                self._broker.create_topic(new_topic.topic, new_topic.num_partitions)
+                future.set_result(None)
+            except KafkaException as ex:
+                future.set_exception(ex)
+        return topic_2_future
+
+    def list_topics(self, topic=None, **_):
+        """Returns the metadata of the topics"""
+        return _ClusterMetadata({
+            name: _TopicMetadata(name, partition_count)
+            for name, partition_count in self._broker.topic_partition_counts().items()
+            if topic is None or name == topic})
+
+
+class MemoryConsumer:
+    """Implements the subset of the Kafka consumer used by the workers, as a member of a consumer group of the
+    in-memory broker, or on the partitions assigned to it; the rebalance and commit callbacks are served by the consume
+    and poll calls"""
+
+    _DEFAULT_SESSION_TIMEOUT_IN_MILLISECONDS = 45000
+
+    def __init__(self, broker, configuration):
+        self._broker = broker
+        self._commit_outcomes = deque()
+        self._group_id = configuration["group.id"]
+        self._instance_id = configuration.get("group.instance.id")
+        self._manually_assigned = False
+        self._member = None
+        self._on_assign = None
+        self._on_commit = configuration.get("on_commit")
+        self._on_revoke = None
+        self._reset_to_earliest = configuration.get("auto.offset.reset") in ("beginning", "earliest", "smallest")
+        self._session_timeout_in_seconds = configuration.get(
+            "session.timeout.ms", MemoryConsumer._DEFAULT_SESSION_TIMEOUT_IN_MILLISECONDS) / 1000
+
+    @staticmethod
+    def _to_keys(topic_partitions):
+        """Returns the (topic, partition) keys of the topic partitions"""
+        return [(topic_partition.topic, topic_partition.partition) for topic_partition in topic_partitions]
+
+    @staticmethod
+    def _to_topic_partitions(keys):
+        """Returns the (topic, partition) keys as topic partitions"""
+        return [TopicPartition(topic, partition) for topic, partition in sorted(keys)]
+
+    def _commit(self, offsets):
+        """Commits the offsets, returning the injected error, if any"""
+        fault_injection = self._broker.fault_injection
+        if fault_injection is not None:
+            time.sleep(fault_injection.latency_in_seconds)
+            error = fault_injection.error("commit")
+            if error is not None:
+                return error
+        self._broker.commit(self._group_id, offsets)
+        return None
+
+    def _serve_callbacks(self):
+        """Serves the commit callbacks and the pending rebalance, revoking the partitions before assigning the new
+        ones"""
+        while self._commit_outcomes:
+            error, offsets = self._commit_outcomes.popleft()
+            if self._on_commit:
+                self._on_commit(error, offsets)
+        if self._member is None:
+            return
+        revoked_partitions = self._broker.take_revocation(self._member)
+        if revoked_partitions:
+            if self._on_revoke:
+                self._on_revoke(self, MemoryConsumer._to_topic_partitions(revoked_partitions))
+            self._broker.release(self._member, revoked_partitions)
+        assigned_partitions = self._broker.take_assignment(self._member, self._reset_to_earliest)
+        if assigned_partitions and self._on_assign:
+            self._on_assign(self, MemoryConsumer._to_topic_partitions(assigned_partitions))
+
+    def assign(self, partitions):
+        """Consumes the partitions, given as topic partitions with their starting offsets, without joining the consumer
+        group"""
+        self._member = _Member(self._group_id, None, ())
+        self._manually_assigned = True
+        self._broker.assign(self._member, partitions, self._reset_to_earliest)
+
+    def assignment(self):
+        """Returns the assigned partitions"""
+        if self._member is None:
+            return []
+        return MemoryConsumer._to_topic_partitions(self._broker.assignment(self._member))
+
+    def close(self):
+        """Revokes the assigned partitions and leaves the group"""
+        if self._member is None:
+            return
+        if self._manually_assigned:
+            self._member = None
+            return
+        self._serve_callbacks()
+        assigned_partitions = self._broker.assignment(self._member)
+        if assigned_partitions and self._on_revoke:
+            self._on_revoke(self, MemoryConsumer._to_topic_partitions(assigned_partitions))
+        self._broker.leave(self._member, self._session_timeout_in_seconds)
+        self._member = None
+
+    def commit(self, message=None, offsets=None, asynchronous=True):
+        """Commits the offsets, that following the message, or the current positions if none are given"""
+        if message is not None:
+            offsets = [TopicPartition(message.topic(), message.partition(), message.offset() + 1)]
+        elif offsets is None:
+            offsets = [
+                TopicPartition(topic, partition, position)
+                for (topic, partition), position in sorted(self._broker.positions(self._member).items())]
+        if asynchronous:
+            self._commit_outcomes.append((self._commit(offsets), offsets))
+            return None
+        error = self._commit(offsets)
+        if error is not None:
+            raise KafkaException(error)
+        return offsets
+
+    def consume(self, num_messages=1, timeout=-1):
+        """Returns up to the given number of messages, waiting for them until the timeout at the latest"""
+        deadline = time.monotonic() + timeout if timeout >= 0 else math.inf
+        while True:
+            self._serve_callbacks()
+            remaining_time = max(0.0, deadline - time.monotonic())
+            if self._member is None:
+                time.sleep(min(remaining_time, MemoryBroker._MAXIMUM_WAIT_IN_SECONDS))
+                return []
+            messages = self._broker.fetch(self._member, num_messages, remaining_time)
+            if messages or time.monotonic() >= deadline:
+                return messages
+
+    def incremental_assign(self, partitions):
+        """Adds the partitions, given as topic partitions with their starting offsets, to the assignment"""
+        if self._member is None:
+            self.assign(partitions)
+            return
+        self._broker.assign(self._member, partitions, self._reset_to_earliest)
+
+    def list_topics(self, topic=None, **_):
+        """Returns the metadata of the topics"""
+        return MemoryAdminClient(self._broker).list_topics(topic)
+
+    def pause(self, partitions):
+        """Stops fetching the partitions"""
+        self._broker.pause(self._member, MemoryConsumer._to_keys(partitions))
+
+    def poll(self, timeout=-1):
+        """Returns the next message, or None if none is received before the timeout"""
+        messages = self.consume(1, timeout)
+        return messages[0] if messages else None
+
+    def resume(self, partitions):
+        """Fetches the partitions again"""
+        self._broker.resume(self._member, MemoryConsumer._to_keys(partitions))
+
+    def seek(self, partition):
+        """Moves the position of the partition to its offset"""
+        self._broker.seek(self._member, (partition.topic, partition.partition), partition.offset)
+
+    def subscribe(self, topics, on_assign=None, on_revoke=None, on_lost=None):  # pylint: disable=unused-argument
+        """Joins the consumer group, subscribed to the topics; the partitions are never lost, as the members of the
+        in-memory broker cannot be fenced"""
+        self._on_assign = on_assign
+        self._on_revoke = on_revoke
+        self._member = _Member(self._group_id, self._instance_id, tuple(topics))
+        self._broker.join(self._member)
+
+
+class MemoryProducer:
+    """Implements the subset of the Kafka producer used by the workers; the messages are delivered once their injected
+    latency, if any, has elapsed, and their delivery callbacks are served by the poll and flush calls"""
+
+    _DEFAULT_MAXIMUM_BUFFERED_MESSAGES = 100000
+
+    def __init__(self, broker, configuration):
+        self._broker = broker
+        self._condition = threading.Condition()
+        self._maximum_buffered_messages = configuration.get(
+            "queue.buffering.max.messages", MemoryProducer._DEFAULT_MAXIMUM_BUFFERED_MESSAGES)
+        self._pending_messages = deque()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending_messages)
+
+    def _deliver(self, topic, partition, key, value, headers, callback):
+        """Appends the message to the broker, unless an error is injected, and reports the outcome"""
+        fault_injection = self._broker.fault_injection
+        error = fault_injection.error("delivery") if fault_injection is not None else None
+        if error is None:
+            try:
+                message = self._broker.append(topic, partition, key, value, headers)
+            except KafkaException as ex:
+                error = ex.args[0]
+        if error is not None:
+            message = MemoryMessage(topic, partition if partition is not None else -1, -1, key, value, headers, error)
+        if callback is not None:
+            callback(error, message)
+
+    def flush(self, timeout=-1):
+        """Delivers the buffered messages, waiting for them until the timeout at the latest, and returns the number of
+        messages which are still buffered"""
+        deadline = time.monotonic() + timeout if timeout >= 0 else math.inf
+        while len(self) and time.monotonic() < deadline:
+            self.poll(min(deadline - time.monotonic(), MemoryBroker._MAXIMUM_WAIT_IN_SECONDS))
+        return len(self)
+
+    def poll(self, timeout=-1):
+        """Delivers the messages whose latency has elapsed, waiting for one until the timeout at the latest, and
+        returns the number of served delivery callbacks"""
+        deadline = time.monotonic() + timeout if timeout >= 0 else math.inf
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due_messages = []
+                while self._pending_messages and self._pending_messages[0][0] <= now:
+                    due_messages.append(self._pending_messages.popleft()[1:])
+                if due_messages or not self._pending_messages or now >= deadline:
+                    break
+                self._condition.wait(min(self._pending_messages[0][0], deadline) - now)
+        for due_message in due_messages:
+            self._deliver(*due_message)
+        return len(due_messages)
+
+    def produce(self, topic, value=None, key=None, partition=None, on_delivery=None, callback=None, headers=None):
+        """Buffers the message, raising BufferError if the buffer is full"""
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        if isinstance(headers, dict):
+            headers = list(headers.items())
+        headers = [
+            (header_key, header_value.encode("utf-8") if isinstance(header_value, str) else header_value)
+            for header_key, header_value in headers or ()]
+        fault_injection = self._broker.fault_injection
+        latency_in_seconds = fault_injection.latency_in_seconds if fault_injection is not None else 0.0
+        with self._condition:
+            if len(self._pending_messages) >= self._maximum_buffered_messages:
+                raise BufferError("the producer buffer is full")
+            self._pending_messages.append(
+                (time.monotonic() + latency_in_seconds, topic, partition, key, value, headers,
+                 on_delivery or callback))
+            self._condition.notify_all()
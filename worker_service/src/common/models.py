@@ -0,0 +1,404 @@
+"""Implements the typed models of the worker messages and configuration"""
+
+from common.claim_check import ClaimCheckStore
+from common.columnar import ColumnarBatch
+from common.consumer_pool import ConsumerPool
+from common.json_loader import JsonLoader, LazyNamespace
+from common.wire_format import WireFormat
+
+
+class _Field:
+    """Describes a model field"""
+
+    __slots__ = ("default", "name", "parser", "required")
+
+    def __init__(self, name, parser, required=True, default=None):
+        self.default = default
+        self.name = name
+        self.parser = parser
+        self.required = required
+
+
+def _slots(fields):
+    """Returns the slots of the model having the given fields"""
+    return tuple(field.name for field in fields)
+
+
+def _parse_integer(value):
+    """Parses an integer value"""
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"an integer is expected, yet a value of the '{type(value).__name__}' type was given")
+    return value
+
+
+def _parse_number(value):
+    """Parses a numeric value"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"a number is expected, yet a value of the '{type(value).__name__}' type was given")
+    return value
+
+
+def _parse_string(value):
+    """Parses a string value"""
+    if not isinstance(value, str):
+        raise ValueError(f"a string is expected, yet a value of the '{type(value).__name__}' type was given")
+    return value
+
+
+def _parse_list_of(parser):
+    """Returns a parser of a list whose items are parsed by the given parser into a tuple"""
+    def _parse_list(value):
+        if not isinstance(value, list):
+            raise ValueError(f"a list is expected, yet a value of the '{type(value).__name__}' type was given")
+        return tuple(parser(item) for item in value)
+    return _parse_list
+
+
+def _serialize(value):
+    """Serializes the field value into its plain representation"""
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [_serialize(item) for item in value]
+    return value
+
+
+class Model:
+    """Implements a compact model that is validated once, when it is created from its plain representation"""
+
+    __slots__ = ()
+
+    _FIELDS = ()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, field.name) == getattr(other, field.name) for field in self._FIELDS)
+
+    def __repr__(self):
+        field_values = ", ".join(f"{field.name}={getattr(self, field.name)!r}" for field in self._FIELDS)
+        return f"{type(self).__name__}({field_values})"
+
+    @classmethod
+    def from_dict(cls, entry):
+        """Creates and validates the model from its plain representation"""
+        if not isinstance(entry, dict):
+            raise ValueError(f"the {cls.__name__} must be an object, yet a value of the '{type(entry).__name__}' type "
+                             "was given")
+        instance = cls.__new__(cls)
+        for field in cls._FIELDS:
+            value = entry.get(field.name)
+            if value is None:
+                if field.required:
+                    raise ValueError(f"the '{field.name}' field of the {cls.__name__} is missing")
+                value = field.default
+            else:
+                try:
+                    value = field.parser(value)
+                except ValueError as exception:
+                    raise ValueError(
+                        f"the '{field.name}' field of the {cls.__name__} is invalid, details: {exception}"
+                    ) from exception
+            setattr(instance, field.name, value)
+        instance._validate()
+        return instance
+
+    @classmethod
+    def loads(cls, json_string):
+        """Loads and validates the model from the JSON string (or UTF-8 encoded bytes)"""
+        return cls.from_dict(JsonLoader.loads_raw(json_string))
+
+    def to_dict(self):
+        """Returns the plain representation of the model"""
+        entry = {}
+        for field in self._FIELDS:
+            value = getattr(self, field.name)
+            if value is not None:
+                entry[field.name] = _serialize(value)
+        return entry
+
+    def _validate(self):
+        """Validates the relations between the fields"""
+
+
+class SchemaMapping(Model):
+    """Maps an input column to an output column"""
+
+    _FIELDS = (
+        _Field("input", _parse_string),
+        _Field("output", _parse_string)
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+
+class IdRange(Model):
+    """Represents the (sinceId, untilId] range of the IDs to be extracted"""
+
+    _FIELDS = (
+        _Field("sinceId", _parse_integer, required=False, default=0),
+        _Field("untilId", _parse_integer, required=False)
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+    def _validate(self):
+        if self.untilId is not None and self.untilId <= self.sinceId:
+            raise ValueError(f"the {self.untilId} until ID must be greater than the {self.sinceId} since ID")
+
+
+class ShopifySourceConfiguration(Model):
+    """Represents the Shopify source configuration"""
+
+    CURSOR_PAGINATION = "cursor"
+    MAXIMUM_PAGE_SIZE = 250
+    PAGE_PAGINATION = "page"
+
+    _FIELDS = (
+        _Field("concurrency", _parse_integer, required=False, default=1),
+        _Field("idRanges", _parse_list_of(IdRange.from_dict), required=False, default=()),
+        _Field("pageSize", _parse_integer, required=False, default=MAXIMUM_PAGE_SIZE),
+        _Field("pagination", lambda value: _parse_string(value).lower(), required=False, default=PAGE_PAGINATION),
+        _Field("urls", _parse_list_of(_parse_string))
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+    def _validate(self):
+        if not self.urls:
+            raise ValueError("at least one URL is required")
+        if self.concurrency < 1:
+            raise ValueError(f"the {self.concurrency} concurrency must be positive")
+        if not 1 <= self.pageSize <= ShopifySourceConfiguration.MAXIMUM_PAGE_SIZE:
+            raise ValueError(
+                f"the {self.pageSize} page size must be between 1 and {ShopifySourceConfiguration.MAXIMUM_PAGE_SIZE}")
+        if self.pagination not in (
+                ShopifySourceConfiguration.CURSOR_PAGINATION, ShopifySourceConfiguration.PAGE_PAGINATION):
+            raise ValueError(f"the '{self.pagination}' pagination is not supported")
+
+
+class Source(Model):
+    """Represents the source of a job"""
+
+    _TYPE_2_CONFIGURATION_FIELD = {
+        "shopify": "shopify"
+    }
+
+    _FIELDS = (
+        _Field("schemaMapping", _parse_list_of(SchemaMapping.from_dict)),
+        _Field("shopify", ShopifySourceConfiguration.from_dict, required=False),
+        _Field("type", _parse_string)
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+    def _validate(self):
+        configuration_field = Source._TYPE_2_CONFIGURATION_FIELD.get(self.type.lower())
+        if configuration_field is None:
+            raise ValueError(f"the '{self.type}' source type is not supported")
+        if getattr(self, configuration_field) is None:
+            raise ValueError(f"the '{configuration_field}' configuration of the '{self.type}' source is missing")
+
+
+class SnowflakeDestinationConfiguration(Model):
+    """Represents the Snowflake destination configuration"""
+
+    _FIELDS = (
+        _Field("account", _parse_string),
+        _Field("password", _parse_string),
+        _Field("role", _parse_string, required=False),
+        _Field("user", _parse_string),
+        _Field("warehouse", _parse_string, required=False)
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+
+class FileDestinationConfiguration(Model):
+    """Represents the file destination configuration"""
+
+    _FIELDS = (
+        _Field("directory", _parse_string),
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+
+class Destination(Model):
+    """Represents the destination of a job"""
+
+    _TYPE_2_CONFIGURATION_FIELD = {
+        "file": "file",
+        "snowflake": "snowflake"
+    }
+
+    _FIELDS = (
+        _Field("file", FileDestinationConfiguration.from_dict, required=False),
+        _Field("fullyQualifiedTableName", _parse_string),
+        _Field("schemaMapping", _parse_list_of(SchemaMapping.from_dict)),
+        _Field("snowflake", SnowflakeDestinationConfiguration.from_dict, required=False),
+        _Field("type", _parse_string)
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+    def _validate(self):
+        configuration_field = Destination._TYPE_2_CONFIGURATION_FIELD.get(self.type.lower())
+        if configuration_field is None:
+            raise ValueError(f"the '{self.type}' destination type is not supported")
+        if getattr(self, configuration_field) is None:
+            raise ValueError(f"the '{configuration_field}' configuration of the '{self.type}' destination is missing")
+
+
+class Job(Model):
+    """Represents a job message"""
+
+    _FIELDS = (
+        _Field("destination", Destination.from_dict),
+        _Field("jobId", _parse_string),
+        _Field("source", Source.from_dict)
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+
+class JobManifest(Model):
+    """Represents the manifest of a job, published once per job rather than with every extraction output message"""
+
+    _FIELDS = (
+        _Field("destination", Destination.from_dict),
+        _Field("jobId", _parse_string)
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+
+class ClaimCheckReference(Model):
+    """Represents the reference to the blob holding the body of an oversized message"""
+
+    _FIELDS = (
+        _Field("blob", _parse_string),
+        _Field("sha256", _parse_string),
+        _Field("size", _parse_integer)
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+
+def _parse_destination(value):
+    """Parses the destination, keeping it as is if it is already parsed, as when the pages of a job share its
+    destination"""
+    if isinstance(value, Destination):
+        return value
+    return Destination.from_dict(value)
+
+
+def _parse_data(value):
+    """Parses the extraction output data, either a decoded columnar batch or a JSON object wrapped into a lazy view"""
+    if isinstance(value, ColumnarBatch):
+        return value
+    if not isinstance(value, dict):
+        raise ValueError(f"an object is expected, yet a value of the '{type(value).__name__}' type was given")
+    return LazyNamespace.wrap(value)
+
+
+class ExtractionOutput(Model):
+    """Represents an extraction output message, whose JSON data is only wrapped into a lazy view; its destination is
+    missing when it is published by the job manifest"""
+
+    _FIELDS = (
+        _Field("claimCheck", ClaimCheckReference.from_dict, required=False),
+        _Field("data", _parse_data),
+        _Field("destination", _parse_destination, required=False),
+        _Field("jobId", _parse_string)
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+    @classmethod
+    def decode(cls, payload, headers=None, claim_check_store=None):
+        """Loads and validates the extraction output from a message in any of the wire formats, fetching its body
+        from the claim check store if the message only carries a reference to it"""
+        if not ClaimCheckStore.is_claim_check(headers):
+            return cls.from_dict(WireFormat.decode(payload, headers))
+        if claim_check_store is None:
+            raise ValueError("the message is a claim check, yet no claim check store is configured")
+        reference = ClaimCheckReference.loads(payload)
+        with claim_check_store.open(reference) as body:
+            entry = WireFormat.decode(body, headers)
+        entry["claimCheck"] = reference.to_dict()
+        return cls.from_dict(entry)
+
+
+class KafkaConfiguration(Model):
+    """Represents the Kafka source or sink configuration"""
+
+    JOB_ID_KEY_FIELD = "jobId"
+    TABLE_KEY_FIELD = "table"
+
+    _COMPRESSIONS = ("gzip", "lz4", "none", "snappy", "zstd")
+
+    _FIELDS = (
+        _Field("batchSize", _parse_integer, required=False, default=1),
+        _Field("batchSizeInBytes", _parse_integer, required=False, default=1024 * 1024),
+        _Field("batchTimeoutInSeconds", _parse_number, required=False, default=1.0),
+        _Field("bootstrapServers", _parse_list_of(_parse_string)),
+        _Field("commitIntervalInSeconds", _parse_number, required=False, default=5.0),
+        _Field("compression", lambda value: _parse_string(value).lower(), required=False, default="lz4"),
+        _Field("deadLetterTopic", _parse_string, required=False),
+        _Field("drainTimeoutInSeconds", _parse_number, required=False, default=20.0),
+        _Field("group", _parse_string, required=False),
+        _Field("instanceId", _parse_string, required=False),
+        _Field("keyField", _parse_string, required=False, default=JOB_ID_KEY_FIELD),
+        _Field("lingerInMilliseconds", _parse_integer, required=False, default=20),
+        _Field("maximumBufferedMessages", _parse_integer, required=False, default=10000),
+        _Field("partitions", _parse_integer, required=False),
+        _Field(
+            "poolKind", lambda value: _parse_string(value).lower(), required=False, default=ConsumerPool.THREAD_KIND),
+        _Field("poolSize", _parse_integer, required=False, default=1),
+        _Field("queueSize", _parse_integer, required=False),
+        _Field("replicationFactor", _parse_integer, required=False, default=1),
+        _Field("retryDelaysInSeconds", _parse_list_of(_parse_number), required=False, default=()),
+        _Field("routing", lambda value: _parse_string(value).lower(), required=False,
+               default=ConsumerPool.PARTITION_ROUTING),
+        _Field("topic", _parse_string),
+        _Field("wireFormat", lambda value: _parse_string(value).lower(), required=False, default=WireFormat.COLUMNAR)
+    )
+
+    __slots__ = _slots(_FIELDS)
+
+    def _validate(self):
+        if self.batchSize < 1:
+            raise ValueError(f"the {self.batchSize} batch size must be positive")
+        if self.batchTimeoutInSeconds <= 0:
+            raise ValueError(f"the {self.batchTimeoutInSeconds} batch timeout must be positive")
+        if self.batchSizeInBytes < 1:
+            raise ValueError(f"the {self.batchSizeInBytes} batch size in bytes must be positive")
+        if self.commitIntervalInSeconds < 0:
+            raise ValueError(f"the {self.commitIntervalInSeconds} commit interval must not be negative")
+        if self.compression not in KafkaConfiguration._COMPRESSIONS:
+            raise ValueError(f"the '{self.compression}' compression is not supported")
+        if self.drainTimeoutInSeconds < 0:
+            raise ValueError(f"the {self.drainTimeoutInSeconds} drain timeout must not be negative")
+        if self.keyField not in (KafkaConfiguration.JOB_ID_KEY_FIELD, KafkaConfiguration.TABLE_KEY_FIELD):
+            raise ValueError(f"the '{self.keyField}' key field is not supported")
+        if self.lingerInMilliseconds < 0:
+            raise ValueError(f"the {self.lingerInMilliseconds} linger must not be negative")
+        if self.maximumBufferedMessages < 1:
+            raise ValueError(f"the {self.maximumBufferedMessages} maximum buffered messages must be positive")
+        if self.partitions is not None and self.partitions < 1:
+            raise ValueError(f"the {self.partitions} partition count must be positive")
+        if self.poolKind not in (ConsumerPool.PROCESS_KIND, ConsumerPool.THREAD_KIND):
+            raise ValueError(f"the '{self.poolKind}' pool kind is not supported")
+        if self.poolSize < 1:
+            raise ValueError(f"the {self.poolSize} pool size must be positive")
+        if self.queueSize is not None and self.queueSize < 1:
+            raise ValueError(f"the {self.queueSize} queue size must be positive")
+        if self.replicationFactor < 1:
+            raise ValueError(f"the {self.replicationFactor} replication factor must be positive")
+        if self.retryDelaysInSeconds and not self.deadLetterTopic:
+            raise ValueError("the retries require a dead-letter topic")
+        if any(delay < 0 for delay in self.retryDelaysInSeconds):
+            raise ValueError("the retry delays must not be negative")
+        if self.routing not in (ConsumerPool.KEY_ROUTING, ConsumerPool.PARTITION_ROUTING):
+            raise ValueError(f"the '{self.routing}' routing is not supported")
+        WireFormat.validate(self.wireFormat)
@@ -1,16 +1,197 @@
 """Implements a rest client interface"""
 
+import os
+import socket
+import threading
+import time
 from http import HTTPStatus
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from common.json_loader import RecursiveNamespace
+from common.json_loader import JsonLoader
+
+
+class _DnsCache:
+    """Caches the address each host name resolves to for a limited amount of time"""
+
+    def __init__(self, ttl_in_seconds):
+        self._host_2_entry = {}
+        self._lock = threading.Lock()
+        self._ttl_in_seconds = ttl_in_seconds
+
+    def evict(self, host, port):
+        """Forgets the address of the host, so that the next connection resolves it again"""
+        with self._lock:
+            self._host_2_entry.pop((host, port), None)
+
+    def resolve(self, host, port):
+        """Returns the address of the host, reusing the previous resolution while it has not expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._host_2_entry.get((host, port))
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        address = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][4][0]
+        with self._lock:
+            # the expired entries are replaced rather than accumulated, as a session only ever talks to its own host
+            self._host_2_entry[(host, port)] = (now + self._ttl_in_seconds, address)
+        return address
+
+
+class _DnsCachingConnectionMixin:
+    """Opens the connections to the cached address of their host rather than resolving it for every connection"""
+
+    dns_cache = None
+
+    def _new_conn(self):
+        dns_host = self._dns_host
+        # only the socket is opened to the address, the host name is still the one sent and verified over TLS
+        self._dns_host = self.dns_cache.resolve(dns_host, self.port)
+        try:
+            return super()._new_conn()
+        except Exception:
+            # the host may have moved, so the next connection resolves it again
+            self.dns_cache.evict(dns_host, self.port)
+            raise
+        finally:
+            self._dns_host = dns_host
+
+
+class _DnsCachingAdapter(HTTPAdapter):
+    """Implements a transport adapter whose connections resolve their host through the DNS cache of the session,
+    leaving the resolver of the rest of the process untouched"""
+
+    def __init__(self, dns_cache, **kwargs):
+        # the base constructor already initializes the pool manager
+        self._dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(pool_class.__name__, (pool_class,), {
+                "ConnectionCls": type(
+                    pool_class.ConnectionCls.__name__, (_DnsCachingConnectionMixin, pool_class.ConnectionCls),
+                    {"dns_cache": self._dns_cache})})
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()}
+
+
+class _RestSessionPoolImpl:
+    """Stores the internal data members accessible via the 'RestSessionPool' class"""
+
+    def __init__(self, pool_size, connect_timeout_in_seconds, read_timeout_in_seconds, dns_cache_ttl_in_seconds):
+        self._dns_cache_ttl_in_seconds = dns_cache_ttl_in_seconds
+        self._host_2_session = {}
+        self._lock = threading.Lock()
+        self._pool_size = pool_size
+        self._timeout = (connect_timeout_in_seconds, read_timeout_in_seconds)
+
+    def close(self):
+        """Closes all of the sessions"""
+        with self._lock:
+            sessions = list(self._host_2_session.values())
+            self._host_2_session.clear()
+        for session in sessions:
+            session.close()
+
+    def forget_sessions(self):
+        """Drops the sessions without closing their connections, which are owned by another process"""
+        self._host_2_session = {}
+        self._lock = threading.Lock()
+
+    def session(self, url):
+        """Returns the keep-alive session of the URL's host, creating it if needed"""
+        url_parts = urlsplit(url)
+        host = (url_parts.scheme, url_parts.netloc)
+        with self._lock:
+            session = self._host_2_session.get(host)
+            if session is None:
+                if self._dns_cache_ttl_in_seconds > 0:
+                    adapter = _DnsCachingAdapter(
+                        _DnsCache(self._dns_cache_ttl_in_seconds), pool_connections=1, pool_maxsize=self._pool_size)
+                else:
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+                session = requests.Session()
+                session.mount(f"{url_parts.scheme}://{url_parts.netloc}", adapter)
+                self._host_2_session[host] = session
+        return session
+
+    def timeout(self):
+        """Returns the (connect, read) timeout pair"""
+        return self._timeout
+
+
+class RestSessionPool:
+    """Implements a process-wide pool of keep-alive HTTP sessions, one per host, shared by all of the REST clients"""
+
+    _DEFAULT_CONNECT_TIMEOUT_IN_SECONDS = 10
+    _DEFAULT_DNS_CACHE_TTL_IN_SECONDS = 300
+    _DEFAULT_POOL_SIZE = 16
+    _DEFAULT_READ_TIMEOUT_IN_SECONDS = 120
+
+    _impl = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def finalize():
+        """Closes all of the pooled sessions"""
+        with RestSessionPool._lock:
+            impl, RestSessionPool._impl = RestSessionPool._impl, None
+        if impl:
+            impl.close()
+
+    @staticmethod
+    def _forget_sessions_after_fork():
+        """Makes a forked process open its own connections rather than sharing the ones of its parent"""
+        RestSessionPool._lock = threading.Lock()
+        if RestSessionPool._impl:
+            RestSessionPool._impl.forget_sessions()
+
+    @staticmethod
+    def initialize(configuration=None):
+        """Initializes the pool using the given configuration, falling back to the defaults for the missing values"""
+        impl = _RestSessionPoolImpl(
+            int(getattr(configuration, "poolSize", RestSessionPool._DEFAULT_POOL_SIZE)),
+            float(getattr(
+                configuration, "connectTimeoutInSeconds", RestSessionPool._DEFAULT_CONNECT_TIMEOUT_IN_SECONDS)),
+            float(getattr(configuration, "readTimeoutInSeconds", RestSessionPool._DEFAULT_READ_TIMEOUT_IN_SECONDS)),
+            float(getattr(
+                configuration, "dnsCacheTtlInSeconds", RestSessionPool._DEFAULT_DNS_CACHE_TTL_IN_SECONDS)))
+        with RestSessionPool._lock:
+            previous_impl, RestSessionPool._impl = RestSessionPool._impl, impl
+        if previous_impl:
+            previous_impl.close()
+
+    @staticmethod
+    def _impl_instance():
+        """Returns the pool, initializing it with the defaults if it has not been initialized yet"""
+        with RestSessionPool._lock:
+            if RestSessionPool._impl is None:
+                RestSessionPool._impl = _RestSessionPoolImpl(
+                    RestSessionPool._DEFAULT_POOL_SIZE, RestSessionPool._DEFAULT_CONNECT_TIMEOUT_IN_SECONDS,
+                    RestSessionPool._DEFAULT_READ_TIMEOUT_IN_SECONDS,
+                    RestSessionPool._DEFAULT_DNS_CACHE_TTL_IN_SECONDS)
+            return RestSessionPool._impl
+
+    @staticmethod
+    def session(url):
+        """Returns the keep-alive session of the URL's host"""
+        return RestSessionPool._impl_instance().session(url)
+
+    @staticmethod
+    def timeout():
+        """Returns the (connect, read) timeout pair"""
+        return RestSessionPool._impl_instance().timeout()
+
+
+os.register_at_fork(after_in_child=RestSessionPool._forget_sessions_after_fork)  # pylint: disable=protected-access
 
 
 class RestClient:
     """Implements a rest client interface"""
 
-    _DEFAULT_REQUEST_TIMEOUT_IN_SECONDS = 120
     _CONTENT_TYPE = "Content-Type"
     _SUCCESSFUL_RESPONSE_CODES = [
         HTTPStatus.OK,
@@ -31,16 +212,19 @@ class RestClient:
         """Sends the post request"""
         return self._request(url_path, "POST", request_body)
     
-    def send_get_request(self, url_path):
-        """Sends the get request"""
-        return self._request(url_path, "GET")
+    def send_get_request(self, url_path, raw=False, parameters=None):
+        """Sends the get request with the given query parameters, which are URL encoded, returning the response as
+        plain dicts and lists if 'raw' is set"""
+        return self._request(url_path, "GET", raw=raw, parameters=parameters)
 
-    def _request(self, url_path, method, json=None):
+    def _request(self, url_path, method, json=None, raw=False, parameters=None):
         """Performs REST request"""
-        response = requests.request(
-            method, url_path, headers=self._headers, json=json, timeout=RestClient._DEFAULT_REQUEST_TIMEOUT_IN_SECONDS)
+        response = RestSessionPool.session(url_path).request(
+            method, url_path, headers=self._headers, json=json, params=parameters, timeout=RestSessionPool.timeout())
         if response.ok:
-            return response.json(object_hook=RecursiveNamespace.map_entry)
+            if raw:
+                return JsonLoader.loads_raw(response.content)
+            return JsonLoader.loads(response.content)
         error_status_code = response.status_code
         if error_status_code in RestClient._SUCCESSFUL_RESPONSE_CODES:
             return response
@@ -0,0 +1,93 @@
+"""Implements the wire formats of the extraction output messages"""
+
+from common.columnar import ColumnarBatch
+from common.json_loader import JsonLoader
+
+try:
+    import msgpack
+except ImportError:  # the columnar wire format is only available when msgpack is installed
+    msgpack = None
+
+
+class WireFormat:
+    """Encodes and decodes the extraction output messages, whose wire format is named by a message header; a message
+    without the header is a JSON one, as produced before the header was introduced"""
+
+    COLUMNAR = "columnar-v1"
+    HEADER = "pricer-wire-format"
+    JSON = "json"
+
+    _DICTIONARY_ENCODING = "dictionary"
+    _MAXIMUM_DICTIONARY_RATIO = 0.5
+    _PLAIN_ENCODING = "plain"
+
+    @staticmethod
+    def _decode_column(encoded_column):
+        """Decodes the column values"""
+        if encoded_column[0] == WireFormat._DICTIONARY_ENCODING:
+            return list(map(encoded_column[1].__getitem__, encoded_column[2]))
+        if encoded_column[0] == WireFormat._PLAIN_ENCODING:
+            return encoded_column[1]
+        raise ValueError(f"the '{encoded_column[0]}' column encoding is not supported")
+
+    @staticmethod
+    def _encode_column(values):
+        """Encodes the column values, replacing the repeated strings with indexes into a dictionary of the distinct
+        ones when they are repeated often enough"""
+        maximum_dictionary_size = int(len(values) * WireFormat._MAXIMUM_DICTIONARY_RATIO)
+        value_2_index = {}
+        indexes = []
+        for value in values:
+            if value is not None and not isinstance(value, str):
+                return [WireFormat._PLAIN_ENCODING, values]
+            index = value_2_index.get(value)
+            if index is None:
+                if len(value_2_index) >= maximum_dictionary_size:
+                    return [WireFormat._PLAIN_ENCODING, values]
+                index = value_2_index[value] = len(value_2_index)
+            indexes.append(index)
+        return [WireFormat._DICTIONARY_ENCODING, list(value_2_index), indexes]
+
+    @staticmethod
+    def decode(payload, headers=None):
+        """Returns the plain representation of the message; the data of a columnar message is decoded into a
+        ColumnarBatch"""
+        wire_format = WireFormat.JSON
+        for key, value in headers or ():
+            if key == WireFormat.HEADER:
+                wire_format = value.decode("ascii")
+        if wire_format == WireFormat.JSON:
+            return JsonLoader.loads_raw(payload)
+        WireFormat.validate(wire_format)
+        entry = msgpack.unpackb(payload, raw=False)
+        entry["data"] = ColumnarBatch(
+            entry.pop("descriptors"), [WireFormat._decode_column(column) for column in entry.pop("columns")])
+        return entry
+
+    @staticmethod
+    def encode(job_id, destination, batch, wire_format=COLUMNAR):
+        """Returns the payload and the headers of the message carrying the batch, given as a ColumnarBatch, of the
+        job; the destination is omitted if it is None, as it is then published by the job manifest"""
+        WireFormat.validate(wire_format)
+        headers = [(WireFormat.HEADER, wire_format.encode("ascii"))]
+        if wire_format == WireFormat.JSON:
+            entry = {"data": batch.to_dict(), "jobId": job_id}
+        else:
+            entry = {
+                "columns": [WireFormat._encode_column(column) for column in batch.columns()],
+                "descriptors": list(batch.descriptors()),
+                "jobId": job_id
+            }
+        if destination is not None:
+            entry["destination"] = destination
+        if wire_format == WireFormat.JSON:
+            return JsonLoader.dumps(entry), headers
+        return msgpack.packb(entry, use_bin_type=True), headers
+
+    @staticmethod
+    def validate(wire_format):
+        """Raises an error if the wire format cannot be used"""
+        if wire_format not in (WireFormat.COLUMNAR, WireFormat.JSON):
+            raise ValueError(f"the '{wire_format}' wire format is not supported")
+        if wire_format == WireFormat.COLUMNAR and msgpack is None:
+            raise ValueError(f"the '{wire_format}' wire format requires the 'msgpack' package")
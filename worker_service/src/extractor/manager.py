@@ -1,53 +1,161 @@
 """Implements extractor service manager"""
 
-import json
 import time
 
-from common.kafka import KafkaSink, KafkaSource
+from common.claim_check import ClaimCheckStore
+from common.consumer_pool import ConsumerPool
+from common.exception import ExceptionUtilities
+from common.json_loader import JsonLoader, RecursiveNamespace
+from common.kafka import DeliveryReport, KafkaSink, KafkaSource, KafkaTopics
 from common.main import Main
+from common.models import Job, KafkaConfiguration
+from common.rest import RestSessionPool
 from common.service_management import ServiceManager
+from common.wire_format import WireFormat
 from extractor.services.shopify import ShopifySource
 
 
+def _initialize_worker_process(configuration_entry):
+    """Initializes the spawned worker process from the plain configuration of the extractor, returning the batch
+    handler of its own service manager, which opens its own producers"""
+    Main.initialize("extractor-worker")
+    configuration = RecursiveNamespace.map_entry({
+        **configuration_entry,
+        "kafkaSinkConfiguration": KafkaConfiguration.from_dict(configuration_entry["kafkaSinkConfiguration"]),
+        "kafkaSourceConfiguration": KafkaConfiguration.from_dict(configuration_entry["kafkaSourceConfiguration"])
+    })
+    manifest_entry = configuration_entry.get("manifestConfiguration")
+    if manifest_entry:
+        configuration.manifestConfiguration = KafkaConfiguration.from_dict(manifest_entry)
+    service_manager = ExtractorServiceManager(configuration)
+    service_manager._prepare_extraction()  # pylint: disable=protected-access
+    return service_manager._on_messages_received  # pylint: disable=protected-access
+
+
 class ExtractorServiceManager(ServiceManager):
 
     """Implements extractor service manager"""
 
+    # below the default maximum message size of the broker
+    _DEFAULT_CLAIM_CHECK_THRESHOLD_IN_BYTES = 900 * 1024
+
     _SOURCE_TYPE_2_CLS = {
         "shopify": ShopifySource
     }
 
     def __init__(self, configuration):
+        self._claim_check_configuration = getattr(configuration, "claimCheckConfiguration", None)
         self._kafka_source_configuration = configuration.kafkaSourceConfiguration
         self._kafka_sink_configuration = configuration.kafkaSinkConfiguration
+        self._manifest_configuration = getattr(configuration, "manifestConfiguration", None)
+        self._rest_client_configuration = getattr(configuration, "restClientConfiguration", None)
+        self._claim_check_store = None
+        self._claim_check_threshold_in_bytes = None
         self._kafka_source = None
         self._kafka_sink = None
-    
-    def _on_message_received(self, job):
-        job_id = job.jobId
-        source = job.source
-        source_type = source.type
-        Main.logger().info("extracting the data for the '%s' source as part of %s job", source_type, job_id)
+        self._manifest_sink = None
+
+    @staticmethod
+    def iter_pages(job):
+        """Returns an iterator over the pages of the job, extracted from its source as columnar batches"""
+        source_type = job.source.type
+        Main.logger().info("extracting the data for the '%s' source as part of %s job", source_type, job.jobId)
         clazz = ExtractorServiceManager._SOURCE_TYPE_2_CLS.get(source_type.lower())
-        clazz_instance = clazz(job_id, source)
-        clazz_instance.extract_and_transform(lambda data: self._send_data_to_sink(job.destination, job_id, data))
+        return clazz(job.jobId, job.source).iter_batches()
+
+    def _on_message_received(self, record):
+        job = record.value
+        job_id = job.jobId
+        # the pages are produced asynchronously, so the next page is extracted while the previous ones are being
+        # published; a full producer buffer lets a slow sink slow the extraction down
+        delivery_report = DeliveryReport()
+        destination_entry = job.destination.to_dict()
+        if self._manifest_sink:
+            # the destination is published once, keyed by the job, rather than with every page
+            self._manifest_sink.send_message(
+                [JsonLoader.dumps({"destination": destination_entry, "jobId": job_id})], delivery_report, key=job_id)
+            destination_entry = None
+        # the key keeps the related pages on one partition, while the jobs or tables spread over all of them
+        if self._kafka_sink_configuration.keyField == KafkaConfiguration.TABLE_KEY_FIELD:
+            key = job.destination.fullyQualifiedTableName
+        else:
+            key = job_id
+        for data in ExtractorServiceManager.iter_pages(job):
+            self._send_data_to_sink(destination_entry, job_id, data, delivery_report, key)
+        if self._manifest_sink:
+            self._manifest_sink.flush()
+        self._kafka_sink.flush()
+        delivery_report.raise_for_failure()
+        if self._manifest_sink:
+            # the manifest holds the credentials of the destination, so it is deleted from the compacted topic once all
+            # of the pages are delivered; the loaders keep the manifests they already consumed
+            self._manifest_sink.send_message([None], key=job_id)
+            self._manifest_sink.flush()
+        # the job is consumed again, and extracted from scratch, unless all of its pages have been delivered
+        record.acknowledge()
+
+    def _on_messages_received(self, records):
+        for record in records:
+            try:
+                self._on_message_received(record)
+            except BaseException as ex:
+                Main.logger().error(
+                    "failed to extract the data of the %s job, details: %s", record.value.jobId,
+                    ExceptionUtilities.message(ex))
+                record.fail(ex)
     
-    def _send_data_to_sink(self, destination, job_id, data):
-        if not data or not data.values:
+    def _send_data_to_sink(self, destination_entry, job_id, data, delivery_report, key):
+        if not data:
             return
-        producer_data = json.dumps(
-            {
-                "data": data,                
-                "destination": destination.to_dict(),
-                "jobId": job_id
-            })
-        self._kafka_sink.send_message([producer_data])
+        producer_data, headers = WireFormat.encode(
+            job_id, destination_entry, data, wire_format=self._kafka_sink_configuration.wireFormat)
+        if self._claim_check_store and len(producer_data) > self._claim_check_threshold_in_bytes:
+            # the oversized page is stored as a blob, the message only carrying a reference to it
+            reference = self._claim_check_store.put(producer_data)
+            Main.logger().debug(
+                "stored a page of %d bytes of the %s job into the %s blob", len(producer_data), job_id,
+                reference["blob"])
+            producer_data = JsonLoader.dumps(reference)
+            headers.append((ClaimCheckStore.HEADER, ClaimCheckStore.VERSION))
+        self._kafka_sink.send_message([producer_data], delivery_report, headers=headers, key=key)
+
+    def _prepare_extraction(self):
+        """Prepares the REST sessions, the claim check store and the producers of the extraction"""
+        RestSessionPool.initialize(self._rest_client_configuration)
+        claim_check_directory = getattr(self._claim_check_configuration, "directory", None)
+        if claim_check_directory:
+            self._claim_check_store = ClaimCheckStore(claim_check_directory)
+            self._claim_check_threshold_in_bytes = int(getattr(
+                self._claim_check_configuration, "thresholdInBytes",
+                ExtractorServiceManager._DEFAULT_CLAIM_CHECK_THRESHOLD_IN_BYTES))
+        self._kafka_sink = KafkaSink(self._kafka_sink_configuration)
+        if self._manifest_configuration:
+            self._manifest_sink = KafkaSink(
+                self._manifest_configuration, topic_configuration=KafkaTopics.COMPACTED_TOPIC_CONFIGURATION)
+
+    def _worker_process_configuration(self):
+        """Returns the configuration the worker processes are initialized from, as plain values"""
+        configuration_entry = {
+            "kafkaSinkConfiguration": self._kafka_sink_configuration.to_dict(),
+            "kafkaSourceConfiguration": self._kafka_source_configuration.to_dict()
+        }
+        for key, configuration in (
+                ("claimCheckConfiguration", self._claim_check_configuration),
+                ("manifestConfiguration", self._manifest_configuration),
+                ("restClientConfiguration", self._rest_client_configuration)):
+            if configuration is not None:
+                configuration_entry[key] = configuration.to_dict()
+        return configuration_entry
 
     def prepare(self):
         """Prepares the service manager"""
         time.sleep(15)
-        self._kafka_source = KafkaSource(self._kafka_source_configuration, self._on_message_received)
-        self._kafka_sink = KafkaSink(self._kafka_sink_configuration)
+        self._kafka_source = KafkaSource(
+            self._kafka_source_configuration, deserializer=Job.loads, batch_handler=self._on_messages_received,
+            worker_initializer=_initialize_worker_process, worker_configuration=self._worker_process_configuration())
+        # the worker processes, if any, open their own producers, so that this process only consumes the jobs
+        if self._kafka_source_configuration.poolKind != ConsumerPool.PROCESS_KIND:
+            self._prepare_extraction()
 
     def start(self):
         """Starts the service manager"""
@@ -57,3 +165,8 @@ class ExtractorServiceManager(ServiceManager):
     def stop(self):
         """Stops the service manager"""
         self._kafka_source.stop()
+        if self._kafka_sink:
+            self._kafka_sink.stop()
+        if self._manifest_sink:
+            self._manifest_sink.stop()
+        RestSessionPool.finalize()
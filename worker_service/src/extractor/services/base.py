@@ -6,5 +6,11 @@ from common.service_management import Service
 class AbstractSource(Service):
     """Implements extraction service interface"""
 
+    def iter_batches(self):
+        """Yields the extracted and transformed data one columnar batch at a time"""
+        return iter(())
+
     def extract_and_transform(self, result_handler):
         """Implements the extraction and performs transformation"""
+        for batch in self.iter_batches():
+            result_handler(batch)
@@ -1,7 +1,11 @@
 """Implements the shopify soure"""
 
-import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from common.columnar import ColumnarBatch
 from common.main import Main
+from common.models import ShopifySourceConfiguration
 from common.rest import RestClient
 from extractor.services.base import AbstractSource
 
@@ -9,102 +13,190 @@ from extractor.services.base import AbstractSource
 class ShopifySource(AbstractSource):
     """Implements the shopify soure"""
 
+    _COLUMN_NAMES = (
+        "available", "category", "code", "collection", "grams", "imageUrl", "name", "price", "requiresShipping", "url",
+        "variantName")
+
     def __init__(
         self, job_id, source):
         self._job_id = job_id
         self._input_schema_2_output_schema = {}
         for schema_mapping in source.schemaMapping:
             self._input_schema_2_output_schema[schema_mapping.input] = schema_mapping.output
-        self._page_number = 1
-        self._urls = source.shopify.urls
+        unmapped_column_names = [
+            column_name for column_name in ShopifySource._COLUMN_NAMES
+            if column_name not in self._input_schema_2_output_schema]
+        if unmapped_column_names:
+            raise ValueError(
+                f"the schema mapping of the {job_id} job does not map the {', '.join(unmapped_column_names)} columns")
+        self._descriptors = tuple(
+            self._input_schema_2_output_schema[column_name] for column_name in ShopifySource._COLUMN_NAMES)
+        shopify = source.shopify
+        self._urls = shopify.urls
+        self._concurrency = shopify.concurrency
+        self._page_size = shopify.pageSize
+        self._pagination = shopify.pagination
+        # each range is a (since_id, until_id) pair, where since_id is exclusive and until_id is inclusive
+        self._id_ranges = [(id_range.sinceId, id_range.untilId) for id_range in shopify.idRanges] or [(0, None)]
         self._rest_client = RestClient()
       
     def _extract(self, url, page_number):
         """Extracts the data from the Shopify"""
         Main.logger().debug(
             "extracting the data from the shopify using %s with page number %d", url, page_number)
-        response_data = self._extract_products(url, page_number)
+        products = self._extract_products(url, limit=self._page_size, page=page_number)
         Main.logger().debug(
             "extracted the data from the shopify using %s with page number %d", url, page_number)
-        self._page_number += 1
-        return self._to_dataframe(response_data, url), page_number
+        return self._to_batch(products, url)
+
+    def _extract_by_cursor(self, url, since_id, until_id):
+        """Extracts the page of products following the 'since_id' cursor from the Shopify, returning the page along
+        with the cursor of the next page and whether the ID range is exhausted"""
+        Main.logger().debug(
+            "extracting the data from the shopify using %s with products since ID %d", url, since_id)
+        products = self._extract_products(url, limit=self._page_size, since_id=since_id)
+        Main.logger().debug(
+            "extracted the data from the shopify using %s with products since ID %d", url, since_id)
+        exhausted = len(products) < self._page_size
+        if until_id is not None:
+            products_in_range = [product for product in products if product["id"] <= until_id]
+            exhausted = exhausted or len(products_in_range) < len(products)
+            products = products_in_range
+        next_since_id = products[-1]["id"] if products else since_id
+        return self._to_batch(products, url), next_since_id, exhausted
     
-    def _extract_products(self, url, page_number):
+    def _extract_products(self, url, **parameters):
         """Extracts the product data from the Shopify"""
-        extraction_url = f"{url}/products.json"
-        return self._rest_client.send_get_request(f"{extraction_url}?page={page_number}")
+        return self._rest_client.send_get_request(
+            f"{url}/products.json", raw=True, parameters=parameters)["products"]
     
-    def _product_variant_image(self, product, variant_id):
-        """Returns the product image"""
-        image_url = None
-        images = product.images
+    @staticmethod
+    def _variant_id_2_image_url(product):
+        """Returns the image URL of every variant having its own image along with the product's default image URL"""
+        variant_id_2_image_url = {}
+        images = product["images"]
         for image in images:
-            if variant_id in image.variant_ids:
-                image_url = image.src
-                break
-        if image_url:
-            return image_url
-        return images[0].src if images else ""
+            for variant_id in image["variant_ids"]:
+                variant_id_2_image_url.setdefault(variant_id, image["src"])
+        return variant_id_2_image_url, images[0]["src"] if images else ""
     
-    def _to_dataframe(self, response_data, url):
-        """converts data into dataframe"""
-        result = []
+    def _to_batch(self, products, url):
+        """converts data into columnar batch"""
+        batch = ColumnarBatch(self._descriptors)
+        (
+            available_values, category_values, code_values, collection_values, grams_values, image_url_values,
+            name_values, price_values, requires_shipping_values, url_values, variant_name_values
+        ) = batch.columns()
         Main.logger().debug(
             "parsing the data from the shopify using %s of the %s job", url, self._job_id)
-        products = response_data.products
         for product in products:
-            title = product.title
-            product_type = product.product_type
-            product_url = f"{url}/products/{product.handle}"
-            for variant in product.variants:
+            title = product["title"]
+            product_type = product["product_type"]
+            product_url = f"{url}/products/{product['handle']}"
+            variant_id_2_image_url, default_image_url = ShopifySource._variant_id_2_image_url(product)
+            for variant in product["variants"]:
                 options = []
-                if variant.option1:
-                    options.append(variant.option1)
-                if variant.option2:
-                    options.append(variant.option2)
-                if variant.option3:
-                    options.append(variant.option3)
-                usage_record = {}
-                usage_record["available"] = variant.available
-                usage_record["category"] = product_type
-                usage_record["code"] = variant.sku
-                usage_record["collection"] = ""
-                usage_record["grams"] = variant.grams
-                usage_record["imageUrl"] = self._product_variant_image(product, variant.id)
-                usage_record["name"] = title
-                usage_record["price"] = variant.price
-                usage_record["requiresShipping"] = variant.requires_shipping
-                usage_record["url"] = product_url
-                usage_record["variantName"] = " / ".join(options)
-                result.append(usage_record)
+                if variant["option1"]:
+                    options.append(variant["option1"])
+                if variant["option2"]:
+                    options.append(variant["option2"])
+                if variant["option3"]:
+                    options.append(variant["option3"])
+                available_values.append(variant["available"])
+                category_values.append(product_type)
+                code_values.append(variant["sku"])
+                collection_values.append("")
+                grams_values.append(variant["grams"])
+                image_url_values.append(variant_id_2_image_url.get(variant["id"]) or default_image_url)
+                name_values.append(title)
+                price_values.append(variant["price"])
+                requires_shipping_values.append(variant["requires_shipping"])
+                url_values.append(product_url)
+                variant_name_values.append(" / ".join(options))
         Main.logger().debug(
             "parsed the data from the shopify using %s of the %s job", url, self._job_id)
-        return pd.DataFrame(result)
+        return batch
 
-    def _transform(self, dataframe, url, page_number):
+    def _transform(self, batch, url, page_number):
         """Transforms the data from the Azure"""
         Main.logger().debug(
             "transforming the data from the shopify using %s with page number %d", url, page_number)
         Main.logger().debug(
             "transformed the data from the shopify using %s with page number %d", url, page_number)
-    
-    def _extract_and_transform_by_url(self, url, result_handler):        
-        """Implements the extraction and performs transformation"""
-        dataframe, page_number = self._extract(url, self._page_number)
-        if dataframe.empty:
-           return
-        self._transform(dataframe, url, page_number)
-        descriptors = []
-        for key in list(dataframe.keys()):
-            descriptors.append(self._input_schema_2_output_schema[key])
-        result_handler({
-            "descriptors": descriptors,
-            "values": dataframe.values.tolist()
-        })
-        self._extract_and_transform_by_url(url, result_handler)
+        return batch
+
+    def _iter_batches_by_url(self, url):
+        """Yields the extracted and transformed pages of the URL one at a time"""
+        page_number = 1
+        while True:
+            batch = self._extract(url, page_number)
+            if not batch:
+                return
+            yield self._transform(batch, url, page_number)
+            page_number += 1
+
+    def _iter_batches_by_url_concurrently(self, url):
+        """Yields the extracted and transformed pages of the URL in page order, keeping up to 'concurrency' page
+        requests in flight; the first empty page marks the end of the catalog"""
+        with ThreadPoolExecutor(
+                max_workers=self._concurrency, thread_name_prefix=f"shopify-{self._job_id}") as executor:
+            in_flight_pages = deque()
+            next_page_number = 1
+            try:
+                for _ in range(self._concurrency):
+                    in_flight_pages.append((next_page_number, executor.submit(self._extract, url, next_page_number)))
+                    next_page_number += 1
+                while in_flight_pages:
+                    page_number, future = in_flight_pages.popleft()
+                    batch = future.result()
+                    if not batch:
+                        return
+                    # the next request is issued before yielding, so it is in flight while the consumer handles the page
+                    in_flight_pages.append((next_page_number, executor.submit(self._extract, url, next_page_number)))
+                    next_page_number += 1
+                    yield self._transform(batch, url, page_number)
+            finally:
+                # the pages past the last one (or past a failed one) are not needed anymore
+                for _, future in in_flight_pages:
+                    future.cancel()
+
+    def _iter_batches_by_cursor(self, url):
+        """Yields the extracted and transformed pages of the URL following the 'since_id' cursor of every ID range;
+        up to 'concurrency' ranges are scanned in parallel, so the pages of different ranges may interleave"""
+        pending_id_ranges = deque(self._id_ranges)
+        with ThreadPoolExecutor(
+                max_workers=self._concurrency, thread_name_prefix=f"shopify-{self._job_id}") as executor:
+            in_flight_pages = deque()
+
+            def _scan_next_id_range():
+                since_id, until_id = pending_id_ranges.popleft()
+                in_flight_pages.append(
+                    (until_id, executor.submit(self._extract_by_cursor, url, since_id, until_id)))
+
+            try:
+                while pending_id_ranges and len(in_flight_pages) < self._concurrency:
+                    _scan_next_id_range()
+                while in_flight_pages:
+                    until_id, future = in_flight_pages.popleft()
+                    batch, next_since_id, exhausted = future.result()
+                    if not exhausted:
+                        in_flight_pages.append(
+                            (until_id, executor.submit(self._extract_by_cursor, url, next_since_id, until_id)))
+                    elif pending_id_ranges:
+                        _scan_next_id_range()
+                    if batch:
+                        yield self._transform(batch, url, next_since_id)
+            finally:
+                for _, future in in_flight_pages:
+                    future.cancel()
 
-    def extract_and_transform(self, result_handler):        
-        """Implements the extraction and performs transformation"""
+    def iter_batches(self):
+        """Yields the extracted and transformed data one page at a time"""
         for url in self._urls:
-            self._page_number = 1
-            self._extract_and_transform_by_url(url, result_handler)
\ No newline at end of file
+            if self._pagination == ShopifySourceConfiguration.CURSOR_PAGINATION:
+                yield from self._iter_batches_by_cursor(url)
+                continue
+            if self._concurrency > 1:
+                yield from self._iter_batches_by_url_concurrently(url)
+                continue
+            yield from self._iter_batches_by_url(url)
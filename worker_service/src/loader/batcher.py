@@ -0,0 +1,124 @@
+"""Implements the micro-batching of the rows to be loaded"""
+
+import threading
+import time
+from collections import deque
+
+from common.exception import ExceptionUtilities
+from common.main import Main
+
+
+class _PendingRecord:
+    """Tracks whether the rows of a consumed record have been flushed, or failed to be"""
+
+    __slots__ = ("exception", "flushed", "record")
+
+    def __init__(self, record):
+        self.exception = None
+        self.flushed = False
+        self.record = record
+
+
+class _TableBuffer:
+    """Buffers the rows of a destination table"""
+
+    __slots__ = ("columns", "creation_time", "destination", "pending_records", "rows", "size")
+
+    def __init__(self, destination, columns):
+        self.columns = columns
+        self.creation_time = time.monotonic()
+        self.destination = destination
+        self.pending_records = []
+        self.rows = []
+        self.size = 0
+
+
+class TableBatcher:
+    """Buffers the rows per destination table and flushes them once the row count, the byte size or the latency
+    threshold is reached, whichever comes first; the records are acknowledged in consumption order, once all of the
+    rows up to them have been flushed; it is safe to use from several threads and different tables are flushed
+    concurrently"""
+
+    DEFAULT_MAXIMUM_BYTES = 16 * 1024 * 1024
+    DEFAULT_MAXIMUM_LATENCY_IN_SECONDS = 5.0
+    DEFAULT_MAXIMUM_ROWS = 10000
+
+    def __init__(
+            self, maximum_rows=DEFAULT_MAXIMUM_ROWS, maximum_bytes=DEFAULT_MAXIMUM_BYTES,
+            maximum_latency_in_seconds=DEFAULT_MAXIMUM_LATENCY_IN_SECONDS):
+        self._key_2_table_buffer = {}
+        self._lock = threading.Lock()
+        self._maximum_bytes = maximum_bytes
+        self._maximum_latency_in_seconds = maximum_latency_in_seconds
+        self._maximum_rows = maximum_rows
+        self._pending_records = deque()
+
+    def _acknowledge_flushed_records(self):
+        """Acknowledges, or fails, the longest prefix of the pending records whose rows have been flushed"""
+        while self._pending_records and self._pending_records[0].flushed:
+            pending_record = self._pending_records.popleft()
+            if pending_record.exception is None:
+                pending_record.record.acknowledge()
+            else:
+                pending_record.record.fail(pending_record.exception)
+
+    def _flush(self, key):
+        """Loads the buffered rows of the table into its destination"""
+        # the buffer is dropped even if the insert fails; its records are then failed, so that they are retried
+        with self._lock:
+            table_buffer = self._key_2_table_buffer.pop(key, None)
+        if table_buffer is None:  # another thread has flushed it in the meantime
+            return
+        Main.logger().debug("flushing %d buffered rows into the %s table", len(table_buffer.rows), key[0])
+        # the insert runs outside of the lock, so the other tables keep on being buffered and flushed meanwhile
+        exception = None
+        try:
+            table_buffer.destination.insert(table_buffer.columns, table_buffer.rows)
+        except BaseException as ex:
+            Main.logger().error(
+                "failed to flush %d buffered rows into the %s table, details: %s", len(table_buffer.rows), key[0],
+                ExceptionUtilities.message(ex))
+            exception = ex
+        with self._lock:
+            for pending_record in table_buffer.pending_records:
+                pending_record.exception = exception
+                pending_record.flushed = True
+            self._acknowledge_flushed_records()
+
+    def add(self, destination, columns, rows, record):
+        """Buffers the rows of the record for the destination columns, flushing them if a threshold is reached"""
+        pending_record = _PendingRecord(record)
+        # the rows of different projections of the same table are buffered separately, as they bind other columns
+        key = (destination.key(), columns)
+        with self._lock:
+            self._pending_records.append(pending_record)
+            if not rows:
+                pending_record.flushed = True
+                self._acknowledge_flushed_records()
+                return
+            table_buffer = self._key_2_table_buffer.get(key)
+            if table_buffer is None:
+                table_buffer = self._key_2_table_buffer[key] = _TableBuffer(destination, columns)
+            table_buffer.pending_records.append(pending_record)
+            table_buffer.rows.extend(rows)
+            table_buffer.size += record.size
+            is_full = len(table_buffer.rows) >= self._maximum_rows or table_buffer.size >= self._maximum_bytes
+        if is_full:
+            self._flush(key)
+
+    def flush_all(self):
+        """Flushes the buffered rows of all of the tables"""
+        with self._lock:
+            keys = list(self._key_2_table_buffer)
+        for key in keys:
+            self._flush(key)
+
+    def flush_expired(self):
+        """Flushes the buffered rows of the tables whose oldest rows have reached the latency threshold"""
+        expiration_time = time.monotonic() - self._maximum_latency_in_seconds
+        with self._lock:
+            keys = [
+                key for key, table_buffer in self._key_2_table_buffer.items()
+                if table_buffer.creation_time <= expiration_time]
+        for key in keys:
+            self._flush(key)
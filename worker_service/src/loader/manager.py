@@ -2,11 +2,51 @@
 
 import time
 
+from common.claim_check import ClaimCheckStore
+from common.consumer_pool import ConsumerPool
+from common.exception import ExceptionUtilities
 from common.kafka import KafkaSource
 from common.main import Main
+from common.models import ExtractionOutput
 from common.service_management import ServiceManager
 
-from loader.services.snowflake import SnowflakeDestination
+from loader.batcher import TableBatcher
+from loader.manifest_cache import ManifestCache
+from loader.services.file import FileDestination
+from loader.services.snowflake import SnowflakeDestination, SnowflakeRegistry
+
+
+class _ClaimCheckedRecord:
+    """Wraps a record whose body is held by a claim check blob, which is removed once the record is acknowledged, or
+    once it is skipped or dead-lettered after failing"""
+
+    __slots__ = ("_claim_check_store", "_record", "size", "value")
+
+    def __init__(self, record, claim_check_store):
+        self._claim_check_store = claim_check_store
+        self._record = record
+        # the batching thresholds account for the body rather than for the reference
+        self.size = record.value.claimCheck.size
+        self.value = record.value
+        record.release_handler = self._remove_blob
+
+    def _remove_blob(self):
+        """Removes the blob of the record"""
+        try:
+            self._claim_check_store.remove(self.value.claimCheck)
+        except OSError as ex:
+            Main.logger().warning(
+                "failed to remove the %s blob, details: %s", self.value.claimCheck.blob,
+                ExceptionUtilities.message(ex))
+
+    def acknowledge(self):
+        """Acknowledges the record, then removes its blob"""
+        self._record.acknowledge()
+        self._remove_blob()
+
+    def fail(self, exception):
+        """Fails the record, keeping its blob while the record is to be retried"""
+        self._record.fail(exception)
 
 
 class LoaderServiceManager(ServiceManager):
@@ -14,31 +54,95 @@ class LoaderServiceManager(ServiceManager):
     """Implements loader service manager"""
 
     _DESTINATION_TYPE_2_CLS = {
+        "file": FileDestination,
         "snowflake": SnowflakeDestination
     }
 
     def __init__(self, configuration):
+        self._claim_check_configuration = getattr(configuration, "claimCheckConfiguration", None)
+        self._claim_check_store = None
+        self._destination_configuration = getattr(configuration, "destinationConfiguration", None)
         self._kafka_source_configuration = configuration.kafkaSourceConfiguration
         self._kafka_source = None
-    
-    def _on_message_received(self, job):
+        self._manifest_cache = None
+        self._manifest_configuration = getattr(configuration, "manifestConfiguration", None)
+        self._table_batcher = None
+
+    def _decode(self, payload, headers):
+        """Decodes the extraction output, fetching its body from the claim check store if needed"""
+        return ExtractionOutput.decode(payload, headers, claim_check_store=self._claim_check_store)
+
+    def _on_message_received(self, record):
+        job = record.value
         job_id = job.jobId
+        if job.claimCheck is not None:
+            # wrapped first, so that the blob is removed whichever way the record is over
+            record = _ClaimCheckedRecord(record, self._claim_check_store)
         destination = job.destination
+        if destination is None:
+            if self._manifest_cache is None:
+                raise ValueError(f"the message of the {job_id} job has no destination, yet no manifest topic is set")
+            destination = self._manifest_cache.get(job_id).destination
         destination_type = destination.type.lower()
         Main.logger().info("laoding the data to the '%s' destination as part of %s job", destination_type, job_id)
         clazz = LoaderServiceManager._DESTINATION_TYPE_2_CLS.get(destination_type)
-        with clazz(job_id, destination) as clazz_instance:
-            clazz_instance.load(job.data)
+        clazz_instance = clazz(job_id, destination)
+        # the record is acknowledged, and its offset committed, only once its rows have been flushed
+        columns, rows = clazz_instance.project(job.data)
+        self._table_batcher.add(clazz_instance, columns, rows, record)
+
+    def _on_messages_received(self, records):
+        for record in records:
+            try:
+                self._on_message_received(record)
+            except BaseException as ex:
+                Main.logger().error(
+                    "failed to load the data of the %s job, details: %s", record.value.jobId,
+                    ExceptionUtilities.message(ex))
+                record.fail(ex)
     
+    def _prepare_loading(self):
+        """Prepares the destinations, the claim check store and the batcher of the loading stage"""
+        SnowflakeRegistry.initialize(self._destination_configuration)
+        claim_check_directory = getattr(self._claim_check_configuration, "directory", None)
+        if claim_check_directory:
+            self._claim_check_store = ClaimCheckStore(claim_check_directory)
+        self._table_batcher = TableBatcher(
+            maximum_rows=int(getattr(
+                self._destination_configuration, "batchMaximumRows", TableBatcher.DEFAULT_MAXIMUM_ROWS)),
+            maximum_bytes=int(getattr(
+                self._destination_configuration, "batchMaximumBytes", TableBatcher.DEFAULT_MAXIMUM_BYTES)),
+            maximum_latency_in_seconds=float(getattr(
+                self._destination_configuration, "batchMaximumLatencyInSeconds",
+                TableBatcher.DEFAULT_MAXIMUM_LATENCY_IN_SECONDS)))
+
     def prepare(self):
         """Prepares the service manager"""
+        if self._kafka_source_configuration.poolKind == ConsumerPool.PROCESS_KIND:
+            # the rows are buffered across messages, so they have to be handled within this process
+            raise ValueError("the loader does not support the 'process' pool kind")
         time.sleep(15)
-        self._kafka_source = KafkaSource(self._kafka_source_configuration, self._on_message_received)
+        self._prepare_loading()
+        if self._manifest_configuration:
+            self._manifest_cache = ManifestCache(self._manifest_configuration, timeout_in_seconds=float(getattr(
+                self._destination_configuration, "manifestTimeoutInSeconds",
+                ManifestCache.DEFAULT_TIMEOUT_IN_SECONDS)))
+        # the wire format of the page data is named by a message header; JSON page data is only wrapped into a lazy
+        # view rather than being validated
+        self._kafka_source = KafkaSource(
+            self._kafka_source_configuration, deserializer=self._decode,
+            poll_handler=self._table_batcher.flush_expired, batch_handler=self._on_messages_received,
+            deserialize_headers=True, flush_handler=self._table_batcher.flush_all)
 
     def start(self):
         """Starts the service manager"""
+        if self._manifest_cache:
+            self._manifest_cache.start()
         self._kafka_source.start()
 
     def stop(self):
         """Stops the service manager"""
         self._kafka_source.stop()
+        if self._manifest_cache:
+            self._manifest_cache.stop()
+        SnowflakeRegistry.finalize()
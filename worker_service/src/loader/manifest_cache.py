@@ -0,0 +1,116 @@
+"""Implements the cache of the job manifests"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from confluent_kafka import OFFSET_BEGINNING, TopicPartition
+
+from common.exception import ExceptionUtilities
+from common.kafka import KafkaTopics, KafkaTransport
+from common.main import Main
+from common.models import JobManifest
+from common.service_management import Service
+
+
+class ManifestCache(Service):
+    """Consumes the compacted job manifest topic from its beginning and keeps the most recently used job manifests,
+    parsed and validated once, so that the extraction output messages only need to carry their job ID"""
+
+    DEFAULT_MAXIMUM_SIZE = 10000
+    DEFAULT_TIMEOUT_IN_SECONDS = 10.0
+
+    _METADATA_REFRESH_INTERVAL_IN_SECONDS = 30.0
+    _POLL_TIMEOUT_IN_SECONDS = 1.0
+
+    def __init__(
+            self, configuration, maximum_size=DEFAULT_MAXIMUM_SIZE, timeout_in_seconds=DEFAULT_TIMEOUT_IN_SECONDS):
+        KafkaTopics.ensure(configuration, KafkaTopics.COMPACTED_TOPIC_CONFIGURATION)
+        # every loader needs all of the manifests, so each one is assigned all of the partitions rather than joining a
+        # group; the group ID is required by the client, but nothing is ever committed for it
+        self._consumer = KafkaTransport.consumer({
+            "bootstrap.servers": ",".join(configuration.bootstrapServers),
+            "enable.auto.commit": False,
+            "group.id": f"{configuration.group}-manifests"
+        })
+        self._assigned_partitions = set()
+        self._condition = threading.Condition()
+        self._job_id_2_manifest = OrderedDict()
+        self._maximum_size = maximum_size
+        self._metadata_refresh_time = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="manifest-cache", daemon=True)
+        self._timeout_in_seconds = timeout_in_seconds
+        self._topic = configuration.topic
+
+    def _assign_new_partitions(self):
+        """Assigns the partitions of the topic which are not assigned yet, from their beginning, as the topic may be
+        created by the first manifest produced, or have partitions added later on"""
+        self._metadata_refresh_time = time.monotonic()
+        topic_metadata = self._consumer.list_topics(
+            timeout=ManifestCache._POLL_TIMEOUT_IN_SECONDS).topics.get(self._topic)
+        if topic_metadata is None or topic_metadata.error is not None:
+            return
+        new_partitions = sorted(set(topic_metadata.partitions) - self._assigned_partitions)
+        if not new_partitions:
+            return
+        self._consumer.incremental_assign(
+            [TopicPartition(self._topic, partition, OFFSET_BEGINNING) for partition in new_partitions])
+        self._assigned_partitions.update(new_partitions)
+
+    def _put(self, manifest):
+        """Caches the manifest of the job, evicting the least recently used manifest if the cache is full"""
+        with self._condition:
+            self._job_id_2_manifest[manifest.jobId] = manifest
+            self._job_id_2_manifest.move_to_end(manifest.jobId)
+            while len(self._job_id_2_manifest) > self._maximum_size:
+                self._job_id_2_manifest.popitem(last=False)
+            self._condition.notify_all()
+
+    def _run(self):
+        """Consumes the manifests until the cache is stopped"""
+        while not self._stopped.is_set():
+            if time.monotonic() - self._metadata_refresh_time >= ManifestCache._METADATA_REFRESH_INTERVAL_IN_SECONDS:
+                try:
+                    self._assign_new_partitions()
+                except BaseException as ex:
+                    Main.logger().error(
+                        "failed to list the partitions of the %s topic, details: %s", self._topic,
+                        ExceptionUtilities.message(ex))
+            if not self._assigned_partitions:
+                self._stopped.wait(ManifestCache._POLL_TIMEOUT_IN_SECONDS)
+                continue
+            message = self._consumer.poll(ManifestCache._POLL_TIMEOUT_IN_SECONDS)
+            if message is None:
+                continue
+            if message.error() is not None:
+                Main.logger().error("failed to consume a job manifest, details: %s", message.error())
+                continue
+            if message.value() is None:
+                # the job is over, yet its manifest is kept until evicted, as its pages may still be waiting to be
+                # loaded; the tombstone only lets the compaction drop the manifest, and its credentials, from the topic
+                continue
+            try:
+                self._put(JobManifest.loads(message.value()))
+            except BaseException as ex:
+                Main.logger().error("failed to load a job manifest, details: %s", ExceptionUtilities.message(ex))
+
+    def get(self, job_id):
+        """Returns the manifest of the job, waiting for it to be consumed if it is not cached yet"""
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: job_id in self._job_id_2_manifest, self._timeout_in_seconds):
+                raise RuntimeError(
+                    f"the manifest of the {job_id} job was not received within {self._timeout_in_seconds} seconds")
+            self._job_id_2_manifest.move_to_end(job_id)
+            return self._job_id_2_manifest[job_id]
+
+    def start(self):
+        """Starts consuming the manifests"""
+        self._thread.start()
+
+    def stop(self):
+        """Stops consuming the manifests"""
+        self._stopped.set()
+        self._thread.join()
+        self._consumer.close()
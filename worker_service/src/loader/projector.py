@@ -0,0 +1,65 @@
+"""Implements the projection of the extracted rows onto the destination columns"""
+
+from functools import lru_cache
+from operator import itemgetter
+
+from common.columnar import ColumnarBatch
+from common.json_loader import LazyList
+
+
+class SchemaProjector:
+    """Projects the rows described by the input descriptors onto the mapped output columns using precomputed
+    positions, renaming, reordering and dropping the columns in a single pass"""
+
+    __slots__ = ("_getter", "_indexes", "_is_identity", "columns")
+
+    def __init__(self, descriptors, input_2_output):
+        descriptor_2_index = {descriptor: index for index, descriptor in enumerate(descriptors)}
+        indexes = []
+        columns = []
+        for input_name, output_name in input_2_output:
+            index = descriptor_2_index.get(input_name)
+            if index is None:
+                continue
+            indexes.append(index)
+            columns.append(output_name.lower())
+        self.columns = tuple(columns)
+        self._indexes = tuple(indexes)
+        self._is_identity = indexes == list(range(len(descriptors)))
+        if len(indexes) == 1:
+            # a single-item getter returns the bare value rather than a tuple
+            single_index = indexes[0]
+            self._getter = lambda row: (row[single_index],)
+        else:
+            self._getter = itemgetter(*indexes) if indexes else lambda row: ()
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def compile(descriptors, input_2_output):
+        """Returns the projector of the descriptors tuple and the (input, output) mapping pairs, compiling it only the
+        first time the pair is seen"""
+        return SchemaProjector(descriptors, input_2_output)
+
+    @staticmethod
+    def project_data(data, input_2_output):
+        """Projects the extracted data, a columnar batch or a JSON object with its descriptors and values, onto the
+        mapped output columns, returning the column names and one tuple per row"""
+        if isinstance(data, ColumnarBatch):
+            projector = SchemaProjector.compile(data.descriptors(), input_2_output)
+            return projector.columns, projector.project_columns(data.columns())
+        values = data.values
+        if isinstance(values, LazyList):
+            values = values.to_list()
+        projector = SchemaProjector.compile(tuple(data.descriptors), input_2_output)
+        return projector.columns, projector.project(values)
+
+    def project(self, rows):
+        """Returns the projected rows as tuples, ready to be bound to an executemany statement"""
+        if self._is_identity:
+            return [tuple(row) for row in rows]
+        getter = self._getter
+        return [getter(row) for row in rows]
+
+    def project_columns(self, columns):
+        """Returns the projected rows as tuples from the columns of a columnar batch, only reading the mapped ones"""
+        return list(zip(*[columns[index] for index in self._indexes]))
@@ -0,0 +1,44 @@
+"""Implements the file destination"""
+
+import os
+import socket
+import threading
+
+from common.file_system import resilient_makedirs
+from common.json_loader import JsonLoader
+from common.service_management import Service
+from loader.projector import SchemaProjector
+
+
+class FileDestination(Service):
+    """Implements the file destination, which appends the projected rows as JSON lines to a part file of the table
+    under the destination directory; each process writes its own part file, so that they never interleave"""
+
+    _lock = threading.Lock()
+
+    def __init__(self, job_id, destination):
+        self._job_id = job_id
+        self._input_2_output = tuple(
+            (schema_mapping.input, schema_mapping.output) for schema_mapping in destination.schemaMapping)
+        self._directory = os.path.join(destination.file.directory, destination.fullyQualifiedTableName)
+        self._path = os.path.join(self._directory, f"{socket.gethostname()}-{os.getpid()}.jsonl")
+
+    def insert(self, columns, rows):
+        """Appends the projected rows to the part file of the table"""
+        body = b"".join(JsonLoader.dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+        with FileDestination._lock:
+            resilient_makedirs(self._directory)
+            with open(self._path, "ab") as file:
+                file.write(body)
+
+    def key(self):
+        """Returns the key identifying the destination table"""
+        return ("file", self._directory)
+
+    def load(self, data):
+        """Loads the data into the destination"""
+        self.insert(*self.project(data))
+
+    def project(self, data):
+        """Projects the data onto the destination table columns, returning the column names and one tuple per row"""
+        return SchemaProjector.project_data(data, self._input_2_output)
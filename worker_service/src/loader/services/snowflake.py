@@ -1,6 +1,8 @@
 """Implements the Snowflake destination"""
 
 import logging
+import threading
+import time
 
 from common.context_manager import SafeContextManager, DatabaseConnectionContextManager
 from common.main import Main
@@ -9,51 +11,161 @@ from sqlalchemy import MetaData, Table, create_engine
 
 from snowflake.sqlalchemy import URL
 
+from loader.projector import SchemaProjector
+from loader.services.snowflake_stage import SnowflakeStageLoader
 
-class SnowflakeDestination(SafeContextManager, Service):
-    """Implements the Snowflake destination"""
 
-    _DEFAULT_MAXIMUM_POOL_SIZE = 15
-    _DEFAULT_MINIMUM_POOL_SIZE = 5
+class _SnowflakeRegistryImpl:
+    """Stores the internal data members accessible via the 'SnowflakeRegistry' class"""
 
-    def __init__(self, job_id, destination):
-        self._job_id = job_id
-        snowflake_destination = destination.snowflake
-        self._input_schema_2_output_schema = {}
-        for schema_mapping in destination.schemaMapping:
-            self._input_schema_2_output_schema[schema_mapping.input] = schema_mapping.output
-        catalog_name, schema_name, table_name = SnowflakeDestination.split_table_name(
-            destination.fullyQualifiedTableName)
+    def __init__(self, table_ttl_in_seconds, stage_loader=None):
+        self._key_2_engine = {}
+        self._key_2_table = {}
+        self._lock = threading.Lock()
+        self._stage_loader = stage_loader
+        self._table_ttl_in_seconds = table_ttl_in_seconds
+
+    @staticmethod
+    def _create_engine(snowflake_destination, catalog_name):
+        """Creates the engine, along with its connection pool"""
         url = URL(
             account=snowflake_destination.account,
             database=catalog_name,
-            password=snowflake_destination.password,            
-            role=snowflake_destination.role,            
-            schema=schema_name,
+            password=snowflake_destination.password,
+            role=snowflake_destination.role,
             user=snowflake_destination.user,
             warehouse=snowflake_destination.warehouse
         )
-        max_overflow = SnowflakeDestination._DEFAULT_MAXIMUM_POOL_SIZE - SnowflakeDestination._DEFAULT_MINIMUM_POOL_SIZE
+        max_overflow = SnowflakeRegistry.DEFAULT_MAXIMUM_POOL_SIZE - SnowflakeRegistry.DEFAULT_MINIMUM_POOL_SIZE
         connection_argument_2_value = {
             "echo": Main.logger().level == logging.DEBUG,
             "max_overflow": max_overflow,
             "pool_pre_ping": True,
-            "pool_size": SnowflakeDestination._DEFAULT_MINIMUM_POOL_SIZE
+            "pool_size": SnowflakeRegistry.DEFAULT_MINIMUM_POOL_SIZE
         }
-        self._connection_pool = create_engine(url, **connection_argument_2_value)
-        self._table = self._load_table(table_name)
+        return create_engine(url, **connection_argument_2_value)
+
+    @staticmethod
+    def _reflect_table(engine, schema_name, table_name):
+        """Reflects the table metadata"""
+        with DatabaseConnectionContextManager(engine) as manager:
+            connection = manager.connection()
+            return Table(table_name, MetaData(), schema=schema_name, autoload_with=connection)
+
+    def dispose(self):
+        """Disposes all of the engines"""
+        with self._lock:
+            engines = [engine for _, engine in self._key_2_engine.values()]
+            self._key_2_engine.clear()
+            self._key_2_table.clear()
+        for engine in engines:
+            engine.dispose()
+
+    def engine(self, snowflake_destination, catalog_name):
+        """Returns the engine key and the engine of the destination, creating the engine if needed"""
+        key = (
+            snowflake_destination.account, catalog_name, snowflake_destination.role, snowflake_destination.user,
+            snowflake_destination.warehouse)
+        stale_engine = None
+        with self._lock:
+            password, engine = self._key_2_engine.get(key, (None, None))
+            if engine is None or password != snowflake_destination.password:
+                stale_engine = engine
+                engine = _SnowflakeRegistryImpl._create_engine(snowflake_destination, catalog_name)
+                self._key_2_engine[key] = (snowflake_destination.password, engine)
+        if stale_engine:
+            stale_engine.dispose()
+        return key, engine
+
+    def invalidate_table(self, engine_key, schema_name, table_name):
+        """Drops the cached table metadata, so the next use reflects it again"""
+        with self._lock:
+            self._key_2_table.pop((engine_key, schema_name, table_name), None)
+
+    def stage_loader(self):
+        """Returns the bulk loader, or None if the bulk load path is disabled"""
+        return self._stage_loader
+
+    def table(self, engine_key, engine, schema_name, table_name):
+        """Returns the table metadata, reflecting it if it is not cached or if it has expired"""
+        key = (engine_key, schema_name, table_name)
+        now = time.monotonic()
+        with self._lock:
+            expiration_time, table = self._key_2_table.get(key, (0, None))
+        if table is not None and expiration_time > now:
+            return table
+        table = _SnowflakeRegistryImpl._reflect_table(engine, schema_name, table_name)
+        with self._lock:
+            self._key_2_table[key] = (now + self._table_ttl_in_seconds, table)
+        return table
+
+
+class SnowflakeRegistry:
+    """Implements a process-wide registry of the Snowflake engines, keyed by account, database, role, user and
+    warehouse, and of their reflected tables"""
+
+    DEFAULT_MAXIMUM_POOL_SIZE = 15
+    DEFAULT_MINIMUM_POOL_SIZE = 5
+    _DEFAULT_TABLE_TTL_IN_SECONDS = 300
+
+    _impl = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def finalize():
+        """Disposes all of the engines"""
+        with SnowflakeRegistry._lock:
+            impl, SnowflakeRegistry._impl = SnowflakeRegistry._impl, None
+        if impl:
+            impl.dispose()
+
+    @staticmethod
+    def initialize(configuration=None):
+        """Initializes the registry using the given configuration, falling back to the defaults for the missing
+        values"""
+        stage_loader = None
+        bulk_load_minimum_rows = getattr(configuration, "bulkLoadMinimumRows", None)
+        if bulk_load_minimum_rows:
+            stage_loader = SnowflakeStageLoader(
+                int(bulk_load_minimum_rows),
+                file_format=getattr(configuration, "bulkLoadFileFormat", SnowflakeStageLoader.CSV_FILE_FORMAT).lower(),
+                stage=getattr(configuration, "bulkLoadStage", SnowflakeStageLoader.TABLE_STAGE).lower(),
+                working_directory=getattr(configuration, "bulkLoadWorkingDirectory", None))
+        impl = _SnowflakeRegistryImpl(
+            float(getattr(configuration, "tableCacheTtlInSeconds", SnowflakeRegistry._DEFAULT_TABLE_TTL_IN_SECONDS)),
+            stage_loader=stage_loader)
+        with SnowflakeRegistry._lock:
+            previous_impl, SnowflakeRegistry._impl = SnowflakeRegistry._impl, impl
+        if previous_impl:
+            previous_impl.dispose()
+
+    @staticmethod
+    def instance():
+        """Returns the registry, initializing it with the defaults if it has not been initialized yet"""
+        with SnowflakeRegistry._lock:
+            if SnowflakeRegistry._impl is None:
+                SnowflakeRegistry._impl = _SnowflakeRegistryImpl(SnowflakeRegistry._DEFAULT_TABLE_TTL_IN_SECONDS)
+            return SnowflakeRegistry._impl
+
+
+class SnowflakeDestination(SafeContextManager, Service):
+    """Implements the Snowflake destination"""
+
+    def __init__(self, job_id, destination):
+        self._job_id = job_id
+        self._fully_qualified_table_name = destination.fullyQualifiedTableName
+        self._input_2_output = tuple(
+            (schema_mapping.input, schema_mapping.output) for schema_mapping in destination.schemaMapping)
+        catalog_name, self._schema_name, self._table_name = SnowflakeDestination.split_table_name(
+            destination.fullyQualifiedTableName)
+        self._registry = SnowflakeRegistry.instance()
+        self._engine_key, self._connection_pool = self._registry.engine(destination.snowflake, catalog_name)
+        self._table = self._registry.table(
+            self._engine_key, self._connection_pool, self._schema_name, self._table_name)
 
     def _exit(self):
         self.stop()
     
-    def _load_table(self, table_name):
-        """Loads the table metadata"""
-        with DatabaseConnectionContextManager(self._connection_pool) as manager:
-            connection = manager.connection()
-            metadata = MetaData(bind=connection)
-            Table(table_name, metadata, autoload=True, autoload_with=connection)
-        return metadata.tables[table_name]
-    
     @staticmethod
     def split_table_name(fully_qualified_table_name):
         """Splits the table name"""
@@ -68,20 +180,42 @@ class SnowflakeDestination(SafeContextManager, Service):
             catalog_name = ".".join(parts[:-2])
         return catalog_name, schema_name, table_name
     
+    def _insert_statement(self, columns):
+        """Returns the executemany-ready statement inserting the columns into the destination table"""
+        unknown_columns = [column for column in columns if column not in self._table.columns]
+        if unknown_columns:
+            raise ValueError(
+                f"the {', '.join(unknown_columns)} columns do not exist in the {self._fully_qualified_table_name} table")
+        return (
+            f"INSERT INTO {self._fully_qualified_table_name} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})")
+
+    def insert(self, columns, rows):
+        """Inserts the projected rows into the destination table, staging and copying them if the batch is large"""
+        stage_loader = self._registry.stage_loader()
+        try:
+            insert_statement = self._insert_statement(columns)
+            with DatabaseConnectionContextManager(self._connection_pool) as manager:
+                if stage_loader and stage_loader.is_applicable(rows):
+                    stage_loader.load(manager.connection(), self._fully_qualified_table_name, columns, rows)
+                    return
+                manager.connection().exec_driver_sql(insert_statement, rows)
+        except BaseException:
+            # the failure might be caused by a schema change, so the table is reflected again on the next use
+            self._registry.invalidate_table(self._engine_key, self._schema_name, self._table_name)
+            raise
+
+    def key(self):
+        """Returns the key identifying the destination table"""
+        return (self._engine_key, self._schema_name, self._table_name)
+
     def load(self, data):
         """Loads the data into the destination"""
-        descriptors = data.descriptors
-        values = []
-        for data_value in data.values:
-            value_mapping = {}
-            for index, value in enumerate(data_value):
-                column_name = self._input_schema_2_output_schema[descriptors[index]].lower()
-                value_mapping[column_name] = value
-            values.append(value_mapping)
-        with DatabaseConnectionContextManager(self._connection_pool) as manager:
-            manager.connection().execute(self._table.insert().values(values))
+        self.insert(*self.project(data))
+
+    def project(self, data):
+        """Projects the data onto the destination table columns, returning the column names and one tuple per row"""
+        return SchemaProjector.project_data(data, self._input_2_output)
 
     def stop(self):
-        if not self._connection_pool:
-            return
-        self._connection_pool.dispose()
+        """Stops the destination; the engine is owned by the registry, so it stays warm for the next pages"""
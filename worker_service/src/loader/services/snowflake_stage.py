@@ -0,0 +1,106 @@
+"""Implements the stage-and-COPY bulk load path of the Snowflake destination"""
+
+import csv
+import gzip
+import os
+import tempfile
+import uuid
+
+from common.file_system import resilient_remove
+from common.main import Main
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # the Parquet file format is only available when pyarrow is installed
+    pyarrow = None
+
+
+class SnowflakeStageLoader:
+    """Loads the rows by writing them into a compressed local file, uploading the file to a stage and copying it into
+    the table"""
+
+    CSV_FILE_FORMAT = "csv"
+    PARQUET_FILE_FORMAT = "parquet"
+    TABLE_STAGE = "table"
+    USER_STAGE = "user"
+
+    _CSV_NULL = "\\N"
+    _STAGE_PREFIX = "pricer"
+
+    def __init__(self, minimum_rows, file_format=CSV_FILE_FORMAT, stage=TABLE_STAGE, working_directory=None):
+        if file_format not in (SnowflakeStageLoader.CSV_FILE_FORMAT, SnowflakeStageLoader.PARQUET_FILE_FORMAT):
+            raise ValueError(f"the '{file_format}' bulk load file format is not supported")
+        if file_format == SnowflakeStageLoader.PARQUET_FILE_FORMAT and pyarrow is None:
+            raise ValueError("the 'parquet' bulk load file format requires the 'pyarrow' package")
+        if stage not in (SnowflakeStageLoader.TABLE_STAGE, SnowflakeStageLoader.USER_STAGE):
+            raise ValueError(f"the '{stage}' bulk load stage is not supported")
+        self._file_format = file_format
+        self._minimum_rows = minimum_rows
+        self._stage = stage
+        self._working_directory = working_directory if working_directory else tempfile.gettempdir()
+
+    def copy_statement(self, fully_qualified_table_name, columns, stage_location, file_name):
+        """Returns the statement copying the staged file into the table"""
+        if self._file_format == SnowflakeStageLoader.PARQUET_FILE_FORMAT:
+            return (
+                f"COPY INTO {fully_qualified_table_name} FROM {stage_location}/{file_name} "
+                "FILE_FORMAT = (TYPE = PARQUET) MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE PURGE = TRUE "
+                "ON_ERROR = ABORT_STATEMENT")
+        # the empty fields are empty strings, as they are when inserted, the NULL values being written as \N
+        return (
+            f"COPY INTO {fully_qualified_table_name} ({', '.join(columns)}) FROM {stage_location}/{file_name} "
+            "FILE_FORMAT = (TYPE = CSV COMPRESSION = GZIP FIELD_OPTIONALLY_ENCLOSED_BY = '\"' "
+            "EMPTY_FIELD_AS_NULL = FALSE NULL_IF = ('\\\\N')) PURGE = TRUE ON_ERROR = ABORT_STATEMENT")
+
+    def file_name(self):
+        """Returns a unique name for the file to be staged"""
+        extension = "parquet" if self._file_format == SnowflakeStageLoader.PARQUET_FILE_FORMAT else "csv.gz"
+        return f"{uuid.uuid4().hex}.{extension}"
+
+    def is_applicable(self, rows):
+        """Returns True if the batch is large enough to be worth the staging round trips"""
+        return len(rows) >= self._minimum_rows
+
+    def load(self, connection, fully_qualified_table_name, columns, rows):
+        """Stages the rows, given as tuples of the columns, and copies them into the table using the given
+        connection"""
+        file_name = self.file_name()
+        file_path = os.path.join(self._working_directory, file_name)
+        stage_location = self.stage_location(fully_qualified_table_name)
+        try:
+            self.write_file(file_path, columns, rows)
+            Main.logger().debug(
+                "staging %d rows for the %s table at %s", len(rows), fully_qualified_table_name, stage_location)
+            connection.exec_driver_sql(self.put_statement(file_path, stage_location))
+            connection.exec_driver_sql(
+                self.copy_statement(fully_qualified_table_name, columns, stage_location, file_name))
+        finally:
+            resilient_remove(file_path)
+
+    def put_statement(self, file_path, stage_location):
+        """Returns the statement uploading the local file to the stage"""
+        source_compression = "GZIP" if self._file_format == SnowflakeStageLoader.CSV_FILE_FORMAT else "NONE"
+        return (
+            f"PUT 'file://{file_path}' {stage_location} AUTO_COMPRESS = FALSE "
+            f"SOURCE_COMPRESSION = {source_compression} OVERWRITE = TRUE")
+
+    def stage_location(self, fully_qualified_table_name):
+        """Returns the location the files of the table are staged at"""
+        if self._stage == SnowflakeStageLoader.USER_STAGE:
+            return f"@~/{SnowflakeStageLoader._STAGE_PREFIX}/{fully_qualified_table_name.lower()}"
+        parts = fully_qualified_table_name.split(".")
+        parts[-1] = f"%{parts[-1]}"
+        return f"@{'.'.join(parts)}/{SnowflakeStageLoader._STAGE_PREFIX}"
+
+    def write_file(self, file_path, columns, rows):
+        """Writes the rows into the compressed local file"""
+        if self._file_format == SnowflakeStageLoader.PARQUET_FILE_FORMAT:
+            table = pyarrow.table(dict(zip(columns, map(list, zip(*rows)))) if rows else {})
+            pyarrow.parquet.write_table(table, file_path, compression="snappy")
+            return
+        csv_null = SnowflakeStageLoader._CSV_NULL
+        with gzip.open(file_path, "wt", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            for row in rows:
+                writer.writerow([csv_null if value is None else value for value in row])
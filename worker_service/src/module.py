@@ -3,33 +3,118 @@
 import os
 
 from common.json_loader import RecursiveNamespace
+from common.models import KafkaConfiguration
 from extractor.manager import ExtractorServiceManager
 from health.controller import HealthServiceController
 from health.manager import HealthServiceManager
 from loader.manager import LoaderServiceManager
+from pipeline.manager import PipelineServiceManager
 from rest_server.module import BaseModule
 
 class WorkerModule(BaseModule):
     """Module class for extractor service"""
 
+    @staticmethod
+    def _optional_environment_variables(key_2_environment_variable):
+        """Returns the values of the environment variables that are set, converted to the given types"""
+        key_2_value = {}
+        for key, (environment_variable, value_type) in key_2_environment_variable.items():
+            value = os.environ.get(environment_variable)
+            if value:
+                key_2_value[key] = value_type(value)
+        return key_2_value
+
     def initialize(self):
         """Initializes the extractor module"""
         running_mode = os.environ["RUNNING_MODE"]
         configuration_as_dict = {
-            "kafkaSourceConfiguration": {
+            "claimCheckConfiguration": WorkerModule._optional_environment_variables({
+                "directory": ("CLAIM_CHECK_DIRECTORY", str),
+                "thresholdInBytes": ("CLAIM_CHECK_THRESHOLD_IN_BYTES", int)
+            }),
+            "kafkaSourceConfiguration": KafkaConfiguration.from_dict({
                 "bootstrapServers": [str(os.environ["SOURCE_BOOTSTRAP_SERVER"])],
                 "group": str(os.environ["SOURCE_GROUP"]),
-                "topic": str(os.environ["SOURCE_TOPIC"])
-            }
+                "topic": str(os.environ["SOURCE_TOPIC"]),
+                **WorkerModule._optional_environment_variables({
+                    "batchSize": ("SOURCE_BATCH_SIZE", int),
+                    "batchTimeoutInSeconds": ("SOURCE_BATCH_TIMEOUT_IN_SECONDS", float),
+                    "commitIntervalInSeconds": ("SOURCE_COMMIT_INTERVAL_IN_SECONDS", float),
+                    "deadLetterTopic": ("SOURCE_DEAD_LETTER_TOPIC", str),
+                    "drainTimeoutInSeconds": ("SOURCE_DRAIN_TIMEOUT_IN_SECONDS", float),
+                    "instanceId": ("SOURCE_INSTANCE_ID", str),
+                    "poolKind": ("SOURCE_POOL_KIND", str),
+                    "partitions": ("SOURCE_PARTITIONS", int),
+                    "poolSize": ("SOURCE_POOL_SIZE", int),
+                    "queueSize": ("SOURCE_QUEUE_SIZE", int),
+                    "replicationFactor": ("SOURCE_REPLICATION_FACTOR", int),
+                    # the comma-separated delays of the successive retry topics, e.g. "10,60,600"
+                    "retryDelaysInSeconds": (
+                        "SOURCE_RETRY_DELAYS_IN_SECONDS", lambda value: [float(delay) for delay in value.split(",")]),
+                    "routing": ("SOURCE_ROUTING", str)
+                })
+            })
         }
+        manifest_topic = os.environ.get("MANIFEST_TOPIC")
+        if manifest_topic:
+            # the destination of each job is published once to this compacted topic, keyed by the job ID
+            bootstrap_server = os.environ[
+                "SINK_BOOTSTRAP_SERVER" if running_mode == "extractor" else "SOURCE_BOOTSTRAP_SERVER"]
+            configuration_as_dict["manifestConfiguration"] = KafkaConfiguration.from_dict({
+                "bootstrapServers": [str(bootstrap_server)],
+                "group": str(os.environ["SOURCE_GROUP"]),
+                "topic": manifest_topic,
+                **WorkerModule._optional_environment_variables({
+                    "partitions": ("MANIFEST_PARTITIONS", int),
+                    "replicationFactor": ("MANIFEST_REPLICATION_FACTOR", int)
+                })
+            })
         if running_mode == "extractor":
-            configuration_as_dict["kafkaSinkConfiguration"] = {
+            configuration_as_dict["kafkaSinkConfiguration"] = KafkaConfiguration.from_dict({
                 "bootstrapServers": [str(os.environ["SINK_BOOTSTRAP_SERVER"])],
-                "topic": str(os.environ["SINK_TOPIC"])
-            }
+                "topic": str(os.environ["SINK_TOPIC"]),
+                **WorkerModule._optional_environment_variables({
+                    "batchSizeInBytes": ("SINK_BATCH_SIZE_IN_BYTES", int),
+                    "compression": ("SINK_COMPRESSION", str),
+                    "keyField": ("SINK_KEY_FIELD", str),
+                    "lingerInMilliseconds": ("SINK_LINGER_IN_MILLISECONDS", int),
+                    "maximumBufferedMessages": ("SINK_MAXIMUM_BUFFERED_MESSAGES", int),
+                    "partitions": ("SINK_PARTITIONS", int),
+                    "replicationFactor": ("SINK_REPLICATION_FACTOR", int),
+                    "wireFormat": ("SINK_WIRE_FORMAT", str)
+                })
+            })
+        if running_mode in ("extractor", "pipeline"):
+            configuration_as_dict["restClientConfiguration"] = WorkerModule._optional_environment_variables({
+                "connectTimeoutInSeconds": ("REST_CONNECT_TIMEOUT_IN_SECONDS", float),
+                "dnsCacheTtlInSeconds": ("REST_DNS_CACHE_TTL_IN_SECONDS", float),
+                "poolSize": ("REST_POOL_SIZE", int),
+                "readTimeoutInSeconds": ("REST_READ_TIMEOUT_IN_SECONDS", float)
+            })
+        if running_mode == "pipeline":
+            # the extracted pages are handed over to the loading stage through a bounded in-process queue
+            configuration_as_dict["pipelineConfiguration"] = WorkerModule._optional_environment_variables({
+                "queueSize": ("PIPELINE_QUEUE_SIZE", int)
+            })
+        if running_mode in ("loader", "pipeline"):
+            configuration_as_dict["destinationConfiguration"] = WorkerModule._optional_environment_variables({
+                "batchMaximumBytes": ("DESTINATION_BATCH_MAXIMUM_BYTES", int),
+                "batchMaximumLatencyInSeconds": ("DESTINATION_BATCH_MAXIMUM_LATENCY_IN_SECONDS", float),
+                "batchMaximumRows": ("DESTINATION_BATCH_MAXIMUM_ROWS", int),
+                "bulkLoadFileFormat": ("DESTINATION_BULK_LOAD_FILE_FORMAT", str),
+                "bulkLoadMinimumRows": ("DESTINATION_BULK_LOAD_MINIMUM_ROWS", int),
+                "bulkLoadStage": ("DESTINATION_BULK_LOAD_STAGE", str),
+                "bulkLoadWorkingDirectory": ("DESTINATION_BULK_LOAD_WORKING_DIRECTORY", str),
+                # how long a message of a job waits for the manifest of the job, blocking its processing lane
+                "manifestTimeoutInSeconds": ("DESTINATION_MANIFEST_TIMEOUT_IN_SECONDS", float),
+                "tableCacheTtlInSeconds": ("DESTINATION_TABLE_CACHE_TTL_IN_SECONDS", float)
+            })
         configuration = RecursiveNamespace.map_entry(configuration_as_dict)
         self.add_controller(HealthServiceController, HealthServiceManager())
         if running_mode == "extractor":
             self.add_service_manager(ExtractorServiceManager(configuration))
             return
+        if running_mode == "pipeline":
+            self.add_service_manager(PipelineServiceManager(configuration))
+            return
         self.add_service_manager(LoaderServiceManager(configuration))
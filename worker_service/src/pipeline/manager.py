@@ -0,0 +1,181 @@
+"""Implements pipeline service manager"""
+
+import queue
+import threading
+import time
+
+from common.consumer_pool import ConsumerPool
+from common.exception import ExceptionUtilities
+from common.kafka import KafkaSource
+from common.main import Main
+from common.models import ExtractionOutput, Job
+from common.rest import RestSessionPool
+from extractor.manager import ExtractorServiceManager
+from loader.manager import LoaderServiceManager
+from loader.services.snowflake import SnowflakeRegistry
+
+
+class _JobProgress:
+    """Tracks the pages of a job being loaded; the job record is acknowledged once all of its pages have been loaded,
+    or failed once they have all been handled if the extraction or the loading of any of them failed"""
+
+    __slots__ = ("_completed", "_exception", "_extracted", "_lock", "_pending_page_count", "_record")
+
+    def __init__(self, record):
+        self._completed = False
+        self._exception = None
+        self._extracted = False
+        self._lock = threading.Lock()
+        self._pending_page_count = 0
+        self._record = record
+
+    def _complete_if_done(self):
+        """Acknowledges or fails the job record once its extraction is over and all of its pages have been handled"""
+        with self._lock:
+            if self._completed or not self._extracted or self._pending_page_count > 0:
+                return
+            self._completed = True
+            exception = self._exception
+        if exception is None:
+            self._record.acknowledge()
+        else:
+            self._record.fail(exception)
+
+    def add_page(self):
+        """Registers a page handed over to the loading stage"""
+        with self._lock:
+            self._pending_page_count += 1
+
+    def on_extracted(self, exception=None):
+        """Reports the end of the extraction of the job, and its error if it failed"""
+        with self._lock:
+            self._extracted = True
+            if self._exception is None:
+                self._exception = exception
+        self._complete_if_done()
+
+    def on_page_handled(self, exception=None):
+        """Reports that a page has been loaded, or that it failed to be"""
+        with self._lock:
+            self._pending_page_count -= 1
+            if self._exception is None:
+                self._exception = exception
+        self._complete_if_done()
+
+
+class _PageRecord:
+    """Represents an extracted page handed over to the loading stage, whose outcome is reported to its job"""
+
+    __slots__ = ("_job_progress", "size", "value")
+
+    def __init__(self, job_progress, value, size):
+        self._job_progress = job_progress
+        self.size = size
+        self.value = value
+
+    def acknowledge(self):
+        """Reports that the page has been loaded"""
+        self._job_progress.on_page_handled()
+
+    def fail(self, exception):
+        """Reports that the page could not be loaded"""
+        self._job_progress.on_page_handled(exception)
+
+
+class PipelineServiceManager(LoaderServiceManager):
+
+    """Implements pipeline service manager, which chains the extraction and the loading of the jobs within a single
+    process: the extracted pages flow through a bounded queue straight into the loading stage, without being
+    serialized nor going through a broker; a full queue blocks the extraction, which in turn pauses the consumption
+    of the jobs"""
+
+    DEFAULT_QUEUE_SIZE = 64
+
+    _LOADING_POLL_TIMEOUT_IN_SECONDS = 1.0
+
+    def __init__(self, configuration):
+        super().__init__(configuration)
+        self._loading_thread = None
+        self._page_queue = None
+        self._pipeline_configuration = getattr(configuration, "pipelineConfiguration", None)
+        self._rest_client_configuration = getattr(configuration, "restClientConfiguration", None)
+        self._stopped = threading.Event()
+
+    def _drain_pages(self):
+        """Waits for the queued pages to be handed over to the loading stage, then flushes their buffered rows, so
+        that their jobs are acknowledged before the offsets are committed"""
+        self._page_queue.join()
+        self._table_batcher.flush_all()
+
+    def _load_pages(self):
+        """Hands the queued pages over to the loading stage, as they would be by the Kafka source of the loader,
+        until the pipeline is stopped"""
+        while not self._stopped.is_set():
+            try:
+                records = [self._page_queue.get(timeout=PipelineServiceManager._LOADING_POLL_TIMEOUT_IN_SECONDS)]
+            except queue.Empty:
+                records = []
+            while records:
+                try:
+                    records.append(self._page_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if records:
+                    self._on_messages_received(records)
+                self._table_batcher.flush_expired()
+            except BaseException as ex:
+                Main.logger().error("failed to load the extracted pages, details: %s", ExceptionUtilities.message(ex))
+            finally:
+                for _ in records:
+                    self._page_queue.task_done()
+
+    def _on_jobs_received(self, records):
+        for record in records:
+            job = record.value
+            job_progress = _JobProgress(record)
+            try:
+                for data in ExtractorServiceManager.iter_pages(job):
+                    if not data:
+                        continue
+                    # the destination of the job is parsed once, and shared by all of its pages
+                    page = ExtractionOutput.from_dict(
+                        {"data": data, "destination": job.destination, "jobId": job.jobId})
+                    job_progress.add_page()
+                    # blocks while the loading stage is behind; the batching thresholds account for the page size
+                    self._page_queue.put(_PageRecord(job_progress, page, data.estimated_size()))
+            except BaseException as ex:
+                Main.logger().error(
+                    "failed to extract the data of the %s job, details: %s", job.jobId, ExceptionUtilities.message(ex))
+                job_progress.on_extracted(ex)
+                continue
+            job_progress.on_extracted()
+
+    def prepare(self):
+        """Prepares the service manager"""
+        if self._kafka_source_configuration.poolKind == ConsumerPool.PROCESS_KIND:
+            # the pages are handed over to the loading stage through an in-process queue
+            raise ValueError("the pipeline does not support the 'process' pool kind")
+        time.sleep(15)
+        RestSessionPool.initialize(self._rest_client_configuration)
+        self._prepare_loading()
+        self._page_queue = queue.Queue(maxsize=int(getattr(
+            self._pipeline_configuration, "queueSize", PipelineServiceManager.DEFAULT_QUEUE_SIZE)))
+        self._loading_thread = threading.Thread(target=self._load_pages, name="pipeline-loader")
+        self._kafka_source = KafkaSource(
+            self._kafka_source_configuration, deserializer=Job.loads, batch_handler=self._on_jobs_received,
+            flush_handler=self._drain_pages)
+
+    def start(self):
+        """Starts the service manager"""
+        self._loading_thread.start()
+        self._kafka_source.start()
+
+    def stop(self):
+        """Stops the service manager"""
+        # the source drains the jobs being extracted and their queued pages before it commits its offsets
+        self._kafka_source.stop()
+        self._stopped.set()
+        self._loading_thread.join()
+        RestSessionPool.finalize()
+        SnowflakeRegistry.finalize()
@@ -0,0 +1,13 @@
+"""Configures the test session of the worker service"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from common.main import Main  # pylint: disable=wrong-import-position
+
+# a manual script producing a job into a live cluster rather than a test
+collect_ignore = ["test_shopify.py"]
+
+Main.initialize("worker_service_test")
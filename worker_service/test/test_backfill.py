@@ -0,0 +1,87 @@
+"""Tests the backfill command running the jobs outside of the services"""
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from cli import backfill
+from common.columnar import ColumnarBatch
+from common.json_loader import JsonLoader
+from extractor.manager import ExtractorServiceManager
+
+
+class BackfillTest(unittest.TestCase):
+    """Tests that the pages of a job are loaded into its destination and summarized"""
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _job_entry(self):
+        return {
+            "destination": {
+                "file": {"directory": self._directory}, "fullyQualifiedTableName": "DB.SCHEMA.PRODUCTS",
+                "schemaMapping": [{"input": "CODE", "output": "code"}, {"input": "PRICE", "output": "price"}],
+                "type": "file"},
+            "jobId": "job-1",
+            "source": {
+                "schemaMapping": [{"input": "code", "output": "CODE"}, {"input": "price", "output": "PRICE"}],
+                "shopify": {"urls": ["https://shop.example"]}, "type": "shopify"}
+        }
+
+    def _written_rows(self):
+        rows = []
+        for path in glob.glob(os.path.join(self._directory, "DB.SCHEMA.PRODUCTS", "*.jsonl")):
+            with open(path, "rb") as file:
+                rows.extend(JsonLoader.loads_raw(line) for line in file)
+        return rows
+
+    @staticmethod
+    def _pages():
+        # the sources describe their columns with lists as well as tuples
+        yield ColumnarBatch(["CODE", "NAME", "PRICE"], [["a", "b"], ["A", "B"], ["1.50", "2.00"]])
+        yield ColumnarBatch(["CODE", "NAME", "PRICE"])
+        yield ColumnarBatch(("CODE", "NAME", "PRICE"), [["c"], ["C"], [None]])
+
+    @staticmethod
+    def _failing_pages():
+        yield ColumnarBatch(["CODE", "NAME", "PRICE"], [["a"], ["A"], ["1.50"]])
+        raise ValueError("the store is unavailable")
+
+    def test_pages_are_loaded_and_summarized(self):
+        with mock.patch.object(ExtractorServiceManager, "iter_pages", return_value=BackfillTest._pages()):
+            job_summary = backfill.run_job(self._job_entry())
+        self.assertEqual(job_summary["status"], backfill.SUCCEEDED_STATUS)
+        self.assertIsNone(job_summary["error"])
+        self.assertEqual((job_summary["pages"], job_summary["rows"]), (2, 3))
+        self.assertEqual(
+            self._written_rows(),
+            [{"code": "a", "price": "1.50"}, {"code": "b", "price": "2.00"}, {"code": "c", "price": None}])
+
+    def test_rows_extracted_before_a_failure_are_loaded(self):
+        with mock.patch.object(ExtractorServiceManager, "iter_pages", return_value=BackfillTest._failing_pages()):
+            job_summary = backfill.run_job(self._job_entry())
+        self.assertEqual(job_summary["status"], backfill.FAILED_STATUS)
+        self.assertEqual(job_summary["error"], "the store is unavailable")
+        self.assertEqual((job_summary["pages"], job_summary["rows"]), (1, 1))
+        self.assertEqual(self._written_rows(), [{"code": "a", "price": "1.50"}])
+
+    def test_jobs_are_redirected_to_the_output_directory(self):
+        jobs_path = os.path.join(self._directory, "jobs.jsonl")
+        with open(jobs_path, "wb") as file:
+            file.write(JsonLoader.dumps(self._job_entry()) + b"\n\n{\"jobId\": \"job-2\"}\n")
+        job_entries, job_summaries = backfill._read_jobs(  # pylint: disable=protected-access
+            jobs_path, output_directory=os.path.join(self._directory, "output"))
+        self.assertEqual(
+            job_entries[0]["destination"]["file"], {"directory": os.path.join(self._directory, "output")})
+        self.assertEqual(len(job_summaries), 1)
+        self.assertEqual(job_summaries[0]["status"], backfill.FAILED_STATUS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""Tests the micro-batching of the rows to be loaded"""
+
+import unittest
+from unittest import mock
+
+from loader import batcher
+from loader.batcher import TableBatcher
+
+
+class _Destination:
+    """Records the inserted rows, failing the inserts if requested"""
+
+    def __init__(self, name, failing=False):
+        self._failing = failing
+        self._name = name
+        self.inserts = []
+
+    def insert(self, columns, rows):
+        if self._failing:
+            raise RuntimeError("the table cannot be written")
+        self.inserts.append((columns, list(rows)))
+
+    def key(self):
+        return ("fake", self._name)
+
+
+class _Record:
+    """Records its acknowledgement or its failure"""
+
+    def __init__(self, size=1):
+        self.acknowledged = False
+        self.exception = None
+        self.size = size
+
+    def acknowledge(self):
+        self.acknowledged = True
+
+    def fail(self, exception):
+        self.exception = exception
+
+
+class _Clock:
+    """Stands in for the monotonic clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class TableBatcherTest(unittest.TestCase):
+    """Tests the flush thresholds and the acknowledgement of the records once their rows are written"""
+
+    def test_rows_are_flushed_at_the_row_threshold(self):
+        table_batcher = TableBatcher(maximum_rows=3)
+        destination = _Destination("products")
+        first_record, second_record = _Record(), _Record()
+        table_batcher.add(destination, ("code",), [("a",), ("b",)], first_record)
+        self.assertEqual(destination.inserts, [])
+        self.assertFalse(first_record.acknowledged)
+        table_batcher.add(destination, ("code",), [("c",)], second_record)
+        self.assertEqual(destination.inserts, [(("code",), [("a",), ("b",), ("c",)])])
+        self.assertTrue(first_record.acknowledged and second_record.acknowledged)
+
+    def test_rows_are_flushed_at_the_byte_threshold(self):
+        table_batcher = TableBatcher(maximum_bytes=100)
+        destination = _Destination("products")
+        table_batcher.add(destination, ("code",), [("a",)], _Record(size=60))
+        self.assertEqual(destination.inserts, [])
+        table_batcher.add(destination, ("code",), [("b",)], _Record(size=40))
+        self.assertEqual(destination.inserts, [(("code",), [("a",), ("b",)])])
+
+    def test_rows_are_flushed_once_expired(self):
+        clock = _Clock()
+        with mock.patch.object(batcher, "time", clock):
+            table_batcher = TableBatcher(maximum_latency_in_seconds=5.0)
+            destination = _Destination("products")
+            record = _Record()
+            table_batcher.add(destination, ("code",), [("a",)], record)
+            clock.now += 4.0
+            table_batcher.flush_expired()
+            self.assertEqual(destination.inserts, [])
+            self.assertFalse(record.acknowledged)
+            clock.now += 1.0
+            table_batcher.flush_expired()
+        self.assertEqual(destination.inserts, [(("code",), [("a",)])])
+        self.assertTrue(record.acknowledged)
+
+    def test_records_are_acknowledged_in_consumption_order(self):
+        table_batcher = TableBatcher(maximum_rows=2)
+        products, prices = _Destination("products"), _Destination("prices")
+        first_record, second_record, third_record = _Record(), _Record(), _Record()
+        table_batcher.add(products, ("code",), [("a",)], first_record)
+        table_batcher.add(prices, ("price",), [(1.5,), (2.5,)], second_record)
+        # the rows of the second record are written, but it waits for the first record
+        self.assertEqual(prices.inserts, [(("price",), [(1.5,), (2.5,)])])
+        self.assertEqual((first_record.acknowledged, second_record.acknowledged), (False, False))
+        # and so does a record without rows
+        table_batcher.add(products, ("code",), [], third_record)
+        self.assertFalse(third_record.acknowledged)
+        table_batcher.flush_all()
+        self.assertTrue(first_record.acknowledged and second_record.acknowledged and third_record.acknowledged)
+
+    def test_records_are_failed_rather_than_acknowledged_on_write_failure(self):
+        table_batcher = TableBatcher()
+        products, prices = _Destination("products", failing=True), _Destination("prices")
+        failed_record, acknowledged_record = _Record(), _Record()
+        table_batcher.add(products, ("code",), [("a",)], failed_record)
+        table_batcher.add(prices, ("price",), [(1.5,)], acknowledged_record)
+        table_batcher.flush_all()
+        self.assertFalse(failed_record.acknowledged)
+        self.assertIsInstance(failed_record.exception, RuntimeError)
+        # the failed write does not hold back the records of the other tables
+        self.assertTrue(acknowledged_record.acknowledged)
+        self.assertEqual(prices.inserts, [(("price",), [(1.5,)])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""Tests the pool of workers handling the consumed messages"""
+
+import os
+import threading
+import time
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from common.consumer_pool import ConsumerPool, handle_in_worker_process
+from common.json_loader import RecursiveNamespace
+from common.models import KafkaConfiguration
+from extractor import manager
+from extractor.manager import ExtractorServiceManager, _initialize_worker_process
+
+
+def _initialize_suffixing_worker(worker_configuration):
+    """Returns a handler acknowledging the records whose values are strings and failing the others"""
+    parent_pid = worker_configuration["parentPid"]
+
+    def _handle(records):
+        for record in records:
+            if os.getpid() == parent_pid:
+                record.fail(RuntimeError("the record was handled in the parent process"))
+            elif isinstance(record.value, str):
+                record.acknowledge()
+            else:
+                record.fail(ValueError(f"{record.value!r} is not a string"))
+
+    return _handle
+
+
+def _initialize_sleeping_worker(_):
+    """Returns a handler which never returns in time"""
+    return lambda _: time.sleep(60)
+
+
+def _initialize_failing_worker(_):
+    raise RuntimeError("the worker cannot be initialized")
+
+
+class ConsumerPoolTest(unittest.TestCase):
+    """Tests the thread and process kinds of the consumer pool"""
+
+    def test_thread_pool_capacity(self):
+        consumer_pool = ConsumerPool(1, maximum_queued_tasks=1)
+        try:
+            self.assertTrue(consumer_pool.is_idle())
+            future = consumer_pool.submit(0, lambda: 1)
+            self.assertEqual(future.result(), 1)
+        finally:
+            consumer_pool.shutdown()
+        self.assertTrue(consumer_pool.is_idle())
+
+    def test_thread_pool_abandons_the_running_tasks_past_the_timeout(self):
+        consumer_pool = ConsumerPool(2)
+        started = threading.Event()
+        released = threading.Event()
+
+        def _wait_for_release():
+            started.set()
+            return released.wait()
+
+        running_future = consumer_pool.submit(0, _wait_for_release)
+        queued_future = consumer_pool.submit(0, lambda: 1)
+        started.wait(5.0)
+        start_time = time.monotonic()
+        self.assertFalse(consumer_pool.shutdown(cancel_queued_tasks=True, timeout_in_seconds=0.2))
+        self.assertLess(time.monotonic() - start_time, 5.0)
+        self.assertTrue(queued_future.cancelled())
+        # the abandoned lane runs on a daemon thread, which does not keep the process alive
+        self.assertTrue(all(
+            thread.daemon for thread in threading.enumerate() if thread.name.startswith("consumer-worker-")))
+        released.set()
+        self.assertTrue(running_future.result(timeout=5.0))
+
+    def test_process_pool_terminates_its_workers_past_the_timeout(self):
+        consumer_pool = ConsumerPool(1, kind=ConsumerPool.PROCESS_KIND, worker_initializer=_initialize_sleeping_worker)
+        future = consumer_pool.submit(0, handle_in_worker_process, ["a"])
+        deadline = time.monotonic() + 5.0
+        while not future.running() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        start_time = time.monotonic()
+        self.assertFalse(consumer_pool.shutdown(cancel_queued_tasks=True, timeout_in_seconds=0.2))
+        self.assertLess(time.monotonic() - start_time, 5.0)
+
+    def test_process_pool_spawns_its_workers_upfront(self):
+        consumer_pool = ConsumerPool(
+            2, kind=ConsumerPool.PROCESS_KIND, worker_initializer=_initialize_suffixing_worker,
+            worker_configuration={"parentPid": os.getpid()})
+        try:
+            # the initializer has already run, so the records are handled right away
+            future = consumer_pool.submit(consumer_pool.lane("key"), handle_in_worker_process, ["a", 1, "b"])
+            acknowledged_indexes, index_2_error = future.result(timeout=60)
+        finally:
+            consumer_pool.shutdown()
+        self.assertEqual(acknowledged_indexes, [0, 2])
+        self.assertEqual(index_2_error, {1: "ValueError: 1 is not a string"})
+
+    def test_process_pool_fails_on_failing_initializer(self):
+        with self.assertRaises(BrokenProcessPool):
+            ConsumerPool(1, kind=ConsumerPool.PROCESS_KIND, worker_initializer=_initialize_failing_worker)
+
+    @staticmethod
+    def _extractor_service_manager(pool_kind):
+        bootstrap_servers = ["memory://test-consumer-pool"]
+        return ExtractorServiceManager(RecursiveNamespace.map_entry({
+            "claimCheckConfiguration": {},
+            "kafkaSinkConfiguration": KafkaConfiguration.from_dict(
+                {"bootstrapServers": bootstrap_servers, "topic": "PAGES"}),
+            "kafkaSourceConfiguration": KafkaConfiguration.from_dict({
+                "bootstrapServers": bootstrap_servers, "group": "extractor", "poolKind": pool_kind,
+                "topic": "JOBS"}),
+            "restClientConfiguration": {"poolSize": 4}
+        }))
+
+    def test_process_pool_initializes_the_extractor_workers(self):
+        service_manager = self._extractor_service_manager(ConsumerPool.PROCESS_KIND)
+        # the configuration crosses the process boundary as plain values
+        consumer_pool = ConsumerPool(
+            1, kind=ConsumerPool.PROCESS_KIND, worker_initializer=_initialize_worker_process,
+            worker_configuration=service_manager._worker_process_configuration())  # pylint: disable=protected-access
+        try:
+            acknowledged_indexes, index_2_error = consumer_pool.submit(0, handle_in_worker_process, []).result(
+                timeout=60)
+        finally:
+            consumer_pool.shutdown()
+        self.assertEqual((acknowledged_indexes, index_2_error), ([], {}))
+
+    @mock.patch.object(manager, "time")
+    def test_extractor_opens_its_producers_in_the_process_handling_the_jobs(self, _):
+        for pool_kind, sink_count in ((ConsumerPool.PROCESS_KIND, 0), (ConsumerPool.THREAD_KIND, 1)):
+            with self.subTest(pool_kind=pool_kind), mock.patch.object(manager, "KafkaSink") as kafka_sink:
+                service_manager = self._extractor_service_manager(pool_kind)
+                service_manager.prepare()
+                service_manager.start()
+                service_manager.stop()
+                # the worker processes open their producers in their initializer, rather than the parent process
+                self.assertEqual(kafka_sink.call_count, sink_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
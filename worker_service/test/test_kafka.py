@@ -0,0 +1,287 @@
+"""Tests the Kafka source against the in-memory broker"""
+
+import threading
+import time
+import unittest
+import uuid
+
+from unittest import mock
+
+from confluent_kafka import KafkaError, TopicPartition
+
+from common.consumer_pool import ConsumerPool
+from common.kafka import KafkaSink, KafkaSource, KafkaTransport, _OffsetTracker
+from common.memory_broker import MemoryBroker, MemoryConsumer, MemoryMessage
+from common.models import KafkaConfiguration
+
+_TIMEOUT_IN_SECONDS = 10.0
+
+
+class KafkaSourceTest(unittest.TestCase):
+    """Tests the handling, the acknowledgement and the commit of the consumed records"""
+
+    def setUp(self):
+        self._broker_name = f"test-kafka-{uuid.uuid4().hex}"
+        self._bootstrap_servers = [f"memory://{self._broker_name}"]
+        self._buffered_records = []
+        self._handled_values = []
+        self._lock = threading.Lock()
+
+    def tearDown(self):
+        MemoryBroker.remove(self._broker_name)
+
+    def _configuration(self, **entry):
+        return KafkaConfiguration.from_dict({
+            "bootstrapServers": self._bootstrap_servers, "group": "workers", "partitions": 1, "topic": "JOBS",
+            **entry})
+
+    def _produce(self, values, topic="JOBS"):
+        sink = KafkaSink(self._configuration(topic=topic))
+        sink.send_message(values)
+        sink.flush()
+
+    def _consume_remaining_values(self, topic="JOBS"):
+        """Returns the values the group has not committed yet, consuming them as a new member of the group"""
+        consumer = KafkaTransport.consumer({
+            "auto.offset.reset": "earliest", "bootstrap.servers": self._bootstrap_servers[0], "group.id": "workers"})
+        consumer.subscribe([topic])
+        messages = consumer.consume(100, 0.5)
+        consumer.close()
+        return [message.value() for message in messages]
+
+    def _record_handled(self, values):
+        with self._lock:
+            self._handled_values.extend(values)
+
+    def _run_until_handled(self, source, count):
+        source.start()
+        deadline = time.monotonic() + _TIMEOUT_IN_SECONDS
+        try:
+            while time.monotonic() < deadline:
+                with self._lock:
+                    if len(self._handled_values) >= count:
+                        return
+                time.sleep(0.01)
+            self.fail(f"{count} records were not handled within {_TIMEOUT_IN_SECONDS} seconds")
+        finally:
+            source.stop()
+
+    def _handle_message(self, record):
+        self._record_handled([record.value])
+        if record.value == "bad":
+            raise ValueError("the record cannot be handled")
+        record.acknowledge()
+
+    def _buffer_message(self, record):
+        """Keeps the record unacknowledged until the flush handler runs, as the loader batches its rows"""
+        with self._lock:
+            self._buffered_records.append(record)
+        self._record_handled([record.value])
+
+    def _flush_buffered_records(self):
+        with self._lock:
+            buffered_records, self._buffered_records = self._buffered_records, []
+        for record in buffered_records:
+            record.acknowledge()
+
+    def _handle_batch(self, records):
+        self._record_handled([record.value for record in records])
+        raise ValueError("the batch cannot be handled")
+
+    def test_acknowledged_records_are_committed(self):
+        self._produce([b'"a"', b'"b"', b'"c"'])
+        self._run_until_handled(KafkaSource(self._configuration(), message_handler=self._handle_message), 3)
+        self.assertEqual(self._handled_values, ["a", "b", "c"])
+        self.assertEqual(self._consume_remaining_values(), [])
+
+    def test_failed_record_is_skipped_without_dead_letter_topic(self):
+        self._produce([b'"a"', b'"bad"', b'"c"'])
+        self._run_until_handled(KafkaSource(self._configuration(), message_handler=self._handle_message), 3)
+        # the failed record does not hold back the commit of the following ones
+        self.assertEqual(self._consume_remaining_values(), [])
+
+    def test_messages_without_value_are_skipped(self):
+        producer = KafkaTransport.producer({"bootstrap.servers": self._bootstrap_servers[0]})
+        producer.produce("JOBS", None, key=b"job-1")
+        producer.produce("JOBS", b"")
+        producer.flush()
+        self._produce([b'"a"'])
+        self._run_until_handled(KafkaSource(self._configuration(), message_handler=self._handle_message), 1)
+        self.assertEqual(self._handled_values, ["a"])
+        self.assertEqual(self._consume_remaining_values(), [])
+
+    def test_key_routing_falls_back_to_the_partition_of_the_unkeyed_records(self):
+        MemoryBroker.named(self._broker_name).create_topic("JOBS", 2)
+        producer = KafkaTransport.producer({"bootstrap.servers": self._bootstrap_servers[0]})
+        for index in range(8):
+            producer.produce("JOBS", f'"{index}"', key=f"job-{index}" if index % 2 else None)
+        producer.flush()
+        lanes = []
+
+        def _handle_message(record):
+            lanes.append((record.message.key(), record.partition, threading.current_thread().name))
+            self._handle_message(record)
+
+        self._run_until_handled(
+            KafkaSource(self._configuration(poolSize=4, routing="key"), message_handler=_handle_message), 8)
+        consumer_pool = ConsumerPool(4)
+        try:
+            for key, partition, thread_name in lanes:
+                routing_key = key if key is not None else ("JOBS", partition)
+                self.assertEqual(thread_name, f"consumer-worker-{consumer_pool.lane(routing_key)}")
+        finally:
+            consumer_pool.shutdown()
+
+    def _inject_error(self, error):
+        """Returns a consume method returning a message carrying the error once the first record has been handled"""
+        consume = MemoryConsumer.consume
+        injected = threading.Event()
+
+        def _consume(consumer, num_messages=1, timeout=-1):
+            if self._handled_values and not injected.is_set():
+                injected.set()
+                return [MemoryMessage("JOBS", 0, -1, None, None, None, error)]
+            return consume(consumer, num_messages, timeout)
+
+        return _consume
+
+    def test_non_fatal_consumer_error_is_skipped(self):
+        self._produce([b'"a"'])
+        with mock.patch.object(
+                MemoryConsumer, "consume", self._inject_error(KafkaError(KafkaError._TRANSPORT, "disconnected"))):
+            source = KafkaSource(self._configuration(), message_handler=self._handle_message)
+            source.start()
+            try:
+                deadline = time.monotonic() + _TIMEOUT_IN_SECONDS
+                while not self._handled_values and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self._produce([b'"b"'])
+                while len(self._handled_values) < 2 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            finally:
+                source.stop()
+        self.assertEqual(self._handled_values, ["a", "b"])
+        self.assertEqual(self._consume_remaining_values(), [])
+
+    def test_fatal_consumer_error_stops_the_source_after_draining(self):
+        self._produce([b'"a"'])
+        with mock.patch.object(
+                MemoryConsumer, "consume", self._inject_error(KafkaError(KafkaError._FATAL, "fenced", fatal=True))):
+            source = KafkaSource(self._configuration(), message_handler=self._handle_message)
+            consumer_thread = source._consumer_thread  # pylint: disable=protected-access
+            with mock.patch("threading.excepthook"):
+                source.start()
+                consumer_thread.join(_TIMEOUT_IN_SECONDS)
+            self.assertFalse(consumer_thread.is_alive())
+            # the consumer was closed as the thread ended, leaving its group
+            group = MemoryBroker.named(self._broker_name)._group("workers")  # pylint: disable=protected-access
+            self.assertFalse(group.members)
+            source.stop()
+        self.assertEqual(self._handled_values, ["a"])
+        self.assertEqual(self._consume_remaining_values(), [])
+
+    def test_stop_abandons_the_handling_past_the_drain_timeout(self):
+        self._produce([b'"a"'])
+        released = threading.Event()
+
+        def _handle_message(record):
+            self._record_handled([record.value])
+            released.wait()
+
+        source = KafkaSource(self._configuration(drainTimeoutInSeconds=0.2), message_handler=_handle_message)
+        try:
+            start_time = time.monotonic()
+            self._run_until_handled(source, 1)
+            self.assertLess(time.monotonic() - start_time, 5.0)
+            # the abandoned handling runs on a daemon thread, which does not keep the process alive
+            self.assertTrue(all(
+                thread.daemon for thread in threading.enumerate() if thread.name.startswith("consumer-worker-")))
+        finally:
+            released.set()
+        # the abandoned record is consumed again by the next owner of its partition
+        self.assertEqual(self._consume_remaining_values(), [b'"a"'])
+
+    def test_failing_batch_handler_fails_its_records(self):
+        self._produce([b'"a"', b'"b"'])
+        self._run_until_handled(
+            KafkaSource(self._configuration(batchSize=2), batch_handler=self._handle_batch), 2)
+        self.assertEqual(self._consume_remaining_values(), [])
+
+    def test_failing_batch_handler_routes_its_records_to_the_dead_letter_topic(self):
+        self._produce([b'"a"', b'"b"'])
+        self._run_until_handled(
+            KafkaSource(
+                self._configuration(batchSize=2, deadLetterTopic="JOBS-DLQ"), batch_handler=self._handle_batch), 2)
+        self.assertEqual(self._consume_remaining_values(), [])
+        self.assertEqual(
+            [message.value() for message in MemoryBroker.named(self._broker_name).messages("JOBS-DLQ")],
+            [b'"a"', b'"b"'])
+
+    def test_buffered_records_are_flushed_and_committed_on_stop(self):
+        self._produce([b'"a"', b'"b"'])
+        self._run_until_handled(
+            KafkaSource(
+                self._configuration(), message_handler=self._buffer_message,
+                flush_handler=self._flush_buffered_records), 2)
+        self.assertEqual(self._buffered_records, [])
+        self.assertEqual(self._consume_remaining_values(), [])
+
+    def test_revoked_partitions_are_flushed_and_committed_before_being_handed_over(self):
+        MemoryBroker.named(self._broker_name).create_topic("JOBS", 2)
+        self._produce([b'"a"', b'"b"', b'"c"', b'"d"'])
+        source = KafkaSource(
+            self._configuration(partitions=2), message_handler=self._buffer_message,
+            flush_handler=self._flush_buffered_records)
+        source.start()
+        consumer = KafkaTransport.consumer({
+            "auto.offset.reset": "earliest", "bootstrap.servers": self._bootstrap_servers[0], "group.id": "workers"})
+        try:
+            deadline = time.monotonic() + _TIMEOUT_IN_SECONDS
+            while len(self._handled_values) < 4 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            consumer.subscribe(["JOBS"])
+            messages = []
+            while not consumer.assignment() and time.monotonic() < deadline:
+                messages.extend(consumer.consume(100, 0.01))
+            messages.extend(consumer.consume(100, 0.5))
+            assignment = consumer.assignment()
+        finally:
+            consumer.close()
+            source.stop()
+        self.assertEqual(sorted(self._handled_values), ["a", "b", "c", "d"])
+        self.assertEqual(len(assignment), 1)
+        # the new owner of the revoked partition resumes after the records flushed by the previous one
+        self.assertEqual(messages, [])
+
+
+class OffsetTrackerTest(unittest.TestCase):
+    """Tests that the committed offsets only advance over the contiguous acknowledged offsets"""
+
+    def test_committable_offset_advances_over_contiguous_acknowledged_offsets(self):
+        offset_tracker = _OffsetTracker()
+        for offset in range(4):
+            offset_tracker.track("JOBS", 0, offset)
+        offset_tracker.track("JOBS", 1, 7)
+        offset_tracker.acknowledge("JOBS", 0, 1)
+        offset_tracker.acknowledge("JOBS", 0, 3)
+        self.assertEqual(offset_tracker.pop_committable_offsets(), [])
+        offset_tracker.acknowledge("JOBS", 0, 0)
+        offset_tracker.acknowledge("JOBS", 1, 7)
+        self.assertEqual(
+            sorted((topic_partition.partition, topic_partition.offset)
+                   for topic_partition in offset_tracker.pop_committable_offsets()), [(0, 2), (1, 8)])
+        # a repeated acknowledgement does not move the offset, nor do those of the forgotten partitions
+        offset_tracker.acknowledge("JOBS", 0, 1)
+        self.assertEqual(offset_tracker.pop_committable_offsets(), [])
+        offset_tracker.acknowledge("JOBS", 0, 2)
+        self.assertEqual(
+            [(topic_partition.partition, topic_partition.offset)
+             for topic_partition in offset_tracker.pop_committable_offsets()], [(0, 4)])
+        offset_tracker.track("JOBS", 0, 4)
+        offset_tracker.forget([TopicPartition("JOBS", 0)])
+        offset_tracker.acknowledge("JOBS", 0, 4)
+        self.assertEqual(offset_tracker.pop_committable_offsets(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
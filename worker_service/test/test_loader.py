@@ -0,0 +1,113 @@
+"""Tests the loader service manager against the in-memory broker"""
+
+import glob
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import uuid
+from unittest import mock
+
+from common.claim_check import ClaimCheckStore
+from common.columnar import ColumnarBatch
+from common.json_loader import JsonLoader, RecursiveNamespace
+from common.kafka import KafkaTransport
+from common.memory_broker import MemoryBroker
+from common.models import KafkaConfiguration
+from common.wire_format import WireFormat
+from loader import manager
+
+_TIMEOUT_IN_SECONDS = 10.0
+
+
+class LoaderTest(unittest.TestCase):
+    """Tests that the claim check blobs are removed once their records are over, whichever way they are"""
+
+    def setUp(self):
+        self._broker_name = f"test-loader-{uuid.uuid4().hex}"
+        self._bootstrap_servers = [f"memory://{self._broker_name}"]
+        self._directory = tempfile.mkdtemp()
+        self._claim_check_directory = os.path.join(self._directory, "claim-checks")
+        self._claim_check_store = ClaimCheckStore(self._claim_check_directory)
+
+    def tearDown(self):
+        MemoryBroker.remove(self._broker_name)
+        shutil.rmtree(self._directory)
+
+    def _configuration(self, **entry):
+        return RecursiveNamespace.map_entry({
+            "claimCheckConfiguration": {"directory": self._claim_check_directory},
+            "destinationConfiguration": {"batchMaximumLatencyInSeconds": 0.1},
+            "kafkaSourceConfiguration": KafkaConfiguration.from_dict({
+                "bootstrapServers": self._bootstrap_servers, "group": "loaders", "partitions": 1, "topic": "PAGES",
+                **entry})
+        })
+
+    def _destination(self):
+        return {
+            "file": {"directory": self._directory}, "fullyQualifiedTableName": "DB.SCHEMA.PRODUCTS",
+            "schemaMapping": [{"input": "CODE", "output": "code"}], "type": "file"}
+
+    def _produce_claim_check(self, destination):
+        """Produces a page held by a claim check blob, as the extractor does for the oversized pages"""
+        payload, headers = WireFormat.encode("job-1", destination, ColumnarBatch(("CODE",), [["a", "b"]]))
+        reference = self._claim_check_store.put(payload)
+        headers.append((ClaimCheckStore.HEADER, ClaimCheckStore.VERSION))
+        producer = KafkaTransport.producer({"bootstrap.servers": self._bootstrap_servers[0]})
+        producer.produce("PAGES", JsonLoader.dumps(reference), key=b"job-1", headers=headers)
+        producer.flush()
+
+    def _blobs(self):
+        return os.listdir(self._claim_check_directory)
+
+    def _run_until(self, configuration, condition):
+        with mock.patch.object(manager, "time"):
+            service_manager = manager.LoaderServiceManager(configuration)
+            service_manager.prepare()
+        service_manager.start()
+        try:
+            deadline = time.monotonic() + _TIMEOUT_IN_SECONDS
+            while not condition() and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            service_manager.stop()
+
+    def _loaded_rows(self):
+        rows = []
+        for path in glob.glob(os.path.join(self._directory, "DB.SCHEMA.PRODUCTS", "*.jsonl")):
+            with open(path, "rb") as file:
+                rows.extend(JsonLoader.loads_raw(line) for line in file)
+        return rows
+
+    def test_blob_is_removed_once_its_rows_are_loaded(self):
+        self._produce_claim_check(self._destination())
+        self._run_until(self._configuration(), lambda: not self._blobs())
+        self.assertEqual(self._loaded_rows(), [{"code": "a"}, {"code": "b"}])
+        self.assertEqual(self._blobs(), [])
+
+    def test_blob_is_removed_once_its_failed_record_is_skipped(self):
+        # without a destination nor a manifest topic, the record fails
+        self._produce_claim_check(None)
+        self._run_until(self._configuration(), lambda: not self._blobs())
+        self.assertEqual(self._blobs(), [])
+
+    def test_blob_is_removed_once_its_failed_record_is_dead_lettered(self):
+        self._produce_claim_check(None)
+        broker = MemoryBroker.named(self._broker_name)
+        self._run_until(self._configuration(deadLetterTopic="PAGES-DLQ"), lambda: broker.messages("PAGES-DLQ"))
+        self.assertEqual(len(broker.messages("PAGES-DLQ")), 1)
+        self.assertEqual(self._blobs(), [])
+
+    def test_blob_is_kept_while_its_failed_record_is_retried(self):
+        self._produce_claim_check(None)
+        broker = MemoryBroker.named(self._broker_name)
+        self._run_until(
+            self._configuration(deadLetterTopic="PAGES-DLQ", retryDelaysInSeconds=[60]),
+            lambda: broker.messages("PAGES-RETRY-1"))
+        self.assertEqual(len(broker.messages("PAGES-RETRY-1")), 1)
+        self.assertEqual(len(self._blobs()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
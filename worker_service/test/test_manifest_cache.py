@@ -0,0 +1,70 @@
+"""Tests the cache of the job manifests against the in-memory broker"""
+
+import unittest
+import uuid
+
+from common.json_loader import JsonLoader
+from common.kafka import KafkaSink
+from common.memory_broker import MemoryBroker
+from common.models import KafkaConfiguration
+from loader.manifest_cache import ManifestCache
+
+
+class ManifestCacheTest(unittest.TestCase):
+    """Tests the consumption of the manifests of all of the partitions, tombstones included"""
+
+    def setUp(self):
+        self._broker_name = f"test-manifest-cache-{uuid.uuid4().hex}"
+        self._configuration = KafkaConfiguration.from_dict({
+            "bootstrapServers": [f"memory://{self._broker_name}"], "group": "loaders", "partitions": 2,
+            "topic": "MANIFESTS"})
+
+    def tearDown(self):
+        MemoryBroker.remove(self._broker_name)
+
+    @staticmethod
+    def _manifest(job_id):
+        return JsonLoader.dumps({
+            "destination": {
+                "file": {"directory": "/tmp"}, "fullyQualifiedTableName": "DB.SCHEMA.PRODUCTS",
+                "schemaMapping": [{"input": "id", "output": "ID"}], "type": "file"},
+            "jobId": job_id})
+
+    def _produce(self, job_id_2_value):
+        sink = KafkaSink(self._configuration)
+        for job_id, value in job_id_2_value.items():
+            sink.send_message([value], key=job_id)
+        sink.flush()
+
+    def test_manifests_of_all_partitions_are_cached_without_joining_a_group(self):
+        job_ids = [f"job-{index}" for index in range(8)]
+        cache = ManifestCache(self._configuration, timeout_in_seconds=5.0)
+        self._produce({job_id: ManifestCacheTest._manifest(job_id) for job_id in job_ids})
+        cache.start()
+        try:
+            for job_id in job_ids:
+                self.assertEqual(cache.get(job_id).destination.fullyQualifiedTableName, "DB.SCHEMA.PRODUCTS")
+        finally:
+            cache.stop()
+        messages = MemoryBroker.named(self._broker_name).messages("MANIFESTS")
+        self.assertEqual({message.partition() for message in messages}, {0, 1})
+        self.assertFalse(MemoryBroker.named(self._broker_name)._group("loaders-manifests").members)
+
+    def test_tombstoned_manifest_is_kept(self):
+        self._produce({"job-1": ManifestCacheTest._manifest("job-1")})
+        self._produce({"job-1": None})
+        cache = ManifestCache(self._configuration, timeout_in_seconds=5.0)
+        cache.start()
+        try:
+            self.assertEqual(cache.get("job-1").jobId, "job-1")
+        finally:
+            cache.stop()
+
+    def test_missing_manifest_times_out(self):
+        cache = ManifestCache(self._configuration, timeout_in_seconds=0.1)
+        cache.start()
+        try:
+            with self.assertRaisesRegex(RuntimeError, "the manifest of the job-1 job was not received"):
+                cache.get("job-1")
+        finally:
+            cache.stop()
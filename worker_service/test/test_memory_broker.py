@@ -0,0 +1,141 @@
+"""Tests the in-memory broker through the clients KafkaTransport creates for it"""
+
+import time
+import unittest
+import uuid
+
+from confluent_kafka import KafkaException, TopicPartition
+
+from common.kafka import KafkaTransport
+from common.memory_broker import FaultInjection, MemoryBroker
+
+_TIMEOUT_IN_SECONDS = 5.0
+
+
+class MemoryBrokerTest(unittest.TestCase):
+    """Tests the production, the consumption, the commits and the rebalances of the consumer groups"""
+
+    def setUp(self):
+        self._broker_name = f"test-memory-broker-{uuid.uuid4().hex}"
+        self._bootstrap_server = f"memory://{self._broker_name}"
+        self._broker = MemoryBroker.named(self._broker_name)
+        self._events = []
+
+    def tearDown(self):
+        MemoryBroker.remove(self._broker_name)
+
+    def _consumer(self, name, **configuration):
+        consumer = KafkaTransport.consumer({
+            "auto.offset.reset": "earliest", "bootstrap.servers": self._bootstrap_server, "group.id": "workers",
+            **configuration})
+        consumer.subscribe(
+            ["JOBS"],
+            on_assign=lambda _, partitions: self._events.append((name, "assign", MemoryBrokerTest._keys(partitions))),
+            on_revoke=lambda _, partitions: self._events.append((name, "revoke", MemoryBrokerTest._keys(partitions))))
+        return consumer
+
+    @staticmethod
+    def _consume_until_assigned(consumer, *other_consumers):
+        """Consumes until the consumer is assigned partitions, the other consumers serving their revocations"""
+        deadline = time.monotonic() + _TIMEOUT_IN_SECONDS
+        while not consumer.assignment():
+            if time.monotonic() >= deadline:
+                raise AssertionError(f"no partition was assigned within {_TIMEOUT_IN_SECONDS} seconds")
+            for other_consumer in other_consumers:
+                other_consumer.consume(10, 0.01)
+            consumer.consume(10, 0.01)
+
+    @staticmethod
+    def _keys(partitions):
+        return {(partition.topic, partition.partition) for partition in partitions}
+
+    def _produce(self, values, key=None):
+        producer = KafkaTransport.producer({"bootstrap.servers": self._bootstrap_server})
+        outcomes = []
+        for value in values:
+            producer.produce(
+                "JOBS", value, key=key, headers={"wire-format": "json"},
+                on_delivery=lambda error, message: outcomes.append((error, message)))
+        self.assertEqual(producer.flush(_TIMEOUT_IN_SECONDS), 0)
+        return outcomes
+
+    def test_produced_messages_are_consumed_and_committed(self):
+        self._broker.create_topic("JOBS", 2)
+        outcomes = self._produce(["a", "b", "c"], key="job-1")
+        self.assertEqual([error for error, _ in outcomes], [None, None, None])
+        # the messages of a key go to a single partition, in order
+        self.assertEqual(len({message.partition() for _, message in outcomes}), 1)
+        consumer = self._consumer("first")
+        messages = consumer.consume(10, _TIMEOUT_IN_SECONDS)
+        self.assertEqual([message.value() for message in messages], [b"a", b"b", b"c"])
+        self.assertEqual([message.offset() for message in messages], [0, 1, 2])
+        self.assertEqual(messages[0].key(), b"job-1")
+        self.assertEqual(messages[0].headers(), [("wire-format", b"json")])
+        consumer.commit(message=messages[1], asynchronous=False)
+        consumer.close()
+        # the next member of the group resumes after the committed offset
+        consumer = self._consumer("second")
+        self.assertEqual([message.value() for message in consumer.consume(10, 0.5)], [b"c"])
+        consumer.close()
+
+    def test_partitions_are_moved_cooperatively_on_rebalance(self):
+        self._broker.create_topic("JOBS", 2)
+        first_consumer = self._consumer("first")
+        MemoryBrokerTest._consume_until_assigned(first_consumer)
+        second_consumer = self._consumer("second")
+        MemoryBrokerTest._consume_until_assigned(second_consumer, first_consumer)
+        # the moved partition is revoked from its owner before being assigned, the other one staying in place
+        self.assertEqual(self._events, [
+            ("first", "assign", {("JOBS", 0), ("JOBS", 1)}), ("first", "revoke", {("JOBS", 1)}),
+            ("second", "assign", {("JOBS", 1)})])
+        self.assertEqual(MemoryBrokerTest._keys(first_consumer.assignment()), {("JOBS", 0)})
+        second_consumer.close()
+        first_consumer.consume(10, 0.01)
+        self.assertEqual(MemoryBrokerTest._keys(first_consumer.assignment()), {("JOBS", 0), ("JOBS", 1)})
+        first_consumer.close()
+
+    def test_static_member_rejoins_without_rebalance(self):
+        self._broker.create_topic("JOBS", 2)
+        first_consumer = self._consumer("first", **{"group.instance.id": "worker-1"})
+        MemoryBrokerTest._consume_until_assigned(first_consumer)
+        second_consumer = self._consumer("second", **{"group.instance.id": "worker-2"})
+        MemoryBrokerTest._consume_until_assigned(second_consumer, first_consumer)
+        second_consumer.close()
+        del self._events[:]
+        # the restarted member takes over its previous assignment, the other member being left untouched
+        second_consumer = self._consumer("restarted", **{"group.instance.id": "worker-2"})
+        MemoryBrokerTest._consume_until_assigned(second_consumer, first_consumer)
+        self.assertEqual(self._events, [("restarted", "assign", {("JOBS", 1)})])
+        first_consumer.close()
+        second_consumer.close()
+
+    def test_assigned_partitions_are_consumed_outside_of_the_group(self):
+        self._broker.create_topic("JOBS", 2)
+        # the messages without a key are spread over the partitions in turn
+        self._produce(["a", "b", "c"])
+        consumer = KafkaTransport.consumer({"bootstrap.servers": self._bootstrap_server, "group.id": "readers"})
+        consumer.assign([TopicPartition("JOBS", 0, 1), TopicPartition("JOBS", 1, 0)])
+        self.assertEqual(sorted(message.value() for message in consumer.consume(10, 0.5)), [b"b", b"c"])
+        self.assertFalse(self._broker._group("readers").members)  # pylint: disable=protected-access
+        consumer.close()
+
+    def test_injected_faults_fail_the_deliveries_and_the_commits(self):
+        self._broker.fault_injection = FaultInjection(error_rate=1.0)
+        outcomes = self._produce(["a"])
+        self.assertIsNotNone(outcomes[0][0])
+        self.assertEqual(self._broker.messages("JOBS"), [])
+        consumer = self._consumer("first")
+        with self.assertRaises(KafkaException):
+            consumer.commit(offsets=[TopicPartition("JOBS", 0, 1)], asynchronous=False)
+        consumer.close()
+
+    def test_fault_injection_is_configured_by_the_bootstrap_server(self):
+        KafkaTransport.producer({"bootstrap.servers": f"{self._bootstrap_server}?latencyInSeconds=0.01&errorRate=0.5"})
+        self.assertEqual(self._broker.fault_injection.latency_in_seconds, 0.01)
+        self.assertEqual(self._broker.fault_injection.error_rate, 0.5)
+        with self.assertRaises(ValueError):
+            FaultInjection(error_rate=2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""Tests the pipeline, from the extraction of a job to the loading of its pages, against the in-memory broker"""
+
+import glob
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import uuid
+from unittest import mock
+
+from common.json_loader import JsonLoader, RecursiveNamespace
+from common.kafka import KafkaSink, KafkaTransport
+from common.memory_broker import MemoryBroker
+from common.models import KafkaConfiguration
+from extractor.services.shopify import ShopifySource
+from pipeline import manager
+
+_TIMEOUT_IN_SECONDS = 10.0
+
+_PRODUCT = {
+    "handle": "tee", "id": 1, "images": [{"src": "https://shop.example/tee.png", "variant_ids": []}],
+    "product_type": "shirts", "title": "Tee",
+    "variants": [
+        {"available": True, "grams": 200, "id": 11, "option1": "S", "option2": None, "option3": None,
+         "price": "9.90", "requires_shipping": True, "sku": "TEE-S"},
+        {"available": False, "grams": 220, "id": 12, "option1": "M", "option2": None, "option3": None,
+         "price": "10.90", "requires_shipping": True, "sku": "TEE-M"}]
+}
+
+
+def _extract_products(_, url, page=None, **__):  # pylint: disable=unused-argument
+    """Returns a single page of products, as the Shopify would"""
+    return [_PRODUCT] if page == 1 else []
+
+
+def _extract_product_pages(_, url, page=None, **__):  # pylint: disable=unused-argument
+    """Returns three pages of a single product each"""
+    return [_PRODUCT] if page <= 3 else []
+
+
+class PipelineTest(unittest.TestCase):
+    """Tests that the pages of a job are extracted, loaded, and the job committed"""
+
+    def setUp(self):
+        self._broker_name = f"test-pipeline-{uuid.uuid4().hex}"
+        self._bootstrap_servers = [f"memory://{self._broker_name}"]
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        MemoryBroker.remove(self._broker_name)
+        shutil.rmtree(self._directory)
+
+    def _job(self):
+        return {
+            "destination": {
+                "file": {"directory": self._directory}, "fullyQualifiedTableName": "DB.SCHEMA.PRODUCTS",
+                "schemaMapping": [{"input": "CODE", "output": "code"}, {"input": "PRICE", "output": "price"}],
+                "type": "file"},
+            "jobId": "job-1",
+            "source": {
+                "schemaMapping": [
+                    {"input": column_name, "output": column_name.upper()}
+                    for column_name in ShopifySource._COLUMN_NAMES],  # pylint: disable=protected-access
+                "shopify": {"urls": ["https://shop.example"]}, "type": "shopify"}
+        }
+
+    def _configuration(self):
+        return RecursiveNamespace.map_entry({
+            "destinationConfiguration": {"batchMaximumLatencyInSeconds": 0.1},
+            "kafkaSourceConfiguration": KafkaConfiguration.from_dict({
+                "bootstrapServers": self._bootstrap_servers, "group": "pipelines", "partitions": 1,
+                "topic": "JOBS"})
+        })
+
+    def _loaded_rows(self):
+        rows = []
+        for path in glob.glob(os.path.join(self._directory, "DB.SCHEMA.PRODUCTS", "*.jsonl")):
+            with open(path, "rb") as file:
+                rows.extend(JsonLoader.loads_raw(line) for line in file)
+        return rows
+
+    def _remaining_jobs(self):
+        consumer = KafkaTransport.consumer({
+            "auto.offset.reset": "earliest", "bootstrap.servers": self._bootstrap_servers[0], "group.id": "pipelines"})
+        consumer.subscribe(["JOBS"])
+        messages = consumer.consume(100, 0.5)
+        consumer.close()
+        return messages
+
+    def _run_job(self, row_count):
+        service_manager = manager.PipelineServiceManager(self._configuration())
+        service_manager.prepare()
+        service_manager.start()
+        try:
+            sink = KafkaSink(self._configuration().kafkaSourceConfiguration)
+            sink.send_message([JsonLoader.dumps(self._job())])
+            sink.flush()
+            deadline = time.monotonic() + _TIMEOUT_IN_SECONDS
+            while len(self._loaded_rows()) < row_count and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            service_manager.stop()
+
+    @mock.patch.object(ShopifySource, "_extract_products", _extract_products)
+    @mock.patch.object(manager, "time")
+    def test_page_is_extracted_and_loaded(self, _):
+        self._run_job(2)
+        self.assertEqual(
+            self._loaded_rows(), [{"code": "TEE-S", "price": "9.90"}, {"code": "TEE-M", "price": "10.90"}])
+        # the job was acknowledged once its page was loaded, and its offset committed
+        self.assertEqual(self._remaining_jobs(), [])
+
+    @mock.patch.object(ShopifySource, "_extract_products", _extract_product_pages)
+    @mock.patch.object(manager, "time")
+    def test_pages_share_the_destination_of_the_job(self, _):
+        with mock.patch.object(
+                manager, "_PageRecord", wraps=manager._PageRecord) as page_record:  # pylint: disable=protected-access
+            self._run_job(6)
+        self.assertEqual(len(self._loaded_rows()), 6)
+        destinations = [call.args[1].destination for call in page_record.call_args_list]
+        self.assertEqual(len(destinations), 3)
+        # the destination is parsed once for the job, rather than once per page
+        self.assertTrue(all(destination is destinations[0] for destination in destinations))
+
+
+if __name__ == "__main__":
+    unittest.main()
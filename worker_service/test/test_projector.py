@@ -0,0 +1,68 @@
+"""Tests the projection of the extracted rows onto the destination columns"""
+
+import unittest
+
+from common.columnar import ColumnarBatch
+from common.json_loader import JsonLoader
+from loader.projector import SchemaProjector
+
+
+class SchemaProjectorTest(unittest.TestCase):
+    """Tests the renaming, reordering and dropping of the columns, and the caching of the compiled projectors"""
+
+    DESCRIPTORS = ("id", "title", "price")
+
+    def test_columns_are_renamed_and_reordered(self):
+        projector = SchemaProjector(self.DESCRIPTORS, (("price", "PRICE"), ("id", "Product_Id")))
+        self.assertEqual(projector.columns, ("price", "product_id"))
+        self.assertEqual(projector.project([(1, "hat", 9.5), (2, "scarf", 12.0)]), [(9.5, 1), (12.0, 2)])
+
+    def test_single_column_is_projected_as_a_tuple(self):
+        projector = SchemaProjector(self.DESCRIPTORS, (("title", "title"),))
+        self.assertEqual(projector.project([[1, "hat", 9.5]]), [("hat",)])
+
+    def test_identity_mapping_converts_the_rows_to_tuples(self):
+        projector = SchemaProjector(self.DESCRIPTORS, tuple((name, name) for name in self.DESCRIPTORS))
+        self.assertEqual(projector.project([[1, "hat", 9.5]]), [(1, "hat", 9.5)])
+
+    def test_mapped_fields_missing_from_the_input_are_dropped(self):
+        projector = SchemaProjector(self.DESCRIPTORS, (("id", "id"), ("vendor", "vendor"), ("title", "title")))
+        self.assertEqual(projector.columns, ("id", "title"))
+        self.assertEqual(projector.project([(1, "hat", 9.5)]), [(1, "hat")])
+
+    def test_no_mapped_field_projects_empty_rows(self):
+        projector = SchemaProjector(self.DESCRIPTORS, (("vendor", "vendor"),))
+        self.assertEqual(projector.columns, ())
+        self.assertEqual(projector.project([(1, "hat", 9.5)]), [()])
+
+    def test_input_fields_not_mapped_are_dropped(self):
+        projector = SchemaProjector(self.DESCRIPTORS, (("id", "id"),))
+        self.assertEqual(projector.project_columns([[1, 2], ["hat", "scarf"], [9.5, 12.0]]), [(1,), (2,)])
+
+    def test_projector_is_compiled_once_per_descriptors_and_mapping(self):
+        input_2_output = (("id", "id"), ("price", "price"))
+        projector = SchemaProjector.compile(("id", "sku", "price"), input_2_output)
+        self.assertIs(SchemaProjector.compile(("id", "sku", "price"), input_2_output), projector)
+        self.assertIsNot(SchemaProjector.compile(("id", "price"), input_2_output), projector)
+
+    def test_columnar_batch_is_projected(self):
+        # the batch keeps its descriptors as a tuple, whatever it is given, so that they key the cache
+        batch = ColumnarBatch(["id", "title", "price"], [[1, 2], ["hat", "scarf"], [9.5, 12.0]])
+        input_2_output = (("title", "name"), ("id", "id"))
+        self.assertEqual(
+            SchemaProjector.project_data(batch, input_2_output), (("name", "id"), [("hat", 1), ("scarf", 2)]))
+        self.assertIs(
+            SchemaProjector.compile(batch.descriptors(), input_2_output),
+            SchemaProjector.compile(("id", "title", "price"), input_2_output))
+
+    def test_json_data_is_projected(self):
+        json_string = JsonLoader.dumps({"descriptors": ["id", "title"], "values": [[1, "hat"], [2, "scarf"]]})
+        input_2_output = (("title", "name"),)
+        for data in (JsonLoader.loads(json_string), JsonLoader.loads_lazy(json_string)):
+            with self.subTest(data=type(data).__name__):
+                self.assertEqual(
+                    SchemaProjector.project_data(data, input_2_output), (("name",), [("hat",), ("scarf",)]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""Tests the replay of the dead-lettered messages against the in-memory broker"""
+
+import unittest
+import uuid
+
+from cli.replay import replay
+from common.kafka import FailureRouter, KafkaTransport
+from common.memory_broker import MemoryBroker
+
+
+class ReplayTest(unittest.TestCase):
+    """Tests that the dead-lettered messages go back to their original topic, without their failure metadata"""
+
+    def setUp(self):
+        self._broker_name = f"test-replay-{uuid.uuid4().hex}"
+        self._bootstrap_server = f"memory://{self._broker_name}"
+
+    def tearDown(self):
+        MemoryBroker.remove(self._broker_name)
+
+    def _dead_letter(self, values, original_topic="JOBS"):
+        producer = KafkaTransport.producer({"bootstrap.servers": self._bootstrap_server})
+        for value in values:
+            headers = [("wire-format", b"json"), (FailureRouter.ERROR_HEADER, b"ValueError: bad record")]
+            if original_topic is not None:
+                headers.append((FailureRouter.ORIGINAL_TOPIC_HEADER, original_topic.encode("utf-8")))
+            producer.produce("JOBS-DLQ", value, key=b"job-1", headers=headers)
+        producer.flush()
+
+    def _replay(self, **arguments):
+        return replay(self._bootstrap_server, "JOBS-DLQ", "replay", idle_timeout_in_seconds=0.5, **arguments)
+
+    def _messages(self, topic):
+        return MemoryBroker.named(self._broker_name).messages(topic)
+
+    def test_messages_are_replayed_into_their_original_topic(self):
+        self._dead_letter([b'"a"', b'"b"'])
+        self.assertEqual(self._replay(), 2)
+        messages = self._messages("JOBS")
+        self.assertEqual([message.value() for message in messages], [b'"a"', b'"b"'])
+        self.assertEqual([message.key() for message in messages], [b"job-1", b"job-1"])
+        self.assertEqual(messages[0].headers(), [("wire-format", b"json")])
+        # the committed offsets resume the replay after the replayed messages
+        self._dead_letter([b'"c"'])
+        self.assertEqual(self._replay(), 1)
+        self.assertEqual([message.value() for message in self._messages("JOBS")], [b'"a"', b'"b"', b'"c"'])
+
+    def test_messages_are_replayed_into_the_given_topic(self):
+        self._dead_letter([b'"a"'], original_topic=None)
+        self.assertEqual(self._replay(topic="JOBS-FIXED"), 1)
+        self.assertEqual([message.value() for message in self._messages("JOBS-FIXED")], [b'"a"'])
+
+    def test_message_without_original_topic_stops_the_replay(self):
+        self._dead_letter([b'"a"'], original_topic=None)
+        with self.assertRaisesRegex(ValueError, "of the 'JOBS-DLQ' topic has no original topic"):
+            self._replay()
+        # nothing is committed, so the message is replayed once its original topic is given
+        self.assertEqual(self._replay(topic="JOBS"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
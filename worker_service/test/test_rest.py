@@ -0,0 +1,44 @@
+"""Tests the REST client against a stubbed HTTP session"""
+
+import unittest
+from unittest import mock
+
+from common.json_loader import JsonLoader, RecursiveNamespace
+from common.rest import RestClient, RestSessionPool
+
+
+class _Response:
+    """Stands in for a successful response"""
+
+    ok = True
+
+    def __init__(self, value):
+        self.content = JsonLoader.dumps(value)
+
+
+class RestClientTest(unittest.TestCase):
+    """Tests the decoding of the responses"""
+
+    _VALUE = {"products": [{"id": 1, "variants": [{"sku": "TEE-S"}]}], "total": 1}
+
+    def setUp(self):
+        session = mock.Mock()
+        session.request.return_value = _Response(self._VALUE)
+        patcher = mock.patch.object(RestSessionPool, "session", return_value=session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_raw_response_is_decoded_into_plain_values(self):
+        self.assertEqual(RestClient().send_get_request("https://shop.example/products.json", raw=True), self._VALUE)
+
+    def test_response_is_decoded_into_namespaces_in_a_single_pass(self):
+        # the decoder maps the objects as it goes, so none of them is converted a second time
+        with mock.patch.object(RecursiveNamespace, "__init__", side_effect=AssertionError("converted twice")):
+            response = RestClient().send_get_request("https://shop.example/products.json")
+        self.assertIsInstance(response, RecursiveNamespace)
+        self.assertEqual(response.products[0].variants[0].sku, "TEE-S")
+        self.assertEqual(response.to_dict(), self._VALUE)
+
+
+if __name__ == "__main__":
+    unittest.main()
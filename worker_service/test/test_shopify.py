@@ -2,6 +2,7 @@ from common.main import Main
 from common.kafka import KafkaSink
 from extractor.services.shopify import ShopifySource
 from common.json_loader import RecursiveNamespace
+from common.models import KafkaConfiguration
 import json
 
 Main.initialize("test_shopify")
@@ -128,7 +129,8 @@ configuration = {
     "bootstrapServers": ["localhost:9092"],
     "topic": "PRICER-JOBS"
 }
-s = KafkaSink(RecursiveNamespace.map_entry(configuration))
-s.send_message([json.dumps(data)])
+s = KafkaSink(KafkaConfiguration.from_dict(configuration))
+s.send_message([json.dumps(data)], key=job_id)
+s.flush()
 #s = ShopifySource(job_id, RecursiveNamespace.map_entry(source))
 #s.extract_and_transform(lambda x: print(x))
\ No newline at end of file
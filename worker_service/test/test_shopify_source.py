@@ -0,0 +1,138 @@
+"""Tests the Shopify source against a stubbed HTTP session"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from common.json_loader import JsonLoader
+from common.models import Source
+from common.rest import RestSessionPool
+from extractor.services.shopify import ShopifySource
+
+_URL = "https://shop.example"
+
+
+def _product(product_id, images=(), variant_count=1):
+    return {
+        "handle": f"product-{product_id}", "id": product_id, "images": list(images), "product_type": "shirts",
+        "title": f"Product {product_id}",
+        "variants": [
+            {"available": True, "grams": 200, "id": product_id * 10 + index, "option1": f"size-{index}",
+             "option2": "red" if index else None, "option3": None, "price": "9.90", "requires_shipping": True,
+             "sku": f"SKU-{product_id}-{index}"}
+            for index in range(variant_count)]
+    }
+
+
+class _Response:
+    """Stands in for the successful response of the Shopify"""
+
+    ok = True
+
+    def __init__(self, products):
+        self.content = JsonLoader.dumps({"products": products})
+
+
+class _Shop:
+    """Stands in for the HTTP session of the Shopify, serving the products by page or by 'since_id' cursor"""
+
+    def __init__(self, products, page_delays_in_seconds=None):
+        self._lock = threading.Lock()
+        self._page_delays_in_seconds = page_delays_in_seconds or {}
+        self._products = sorted(products, key=lambda product: product["id"])
+        self.parameters = []
+
+    def request(self, method, url, params=None, **_):  # pylint: disable=unused-argument
+        with self._lock:
+            self.parameters.append(dict(params))
+        limit = params["limit"]
+        if "since_id" in params:
+            products = [product for product in self._products if product["id"] > params["since_id"]][:limit]
+        else:
+            page = params["page"]
+            time.sleep(self._page_delays_in_seconds.get(page, 0.0))
+            products = self._products[(page - 1) * limit:page * limit]
+        return _Response(products)
+
+
+class ShopifySourceTest(unittest.TestCase):
+    """Tests the pagination of the Shopify source and the conversion of the products into columnar batches"""
+
+    def _source(self, shop, **shopify):
+        session_patcher = mock.patch.object(RestSessionPool, "session", lambda url: shop)
+        session_patcher.start()
+        self.addCleanup(session_patcher.stop)
+        return ShopifySource("job", Source.from_dict({
+            "schemaMapping": [
+                {"input": column_name, "output": column_name.upper()}
+                for column_name in ShopifySource._COLUMN_NAMES],  # pylint: disable=protected-access
+            "shopify": {"urls": [_URL], **shopify}, "type": "shopify"}))
+
+    @staticmethod
+    def _codes(batches):
+        return [[row[2] for row in batch.rows()] for batch in batches]
+
+    def test_pages_are_extracted_until_the_empty_page(self):
+        shop = _Shop([_product(product_id) for product_id in range(1, 6)])
+        batches = list(self._source(shop, pageSize=2).iter_batches())
+        self.assertEqual(
+            self._codes(batches), [["SKU-1-0", "SKU-2-0"], ["SKU-3-0", "SKU-4-0"], ["SKU-5-0"]])
+        self.assertEqual([parameters["page"] for parameters in shop.parameters], [1, 2, 3, 4])
+
+    def test_concurrent_pages_are_emitted_in_page_order(self):
+        # the first pages are the slowest ones, so the pages complete in the reverse order
+        shop = _Shop(
+            [_product(product_id) for product_id in range(1, 7)], page_delays_in_seconds={1: 0.3, 2: 0.2, 3: 0.1})
+        batches = list(self._source(shop, concurrency=3, pageSize=1).iter_batches())
+        self.assertEqual(self._codes(batches), [[f"SKU-{product_id}-0"] for product_id in range(1, 7)])
+
+    def test_cursor_follows_the_last_product_id(self):
+        shop = _Shop([_product(product_id) for product_id in (3, 5, 8, 13, 21)])
+        batches = list(self._source(shop, pageSize=2, pagination="cursor").iter_batches())
+        self.assertEqual(self._codes(batches), [["SKU-3-0", "SKU-5-0"], ["SKU-8-0", "SKU-13-0"], ["SKU-21-0"]])
+        self.assertEqual([parameters["since_id"] for parameters in shop.parameters], [0, 5, 13])
+
+    def test_cursor_stops_at_the_until_id_of_the_range(self):
+        shop = _Shop([_product(product_id) for product_id in range(1, 8)])
+        batches = list(self._source(
+            shop, idRanges=[{"sinceId": 1, "untilId": 4}], pageSize=2, pagination="cursor").iter_batches())
+        self.assertEqual(self._codes(batches), [["SKU-2-0", "SKU-3-0"], ["SKU-4-0"]])
+        self.assertEqual([parameters["since_id"] for parameters in shop.parameters], [1, 3])
+
+    def test_id_ranges_are_scanned_concurrently(self):
+        shop = _Shop([_product(product_id) for product_id in range(1, 11)])
+        batches = list(self._source(
+            shop, concurrency=2, idRanges=[{"untilId": 3}, {"sinceId": 3, "untilId": 6}, {"sinceId": 6}], pageSize=2,
+            pagination="cursor").iter_batches())
+        codes = [code for batch_codes in self._codes(batches) for code in batch_codes]
+        self.assertEqual(sorted(codes), sorted(f"SKU-{product_id}-0" for product_id in range(1, 11)))
+        # every range is scanned from its own since ID, and none past its until ID
+        self.assertEqual(
+            sorted(parameters["since_id"] for parameters in shop.parameters), [0, 2, 3, 5, 6, 8, 10])
+
+    def test_products_are_converted_into_one_row_per_variant(self):
+        images = [
+            {"src": "https://shop.example/default.png", "variant_ids": []},
+            {"src": "https://shop.example/red.png", "variant_ids": [11]}]
+        shop = _Shop([_product(1, images=images, variant_count=2), _product(2, variant_count=1)])
+        batch = next(self._source(shop).iter_batches())
+        self.assertEqual(batch.descriptors(), tuple(
+            column_name.upper() for column_name in ShopifySource._COLUMN_NAMES))  # pylint: disable=protected-access
+        self.assertEqual(list(batch.rows()), [
+            (True, "shirts", "SKU-1-0", "", 200, "https://shop.example/default.png", "Product 1", "9.90", True,
+             f"{_URL}/products/product-1", "size-0"),
+            (True, "shirts", "SKU-1-1", "", 200, "https://shop.example/red.png", "Product 1", "9.90", True,
+             f"{_URL}/products/product-1", "size-1 / red"),
+            (True, "shirts", "SKU-2-0", "", 200, "", "Product 2", "9.90", True, f"{_URL}/products/product-2",
+             "size-0")])
+
+    def test_unmapped_columns_are_rejected(self):
+        with self.assertRaises(ValueError):
+            ShopifySource("job", Source.from_dict({
+                "schemaMapping": [{"input": "code", "output": "CODE"}], "shopify": {"urls": [_URL]},
+                "type": "shopify"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Tests the registry of the Snowflake engines and of their reflected tables"""
+
+import unittest
+from unittest import mock
+
+from common.json_loader import RecursiveNamespace
+from loader.services import snowflake
+from loader.services.snowflake import _SnowflakeRegistryImpl
+
+
+class _Clock:
+    """Stands in for the monotonic clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class SnowflakeRegistryTest(unittest.TestCase):
+    """Tests that the engines and the tables are cached, that the tables expire and that they can be invalidated"""
+
+    _TABLE_TTL_IN_SECONDS = 60.0
+
+    def setUp(self):
+        self._clock = _Clock()
+        self._create_engine = mock.Mock(side_effect=lambda *_: mock.Mock(name="engine"))
+        self._reflect_table = mock.Mock(side_effect=lambda *_: mock.Mock(name="table"))
+        for patcher in (
+                mock.patch.object(snowflake, "time", self._clock),
+                mock.patch.object(_SnowflakeRegistryImpl, "_create_engine", self._create_engine),
+                mock.patch.object(_SnowflakeRegistryImpl, "_reflect_table", self._reflect_table)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self._registry = _SnowflakeRegistryImpl(self._TABLE_TTL_IN_SECONDS)
+
+    @staticmethod
+    def _destination(password="secret"):
+        return RecursiveNamespace.map_entry({
+            "account": "account", "password": password, "role": "loader", "user": "loader", "warehouse": "loading"})
+
+    def test_engine_is_created_once_per_key(self):
+        engine_key, engine = self._registry.engine(self._destination(), "catalog")
+        self.assertEqual(self._registry.engine(self._destination(), "catalog"), (engine_key, engine))
+        other_engine_key, other_engine = self._registry.engine(self._destination(), "other_catalog")
+        self.assertNotEqual(other_engine_key, engine_key)
+        self.assertIsNot(other_engine, engine)
+        self.assertEqual(self._create_engine.call_count, 2)
+
+    def test_engine_is_replaced_when_the_password_changes(self):
+        engine_key, engine = self._registry.engine(self._destination(), "catalog")
+        new_engine_key, new_engine = self._registry.engine(self._destination(password="rotated"), "catalog")
+        self.assertEqual(new_engine_key, engine_key)
+        self.assertIsNot(new_engine, engine)
+        engine.dispose.assert_called_once_with()
+
+    def test_table_is_cached_within_its_ttl(self):
+        engine_key, engine = self._registry.engine(self._destination(), "catalog")
+        table = self._registry.table(engine_key, engine, "public", "products")
+        self._clock.now += self._TABLE_TTL_IN_SECONDS - 1.0
+        self.assertIs(self._registry.table(engine_key, engine, "public", "products"), table)
+        self._reflect_table.assert_called_once_with(engine, "public", "products")
+
+    def test_table_is_reflected_again_once_expired(self):
+        engine_key, engine = self._registry.engine(self._destination(), "catalog")
+        table = self._registry.table(engine_key, engine, "public", "products")
+        self._clock.now += self._TABLE_TTL_IN_SECONDS
+        reflected_table = self._registry.table(engine_key, engine, "public", "products")
+        self.assertIsNot(reflected_table, table)
+        self.assertEqual(self._reflect_table.call_count, 2)
+        # the expiration restarts from the reflection
+        self._clock.now += 1.0
+        self.assertIs(self._registry.table(engine_key, engine, "public", "products"), reflected_table)
+
+    def test_invalidated_table_is_reflected_again(self):
+        engine_key, engine = self._registry.engine(self._destination(), "catalog")
+        table = self._registry.table(engine_key, engine, "public", "products")
+        other_table = self._registry.table(engine_key, engine, "public", "prices")
+        self._registry.invalidate_table(engine_key, "public", "products")
+        self.assertIsNot(self._registry.table(engine_key, engine, "public", "products"), table)
+        # the other tables stay cached
+        self.assertIs(self._registry.table(engine_key, engine, "public", "prices"), other_table)
+        self.assertEqual(self._reflect_table.call_count, 3)
+
+    def test_dispose_drops_the_engines_and_the_tables(self):
+        engine_key, engine = self._registry.engine(self._destination(), "catalog")
+        table = self._registry.table(engine_key, engine, "public", "products")
+        self._registry.dispose()
+        engine.dispose.assert_called_once_with()
+        new_engine_key, new_engine = self._registry.engine(self._destination(), "catalog")
+        self.assertIsNot(new_engine, engine)
+        self.assertIsNot(self._registry.table(new_engine_key, new_engine, "public", "products"), table)
+
+
+if __name__ == "__main__":
+    unittest.main()
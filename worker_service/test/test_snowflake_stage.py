@@ -0,0 +1,94 @@
+"""Tests the stage-and-COPY bulk load path of the Snowflake destination"""
+
+import csv
+import gzip
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from loader.services.snowflake_stage import SnowflakeStageLoader
+
+
+class SnowflakeStageLoaderTest(unittest.TestCase):
+    """Tests the statements and the files of the stage loader"""
+
+    def setUp(self):
+        self._working_directory = tempfile.TemporaryDirectory()
+        self._stage_loader = SnowflakeStageLoader(2, working_directory=self._working_directory.name)
+
+    def tearDown(self):
+        self._working_directory.cleanup()
+
+    def test_stage_location(self):
+        self.assertEqual(self._stage_loader.stage_location("DB.PUBLIC.PRODUCTS"), "@DB.PUBLIC.%PRODUCTS/pricer")
+        user_stage_loader = SnowflakeStageLoader(2, stage=SnowflakeStageLoader.USER_STAGE)
+        self.assertEqual(user_stage_loader.stage_location("DB.PUBLIC.PRODUCTS"), "@~/pricer/db.public.products")
+
+    def test_put_statement(self):
+        self.assertEqual(
+            self._stage_loader.put_statement("/tmp/a.csv.gz", "@DB.PUBLIC.%PRODUCTS/pricer"),
+            "PUT 'file:///tmp/a.csv.gz' @DB.PUBLIC.%PRODUCTS/pricer AUTO_COMPRESS = FALSE SOURCE_COMPRESSION = GZIP "
+            "OVERWRITE = TRUE")
+
+    def test_copy_statement(self):
+        self.assertEqual(
+            self._stage_loader.copy_statement(
+                "DB.PUBLIC.PRODUCTS", ("code", "price"), "@DB.PUBLIC.%PRODUCTS/pricer", "a.csv.gz"),
+            "COPY INTO DB.PUBLIC.PRODUCTS (code, price) FROM @DB.PUBLIC.%PRODUCTS/pricer/a.csv.gz "
+            "FILE_FORMAT = (TYPE = CSV COMPRESSION = GZIP FIELD_OPTIONALLY_ENCLOSED_BY = '\"' "
+            "EMPTY_FIELD_AS_NULL = FALSE NULL_IF = ('\\\\N')) PURGE = TRUE ON_ERROR = ABORT_STATEMENT")
+
+    def test_is_applicable(self):
+        self.assertFalse(self._stage_loader.is_applicable([("a",)]))
+        self.assertTrue(self._stage_loader.is_applicable([("a",), ("b",)]))
+
+    def test_write_file(self):
+        file_path = os.path.join(self._working_directory.name, "rows.csv.gz")
+        rows = [("plain", None, 1.5), ('with "quotes", and a comma', "line\nbreak", True), ("", None, "")]
+        self._stage_loader.write_file(file_path, ("a", "b", "c"), rows)
+        with gzip.open(file_path, "rt", encoding="utf-8", newline="") as file:
+            content = file.read()
+        # the empty strings stay empty fields, distinct from the NULL values, as the empty fields are not loaded as NULL
+        self.assertEqual(
+            content, 'plain,\\N,1.5\r\n"with ""quotes"", and a comma","line\nbreak",True\r\n,\\N,\r\n')
+        with gzip.open(file_path, "rt", encoding="utf-8", newline="") as file:
+            self.assertEqual(
+                list(csv.reader(file)),
+                [["plain", "\\N", "1.5"], ['with "quotes", and a comma', "line\nbreak", "True"], ["", "\\N", ""]])
+
+    def test_load(self):
+        connection = mock.Mock()
+        staged_contents = []
+
+        def _exec_driver_sql(statement):
+            if statement.startswith("PUT"):
+                with gzip.open(
+                        statement.split("'")[1][len("file://"):], "rt", encoding="utf-8", newline="") as file:
+                    staged_contents.append(file.read())
+
+        connection.exec_driver_sql.side_effect = _exec_driver_sql
+        with mock.patch.object(SnowflakeStageLoader, "file_name", return_value="a.csv.gz"):
+            self._stage_loader.load(connection, "DB.PUBLIC.PRODUCTS", ("code",), [("x",), (None,)])
+        file_path = os.path.join(self._working_directory.name, "a.csv.gz")
+        self.assertEqual(
+            [call.args[0] for call in connection.exec_driver_sql.call_args_list],
+            [
+                self._stage_loader.put_statement(file_path, "@DB.PUBLIC.%PRODUCTS/pricer"),
+                self._stage_loader.copy_statement(
+                    "DB.PUBLIC.PRODUCTS", ("code",), "@DB.PUBLIC.%PRODUCTS/pricer", "a.csv.gz")])
+        self.assertEqual(staged_contents, ["x\r\n\\N\r\n"])
+        # the local file is removed once it has been copied
+        self.assertFalse(os.path.exists(file_path))
+
+    def test_load_removes_the_file_on_failure(self):
+        connection = mock.Mock()
+        connection.exec_driver_sql.side_effect = RuntimeError("the stage is not available")
+        with mock.patch.object(SnowflakeStageLoader, "file_name", return_value="a.csv.gz"):
+            with self.assertRaises(RuntimeError):
+                self._stage_loader.load(connection, "DB.PUBLIC.PRODUCTS", ("code",), [("x",)])
+        self.assertEqual(os.listdir(self._working_directory.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
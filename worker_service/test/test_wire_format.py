@@ -0,0 +1,69 @@
+"""Tests the wire formats of the extraction output messages"""
+
+import mmap
+import tempfile
+import unittest
+from unittest import mock
+
+from common import json_loader
+from common.claim_check import ClaimCheckStore
+from common.columnar import ColumnarBatch
+from common.json_loader import JsonLoader
+from common.models import ExtractionOutput
+from common.wire_format import WireFormat
+
+
+class WireFormatTest(unittest.TestCase):
+    """Tests the encoding and the decoding of the extraction output messages"""
+
+    def setUp(self):
+        self._batch = ColumnarBatch(("code", "price"), [["a", "b", "a", None], [1.5, 2, None, 3]])
+
+    def _assert_decoded(self, extraction_output):
+        self.assertEqual(extraction_output.jobId, "job")
+        data = extraction_output.data
+        if isinstance(data, ColumnarBatch):
+            self.assertEqual(data.descriptors(), ("code", "price"))
+            self.assertEqual(data.columns(), self._batch.columns())
+        else:
+            self.assertEqual(list(data.descriptors), ["code", "price"])
+            self.assertEqual(data.values.to_list(), [list(row) for row in self._batch.rows()])
+
+    def test_round_trip(self):
+        for wire_format in (WireFormat.COLUMNAR, WireFormat.JSON):
+            with self.subTest(wire_format=wire_format):
+                payload, headers = WireFormat.encode("job", None, self._batch, wire_format=wire_format)
+                self._assert_decoded(ExtractionOutput.decode(payload, headers))
+
+    def test_message_without_header_is_json(self):
+        payload = JsonLoader.dumps({"data": self._batch.to_dict(), "jobId": "job"})
+        self._assert_decoded(ExtractionOutput.decode(payload))
+
+    def test_claim_check_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            claim_check_store = ClaimCheckStore(directory)
+            for orjson in (json_loader.orjson, None):
+                for wire_format in (WireFormat.COLUMNAR, WireFormat.JSON):
+                    with self.subTest(orjson=orjson is not None, wire_format=wire_format), \
+                            mock.patch.object(json_loader, "orjson", orjson):
+                        payload, headers = WireFormat.encode("job", None, self._batch, wire_format=wire_format)
+                        reference = claim_check_store.put(payload)
+                        # the blob is memory-mapped, rather than read, while it is decoded
+                        extraction_output = ExtractionOutput.decode(
+                            JsonLoader.dumps(reference), headers + [(ClaimCheckStore.HEADER, ClaimCheckStore.VERSION)],
+                            claim_check_store=claim_check_store)
+                        self._assert_decoded(extraction_output)
+                        self.assertEqual(extraction_output.claimCheck.blob, reference["blob"])
+
+    def test_standard_library_decodes_any_buffer(self):
+        with mock.patch.object(json_loader, "orjson", None), tempfile.TemporaryFile() as file:
+            file.write(b'{"a": [1, null]}')
+            file.flush()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                self.assertEqual(JsonLoader.loads_raw(mapped_file), {"a": [1, None]})
+                self.assertEqual(JsonLoader.loads_raw(memoryview(mapped_file)), {"a": [1, None]})
+            self.assertEqual(JsonLoader.loads_raw(bytearray(b"[]")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()